@@ -0,0 +1,139 @@
+"""Accuracy and speed of frozen-region embedding against full-system runs.
+
+Supercells are built by repeating the bundled slabs in the surface plane,
+with CO on top of the highest atom closest to the cell centre. Each case runs
+`relax_atoms` and `md_run_atoms` twice, on the full structure and with
+`embed_radius`. Recorded per case:
+
+- atoms evaluated per step with embedding;
+- relax: wall time, final energy difference and largest adsorbate position
+  difference. Both final structures are evaluated as a whole. The energy
+  difference also contains the relaxation of the surface far from the
+  adsorbate, which the embedded run keeps frozen, so it grows with the cell;
+- md: wall time per step, and along the embedded trajectory the largest
+  error of the forces on the free atoms and of the shifted energy, compared
+  with a full-system evaluation of the same frames.
+
+    python -m benchmarks.bench_embedding                        # offline with EMT
+    python -m benchmarks.bench_embedding --model medium --repeats 2 3 --embed_radius 6 8
+
+EMT has a short cutoff, MACE models see twice r_max, so the same
+`embed_radius` keeps more atoms with MACE.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SLABS = sorted(glob.glob(os.path.join(ROOT, "notebooks", "*.xyz")))
+# EMT has no parameters for other elements
+EMT_ELEMENTS = {"H", "C", "N", "O", "Al", "Ni", "Cu", "Pd", "Ag", "Pt", "Au"}
+
+
+def ads_supercell(slab_path: str, repeat: int):
+    """Slab repeated `repeat` x `repeat` times in plane, with CO on the top atom closest to the cell centre."""
+    from ase import Atom
+    from ase.io import read
+
+    atoms = read(slab_path).repeat((repeat, repeat, 1))
+    n_slab = len(atoms)
+    z = atoms.positions[:, 2]
+    top = np.flatnonzero(z > z.max() - 1.)
+    centre = atoms.cell.array[:2].sum(axis=0)[:2] / 2
+    site = atoms.positions[top[np.argmin(np.linalg.norm(atoms.positions[top, :2] - centre, axis=1))]]
+    atoms.append(Atom("C", site + [0., 0., 1.9]))
+    atoms.append(Atom("O", site + [0., 0., 3.05]))
+    atoms.info["n_slab"] = n_slab
+    return atoms
+
+def run_case(slab_path: str, repeat: int, embed_radius: float, md_steps: int, sample_every: int) -> dict:
+    from src.tools import tools
+    from src.tools.calculators import get_calculator
+    from src.tools.embedding import Embedding, receptive_field
+    from src.tools.layers import fix_bottom
+
+    calculator = get_calculator(model=tools.TOOLS_MODEL, dispersion=False)
+    atoms = ads_supercell(slab_path, repeat)
+    n_slab = atoms.info["n_slab"]
+    fixed = atoms.copy()
+    fixed.constraints = fix_bottom(fixed)
+    result = {"n_atoms": len(atoms), "n_evaluated": len(Embedding(fixed, receptive_field(calculator, fixed), free_radius=embed_radius))}
+    with tempfile.TemporaryDirectory() as out:
+        runs = {}
+        for name, radius in (("full", None), ("embedded", embed_radius)):
+            start = time.perf_counter()
+            runs[name] = tools.relax_atoms(atoms, output_dir=out, use_cache=False, embed_radius=radius)
+            result[f"relax_{name}_s"] = time.perf_counter() - start
+        full, embedded = runs["full"], runs["embedded"]
+        result["relax_speedup"] = result["relax_full_s"] / result["relax_embedded_s"]
+        result["relax_energy_diff"] = float(embedded.get_potential_energy() - full.get_potential_energy())
+        result["relax_adsorbate_diff"] = float(np.abs(embedded.positions[n_slab:] - full.positions[n_slab:]).max())
+
+        for name, radius in (("full", None), ("embedded", embed_radius)):
+            start = time.perf_counter()
+            frames = tools.md_run_atoms(atoms.copy(), steps=md_steps, output_dir=out, use_cache=False, early_stop=False,
+                                        embed_radius=radius)
+            result[f"md_{name}_step_s"] = (time.perf_counter() - start) / md_steps
+        result["md_speedup"] = result["md_full_step_s"] / result["md_embedded_step_s"]
+
+    force_errors, energy_errors = [], []
+    for frame in frames[::sample_every]:
+        free = np.ones(len(frame), dtype=bool)
+        free[frame.constraints[0].index] = False
+        reference = frame.copy()
+        reference.calc = calculator
+        force_errors.append(np.linalg.norm(frame.get_forces()[free] - reference.get_forces()[free], axis=1).max())
+        energy_errors.append(abs(frame.get_potential_energy() - reference.get_potential_energy()))
+    result.update({
+        "n_free": int(free.sum()),
+        "md_max_force_error": float(max(force_errors)),
+        "md_max_energy_error": float(max(energy_errors)),
+    })
+    return result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare embedded and full-system relaxations and MD on supercells of the bundled slabs.")
+    parser.add_argument("--model", type=str, default="emt", help="'emt' (offline) or a MACE-MP model.")
+    parser.add_argument("--slabs", nargs="+", default=SLABS)
+    parser.add_argument("--repeats", nargs="+", type=int, default=[2, 3, 4], help="In-plane supercell sizes.")
+    parser.add_argument("--embed_radius", nargs="+", type=float, default=[6.])
+    parser.add_argument("--md_steps", type=int, default=50)
+    parser.add_argument("--sample_every", type=int, default=10, help="Check every n-th MD frame against the full system.")
+    parser.add_argument("--output", type=str, default=None, help="Also write the results to this .json file.")
+    return parser.parse_args()
+
+def main_cli():
+    args = parse_args()
+    os.environ["ADSKRK_MODEL"] = args.model
+    sys.path.insert(0, ROOT)
+    from ase.io import read
+
+    results = {}
+    for path in args.slabs:
+        name = os.path.splitext(os.path.basename(path))[0]
+        missing = set(read(path).get_chemical_symbols()) - EMT_ELEMENTS
+        if args.model == "emt" and missing:
+            print(f"{name:40s} skipped: EMT does not support {', '.join(sorted(missing))}")
+            continue
+        for repeat in args.repeats:
+            for radius in args.embed_radius:
+                case = f"{name}/{repeat}x{repeat}/embed_radius={radius}"
+                r = results[case] = run_case(path, repeat, radius, args.md_steps, args.sample_every)
+                print(f"{case:40s} {r['n_atoms']:5d} atoms {r['n_free']:4d} free {r['n_evaluated']:5d} evaluated | relax {r['relax_full_s']:7.2f} s -> "
+                      f"{r['relax_embedded_s']:7.2f} s ({r['relax_speedup']:.2f}x), dE {r['relax_energy_diff']:+.4f} eV, "
+                      f"adsorbate dx {r['relax_adsorbate_diff']:.3f} A | md {1e3 * r['md_full_step_s']:7.1f} -> "
+                      f"{1e3 * r['md_embedded_step_s']:7.1f} ms/step ({r['md_speedup']:.2f}x), max dF {r['md_max_force_error']:.1e} eV/A, "
+                      f"max dE {r['md_max_energy_error']:.1e} eV")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main_cli()
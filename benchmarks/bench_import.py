@@ -0,0 +1,79 @@
+"""Import time of the agent entry points.
+
+Every module is imported `--repeat` times in a fresh interpreter with
+`python -X importtime`; the fastest run counts. The exit code is 1 if a
+module takes longer than its target, or if importing it loads one of the
+heavy modules that must only be imported on first use.
+
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --modules src.agent.agent --repeat 5 --top 15
+
+Targets depend on the machine; they are set for a laptop-class CPU with warm
+file caches.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module -> import time target in seconds
+TARGETS = {
+    "src.agent.agent": 1.5,
+    "src.tools.tools": 1.2,
+    "src.agent.jobs": 3.0,
+}
+# must not be imported by importing the entry points
+DEFERRED = ["torch", "mace", "sklearn", "autoadsorbate", "langchain_openai", "rdkit"]
+
+
+def measure(module: str) -> dict:
+    """Import `module` in a fresh interpreter.
+    returns:
+        dict with 'total_s', 'top' (list of (seconds, module) of the slowest top-level imports) and
+        'deferred_loaded' (the `DEFERRED` modules that were imported anyway)
+    """
+    code = f"import sys, json; import {module}; print(json.dumps([m for m in {DEFERRED!r} if m in sys.modules]))"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative) / 1e6, name.strip(), depth))
+    total = next(t for t, name, _ in reversed(rows) if name == module)
+    depth = min(d for _, _, d in rows)
+    top = sorted(((t, name) for t, name, d in rows if d == depth + 1), reverse=True)
+    return {"total_s": total, "top": top, "deferred_loaded": json.loads(proc.stdout.strip().splitlines()[-1])}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure the import time of the agent entry points.")
+    parser.add_argument("--modules", nargs="+", default=list(TARGETS), help="Modules to import.")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per module; the fastest counts.")
+    parser.add_argument("--top", type=int, default=8, help="Slowest imports to list per module.")
+    return parser.parse_args()
+
+def main_cli():
+    args = parse_args()
+    failed = False
+    for module in args.modules:
+        result = min((measure(module) for _ in range(args.repeat)), key=lambda r: r["total_s"])
+        target = TARGETS.get(module)
+        problems = []
+        if target is not None and result["total_s"] > target:
+            problems.append(f"slower than the {target:.1f} s target")
+        if result["deferred_loaded"]:
+            problems.append("imports " + ", ".join(result["deferred_loaded"]))
+        failed = failed or bool(problems)
+        print(f"{module:24s} {result['total_s']:6.2f} s  {'; '.join(problems) or 'ok'}")
+        for seconds, name in result["top"][:args.top]:
+            print(f"    {seconds:6.2f} s  {name}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main_cli()
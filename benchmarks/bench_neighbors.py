@@ -0,0 +1,112 @@
+"""Per-step cost of MACE relaxations and MD with and without the skin neighbor list.
+
+Supercells are built by repeating the bundled slabs in the surface plane; the
+bottom half is fixed as in the tools. Each case runs the same number of BFGS
+or Langevin steps twice from the same start, once with the plain
+MACECalculator and once wrapped in `src.tools.neighbors.SkinNeighborCalculator`.
+Recorded: time per step, number of neighbor list rebuilds and the largest
+position and energy difference between the two runs after the last step.
+
+    python -m benchmarks.bench_neighbors                          # MACE-MP medium
+    python -m benchmarks.bench_neighbors --model small --repeats 1 2 4 --skin 0.5 1.0 2.0
+    python -m benchmarks.bench_neighbors --model /path/to/model.model --device cpu
+
+Needs the MACE weights (downloaded by `mace_mp` on first use). The gain
+depends on the device: on a GPU the model is fast and building the graph on
+the CPU is a large share of a step, on a CPU the model dominates.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SLABS = sorted(glob.glob(os.path.join(ROOT, "notebooks", "*.xyz")))
+
+
+def _run(atoms, calculator, kind: str, steps: int) -> tuple:
+    from ase import units
+    from ase.md.langevin import Langevin
+    from ase.optimize import BFGS
+
+    atoms.calc = calculator
+    atoms.get_forces()  # the first evaluation builds the graph in both runs and is not timed
+    if kind == "relax":
+        dyn = BFGS(atoms, logfile=None)
+        run = lambda: dyn.run(fmax=1e-6, steps=steps)
+    else:
+        dyn = Langevin(atoms, timestep=units.fs, temperature_K=300, friction=0.002, rng=np.random.default_rng(0))
+        run = lambda: dyn.run(steps)
+    start = time.perf_counter()
+    run()
+    return (time.perf_counter() - start) / max(dyn.nsteps, 1), atoms
+
+def run_case(calculator, slab_path: str, repeat: int, kind: str, steps: int, skin: float) -> dict:
+    """Time `steps` steps of one slab repeated `repeat` x `repeat` times, plain and with the skin neighbor list."""
+    from ase.io import read
+    from ase.md.velocitydistribution import MaxwellBoltzmannDistribution
+    from src.tools.layers import fix_bottom
+    from src.tools.neighbors import SkinNeighborCalculator
+
+    atoms = read(slab_path).repeat((repeat, repeat, 1))
+    atoms.constraints = fix_bottom(atoms)
+    atoms.rattle(0.05, seed=0)
+    if kind == "md":
+        MaxwellBoltzmannDistribution(atoms, temperature_K=300, rng=np.random.default_rng(0))
+
+    plain_time, plain = _run(atoms.copy(), calculator, kind, steps)
+    skin_calculator = SkinNeighborCalculator(calculator, skin=skin)
+    skin_time, wrapped = _run(atoms.copy(), skin_calculator, kind, steps)
+    return {
+        "n_atoms": len(atoms),
+        "plain_step_s": plain_time,
+        "skin_step_s": skin_time,
+        "speedup": plain_time / skin_time,
+        "rebuilds": skin_calculator.rebuilds,
+        "max_position_diff": float(np.abs(plain.positions - wrapped.positions).max()),
+        "energy_diff": float(abs(plain.get_potential_energy() - wrapped.get_potential_energy())),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the skin neighbor list on supercells of the bundled slabs.")
+    parser.add_argument("--model", type=str, default="medium", help="MACE-MP model name or model file.")
+    parser.add_argument("--device", type=str, default=None, help="Device (default: cuda when available).")
+    parser.add_argument("--default_dtype", type=str, default="float64",
+                        help="float64 makes the two runs comparable step by step.")
+    parser.add_argument("--slabs", nargs="+", default=SLABS)
+    parser.add_argument("--repeats", nargs="+", type=int, default=[1, 2, 3], help="In-plane supercell sizes.")
+    parser.add_argument("--kinds", nargs="+", choices=["relax", "md"], default=["relax", "md"])
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--skin", nargs="+", type=float, default=[1.0])
+    parser.add_argument("--output", type=str, default=None, help="Also write the results to this .json file.")
+    return parser.parse_args()
+
+def main_cli():
+    args = parse_args()
+    sys.path.insert(0, ROOT)
+    from src.tools.calculators import get_calculator
+
+    calculator = get_calculator(model=args.model, device=args.device, default_dtype=args.default_dtype)
+    results = {}
+    for path in args.slabs:
+        name = os.path.splitext(os.path.basename(path))[0]
+        for repeat in args.repeats:
+            for kind in args.kinds:
+                for skin in args.skin:
+                    case = f"{kind}/{name}/{repeat}x{repeat}/skin={skin}"
+                    result = results[case] = run_case(calculator, path, repeat, kind, args.steps, skin)
+                    print(f"{case:44s} {result['n_atoms']:6d} atoms {1e3 * result['plain_step_s']:9.1f} ms "
+                          f"-> {1e3 * result['skin_step_s']:9.1f} ms per step ({result['speedup']:.2f}x) "
+                          f"{result['rebuilds']:3d} rebuilds  max |dx| {result['max_position_diff']:.1e} A  "
+                          f"|dE| {result['energy_diff']:.1e} eV")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,172 @@
+"""Offline benchmark of the agent tools in `src/tools/tools.py`.
+
+Every case (one tool on one bundled slab) runs in a fresh spawned process
+with empty caches and the EMT calculator (ADSKRK_MODEL=emt), so it needs
+neither a GPU nor a network connection, and a case cannot profit from the
+previous one. Recorded per case: wall time of the tool call, peak RSS of the
+process, RSS growth during the call and the number of force evaluations.
+Results are compared with `benchmarks/baselines.json`; the exit code is 1 if
+a case got slower, bigger or needs more force calls than its baseline allows.
+
+    python -m benchmarks.bench_tools                 # run and compare
+    python -m benchmarks.bench_tools --update        # run and store new baselines
+    python -m benchmarks.bench_tools --cases relax_atoms md_run_atoms --repeat 3
+
+Wall times depend on the machine: regenerate the baselines with --update
+when moving the benchmark to other hardware.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SLABS = sorted(glob.glob(os.path.join(ROOT, "notebooks", "*.xyz")))
+DEFAULT_BASELINES = os.path.join(ROOT, "benchmarks", "baselines.json")
+SMILES = "Cl[C-]=O"
+
+TOOLS = ["read_atoms_object", "get_sites_from_atoms", "get_fragment", "get_ads_slab", "relax_atoms", "md_run_atoms", "md_ensemble"]
+# EMT has no parameters for these elements
+EMT_ELEMENTS = {"H", "C", "N", "O", "Al", "Ni", "Cu", "Pd", "Ag", "Pt", "Au"}
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _run_case(tool: str, slab_path: str, work_dir: str) -> dict:
+    """Body of one case, executed in its own process."""
+    os.environ.update({
+        "ADSKRK_MODEL": "emt",
+        "ADSKRK_CACHE_DIR": os.path.join(work_dir, "results"),
+        "ADSKRK_CONFORMER_DIR": os.path.join(work_dir, "conformers"),
+        "ADSKRK_SITE_INDEX_DIR": os.path.join(work_dir, "sites"),
+    })
+    sys.path.insert(0, ROOT)
+    from ase.calculators.emt import EMT
+    from src.tools import calculators, tools
+
+    counters = []
+
+    def counting_emt(*key):
+        counters.append(calculators.CountingCalculator(EMT()))
+        return counters[-1]
+    calculators.CALCULATOR_LOADERS["emt"] = counting_emt
+
+    # inputs of the measured call are prepared outside the timed region
+    slab = tools.read_atoms_object(slab_path) if slab_path else None
+    if tool in ("relax_atoms", "md_run_atoms", "md_ensemble") and not set(slab.get_chemical_symbols()) <= EMT_ELEMENTS:
+        return {"skipped": "EMT does not support " + ", ".join(sorted(set(slab.get_chemical_symbols()) - EMT_ELEMENTS))}
+    if tool in ("get_ads_slab", "relax_atoms", "md_run_atoms", "md_ensemble"):
+        site = tools.get_unique_sites_from_atoms(slab).iloc[0].to_dict()
+        ads_slab = tools.get_ads_slab(slab, tools.get_fragment(SMILES), site)
+    calls = {
+        "read_atoms_object": lambda: tools.read_atoms_object(slab_path),
+        "get_sites_from_atoms": lambda: tools.get_sites_from_atoms(slab),
+        "get_fragment": lambda: tools.get_fragment(SMILES, to_initialize=5, conformer_i=0),
+        "get_ads_slab": lambda: tools.get_ads_slab(slab, tools.get_fragment(SMILES), site),
+        "relax_atoms": lambda: tools.relax_atoms(ads_slab, output_dir=work_dir, use_cache=False),
+        "md_run_atoms": lambda: tools.md_run_atoms(ads_slab, steps=50, output_dir=work_dir, use_cache=False),
+        "md_ensemble": lambda: tools.md_ensemble(ads_slab, n_replicas=4, steps=50),
+    }
+
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    calls[tool]()
+    wall_time = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        "wall_time_s": wall_time,
+        "peak_rss_mb": peak,
+        "rss_growth_mb": max(peak - rss_before, 0.),
+        "force_calls": sum(c.n_calls for c in counters),
+    }
+
+def run_case(tool: str, slab_path: str = None, repeat: int = 1) -> dict:
+    """Run one case `repeat` times, each in a fresh process; the fastest run is kept."""
+    runs = []
+    ctx = multiprocessing.get_context("spawn")
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as work_dir, ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            runs.append(pool.submit(_run_case, tool, slab_path, work_dir).result())
+    if "skipped" in runs[0]:
+        return runs[0]
+    return min(runs, key=lambda r: r["wall_time_s"])
+
+def cases(tools: list = None) -> list:
+    """(name, tool, slab path) of every benchmark case."""
+    selected = []
+    for tool in tools or TOOLS:
+        if tool == "get_fragment":
+            selected.append((tool, tool, None))
+            continue
+        for path in SLABS:
+            selected.append((f"{tool}/{os.path.splitext(os.path.basename(path))[0]}", tool, path))
+    return selected
+
+
+def compare(result: dict, baseline: dict, time_tolerance: float = 1.5, time_slack: float = 0.05,
+            rss_tolerance: float = 1.25, rss_slack: float = 20.) -> list:
+    """Regressions of one case against its baseline; returns a list of messages (empty if none)."""
+    problems = []
+    if result["wall_time_s"] > baseline["wall_time_s"] * time_tolerance + time_slack:
+        problems.append(f"wall time {result['wall_time_s']:.3f} s > {time_tolerance} x {baseline['wall_time_s']:.3f} s")
+    if result["rss_growth_mb"] > baseline["rss_growth_mb"] * rss_tolerance + rss_slack:
+        problems.append(f"RSS growth {result['rss_growth_mb']:.1f} MB > {rss_tolerance} x {baseline['rss_growth_mb']:.1f} MB")
+    if result["force_calls"] > baseline["force_calls"]:
+        problems.append(f"force calls {result['force_calls']} > {baseline['force_calls']}")
+    return problems
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the agent tools offline with EMT.")
+    parser.add_argument("--cases", nargs="+", default=None, choices=TOOLS, help="Tools to benchmark (default: all).")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case; the fastest is kept.")
+    parser.add_argument("--baselines", type=str, default=DEFAULT_BASELINES)
+    parser.add_argument("--update", action="store_true", help="Store the results as the new baselines.")
+    parser.add_argument("--time_tolerance", type=float, default=1.5, help="Allowed slow-down factor.")
+    parser.add_argument("--output", type=str, default=None, help="Also write the results to this .json file.")
+    return parser.parse_args()
+
+def main_cli():
+    args = parse_args()
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+
+    results, regressions = {}, {}
+    for name, tool, path in cases(args.cases):
+        result = results[name] = run_case(tool, path, repeat=args.repeat)
+        if "skipped" in result:
+            print(f"{name:40s} skipped: {result['skipped']}")
+            continue
+        problems = compare(result, baselines[name], time_tolerance=args.time_tolerance) if name in baselines else []
+        if problems:
+            regressions[name] = problems
+        status = "REGRESSION: " + "; ".join(problems) if problems else ("ok" if name in baselines else "no baseline")
+        print(f"{name:40s} {result['wall_time_s']:8.3f} s {result['peak_rss_mb']:8.1f} MB peak "
+              f"{result['rss_growth_mb']:7.1f} MB growth {result['force_calls']:6d} force calls  {status}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.update:
+        baselines.update({k: v for k, v in results.items() if "skipped" not in v})
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"baselines written to {args.baselines}")
+    elif regressions:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main_cli()
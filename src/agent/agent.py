@@ -1,76 +1,167 @@
 import os
+import sys
 import builtins
+import threading
 import contextlib
 import io
 import math
+import time
+import types
 import argparse
 from typing import Any
 
-import numpy as np
-import pandas as pd
-import scipy
-import sklearn
-import ase
-import autoadsorbate
-import torch
-import mace
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langgraph_codeact import create_codeact
-
-# import weave
-# weave.init("liac/llm-hackathon")
 
 from src.agent.prompts import prompt_codeact
-from src.tools.tools import read_atoms_object, get_sites_from_atoms, get_fragment, get_ads_slab, relax_atoms, md_run_atoms
+from src.tools.tools import read_atoms_object, get_sites_from_atoms, get_site_index, get_unique_sites_from_atoms, get_fragment, get_ads_slab, relax_atoms, relax_many, md_run_atoms, md_ensemble, adsorption_energy
+from src.tools.screening import screen_adsorption
+from src.agent.kernels import KERNEL_PROMPT, get_kernel_pool
+from src.agent.context_store import ContextRef, context_store, format_context_stats, is_inline
+from src.agent.lazy import LazyModule, warm_up
+from src.tools.calculators import TOOLS_MODEL
+from src.tools.tracing import annotate, summary, tracer, write_chrome_trace
 
 load_dotenv()
 
-if not os.environ.get("OPENROUTER_API_KEY"):
-    raise ValueError("OPENROUTER_API_KEY environment variable not set.")
-
 exec_globals = builtins.__dict__.copy()
+# imported on first use inside a cell, see `src.agent.lazy`
 exec_globals.update({
-    "np": np, "pd": pd, "scipy": scipy, "sklearn": sklearn, "math": math,
-    "ase": ase, "autoadsorbate": autoadsorbate, "torch": torch, "mace": mace,
+    "np": LazyModule("numpy"), "pd": LazyModule("pandas"), "scipy": LazyModule("scipy"), "sklearn": LazyModule("sklearn"),
+    "math": math, "ase": LazyModule("ase"), "autoadsorbate": LazyModule("autoadsorbate"), "torch": LazyModule("torch"),
+    "mace": LazyModule("mace"),
 })
 
+SESSION_KEY = "__session__"
+
+class _ThreadLocalStdout(io.TextIOBase):
+    """sys.stdout replacement sending each thread's prints to its own buffer while a cell runs,
+    so agent sessions executing code in parallel threads do not capture each other's output."""
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def _target(self):
+        return getattr(self.local, "buffer", None) or self.default
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        return self._target().flush()
+
+    @contextlib.contextmanager
+    def capture(self, buffer):
+        previous = getattr(self.local, "buffer", None)
+        self.local.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self.local.buffer = previous
+
+_stdout_lock = threading.Lock()
+
+def _capture_stdout(buffer):
+    with _stdout_lock:
+        if not isinstance(sys.stdout, _ThreadLocalStdout):
+            sys.stdout = _ThreadLocalStdout(sys.stdout)
+    return sys.stdout.capture(buffer)
+
 def eval_code(code: str, context: dict[str, Any]) -> tuple[str, dict[str, Any]]:
+    """CodeAct `eval_fn` running the cell in this process. Large variables stay in `context_store`;
+    the returned context only holds refs to them, inline values and the session id. The cell span is
+    annotated with the time spent resolving/saving the context and the size of the session's stored objects."""
     import traceback
+    session = context.get(SESSION_KEY) or context_store.new_session()
+    start = time.perf_counter()
+    variables, missing = context_store.resolve({k: v for k, v in context.items() if k != SESSION_KEY})
+    overhead = time.perf_counter() - start
+    # tools and other objects handed in by value are not stored again unless the cell rebinds them
+    external = {k: v for k, v in context.items() if not isinstance(v, ContextRef) and not is_inline(v)}
     exec_scope = exec_globals.copy()
-    exec_scope.update(context)
+    exec_scope.update(variables)
     stdout_io = io.StringIO()
     try:
-        with contextlib.redirect_stdout(stdout_io):
+        with _capture_stdout(stdout_io):
             exec(code, exec_scope)
         output = stdout_io.getvalue()
         if not output:
             output = "<code ran, no output printed to stdout>"
     except Exception:
         output = f"Error during execution:\n{traceback.format_exc()}"
-    context_after_exec = {k: v for k, v in exec_scope.items() if not isinstance(v, type)}
+    if missing:
+        output = f"Note: variables {', '.join(missing)} from earlier code snippets expired and are gone.\n" + output
+    new_vars = {
+        k: v for k, v in exec_scope.items()
+        if not isinstance(v, (type, types.ModuleType)) and not k.startswith("__")
+        and not (k in exec_globals and exec_globals[k] is v) and not (k in external and external[k] is v)
+    }
+    start = time.perf_counter()
+    context_after_exec = context_store.save(session, new_vars)
+    context_after_exec[SESSION_KEY] = session
+    annotate(context_overhead_ms=1e3 * (overhead + time.perf_counter() - start),
+             context_bytes=context_store.approx_bytes(session))
     return output, context_after_exec
 
-llm = ChatOpenAI(
-    openai_api_base="https://openrouter.ai/api/v1",
-    openai_api_key=os.getenv("OPENROUTER_API_KEY"),
-    model="google/gemini-2.5-pro",
-    streaming=False, max_completion_tokens=20000, request_timeout=600, seed=420
-)
+llm = None
+
+def get_llm():
+    """OpenRouter chat model, built on first use so that importing this module needs no API key."""
+    global llm
+    if llm is None:
+        if not os.environ.get("OPENROUTER_API_KEY"):
+            raise ValueError("OPENROUTER_API_KEY environment variable not set.")
+        from langchain_openai import ChatOpenAI
+        llm = ChatOpenAI(
+            openai_api_base="https://openrouter.ai/api/v1",
+            openai_api_key=os.getenv("OPENROUTER_API_KEY"),
+            model="google/gemini-2.5-pro",
+            streaming=False, max_completion_tokens=20000, request_timeout=600, seed=420
+        )
+    return llm
 
 registered_tools = [
-    read_atoms_object, get_sites_from_atoms, get_fragment,
-    get_ads_slab, relax_atoms, md_run_atoms
+    read_atoms_object, get_sites_from_atoms, get_site_index, get_unique_sites_from_atoms, get_fragment,
+    get_ads_slab, relax_atoms, relax_many, md_run_atoms, md_ensemble, adsorption_energy,
+    screen_adsorption
 ]
 
-def get_agent_executor():
-    code_graph = create_codeact(llm, registered_tools, eval_code)
-    return code_graph.compile()
+def get_agent_executor(model=None, tools=None, backend: str = "inprocess", kernel_pool=None, llm_cache: str = None,
+                       record_dir: str = None, replay_cells: str = "reuse"):
+    """Compile the CodeAct graph; `model` defaults to the OpenRouter LLM and `tools` to `registered_tools`.
+    `backend` is "inprocess" (cells run with `exec` in this process) or "kernel" (cells run in
+    per-session worker processes with a time limit and streamed stdout, see `src.agent.kernels`);
+    the kernel backend uses `kernel_pool`, by default the process-wide pool.
+    `llm_cache` is "off", "cache", "record" or "replay" (default ADSKRK_LLM_CACHE, or "off"; see
+    `src.agent.llm_cache`); sessions are recorded to and replayed from `record_dir`. On replay the
+    recorded cell outputs are reused (`replay_cells="reuse"`) or the cells run again ("execute").
+    Graph nodes, LLM calls and code cells record tracing spans (see `src.tools.tracing`) unless ADSKRK_TRACE=0.
+    """
+    from langgraph_codeact import create_codeact, create_default_prompt
+    from src.agent.instrument import TracingCallbackHandler, traced_eval
+    from src.agent.llm_cache import cached_model, replay_eval
+
+    tools = tools or registered_tools
+    mode = llm_cache or os.environ.get("ADSKRK_LLM_CACHE", "off")
+    llm = cached_model(model if model is not None or mode == "replay" else get_llm(), mode, record_dir=record_dir)
+    if backend == "kernel":
+        eval_fn, prompt = (kernel_pool or get_kernel_pool(tools)).eval_code, create_default_prompt(tools, KERNEL_PROMPT)
+    elif backend == "inprocess":
+        eval_fn, prompt = eval_code, None
+    else:
+        raise ValueError(f"Unknown backend {backend!r}, expected 'inprocess' or 'kernel'.")
+    if mode == "replay" and replay_cells == "reuse":
+        eval_fn = replay_eval(eval_fn, llm.recordings)
+    code_graph = create_codeact(llm, tools, traced_eval(eval_fn), prompt=prompt)
+    if not tracer.enabled:
+        return code_graph.compile()
+    return code_graph.compile().with_config(callbacks=[TracingCallbackHandler()])
 
-def _prepare_prompt(smiles: str, slab_path: str, user_request: str) -> str:
+def _prepare_prompt(smiles: str, slab_path: str, user_request: str, output_dir: str = "outputs") -> str:
     prompt = prompt_codeact.replace("{{SMILES}}", smiles)
     prompt = prompt.replace("{{SLAB_XYZ}}", slab_path)
     prompt = prompt.replace("{{USER_REQUEST}}", user_request)
+    prompt = prompt.replace("{{OUTPUT_DIR}}", output_dir.rstrip("/"))
     return prompt
 
 def parse_args():
@@ -78,21 +169,45 @@ def parse_args():
     parser.add_argument("--smiles", type=str, required=True, help="SMILES string.")
     parser.add_argument("--slab_path", type=str, required=True, help="Path to the slab .xyz file.")
     parser.add_argument("--user_request", type=str, default="Find a stable adsorption configuration.", help="User's request.")
+    parser.add_argument("--backend", type=str, default="inprocess", choices=["inprocess", "kernel"], help="Where code cells run.")
+    parser.add_argument("--trace", type=str, default=None, help="Append tracing spans to this .jsonl file (a Chrome trace .json is written next to it).")
+    parser.add_argument("--llm_cache", type=str, default=None, choices=["off", "cache", "record", "replay"],
+                        help="LLM response cache mode (default: ADSKRK_LLM_CACHE or off).")
+    parser.add_argument("--record_dir", type=str, default=None, help="Where sessions are recorded to / replayed from.")
+    parser.add_argument("--replay_cells", type=str, default="reuse", choices=["reuse", "execute"],
+                        help="On replay, reuse the recorded cell outputs or run the cells again.")
     return parser.parse_args()
 
-# @weave.op()
 def main_cli():
+    from src.agent.llm_cache import replay_context, substitutions
+
     args = parse_args()
+    if args.trace:
+        tracer.path = args.trace
+    if args.backend == "inprocess":
+        # imports and model loading overlap with the first LLM call
+        warm_up(model=TOOLS_MODEL)
     prompt = _prepare_prompt(args.smiles, args.slab_path, args.user_request)
-    agent_executor = get_agent_executor()
+    agent_executor = get_agent_executor(backend=args.backend, llm_cache=args.llm_cache, record_dir=args.record_dir,
+                                        replay_cells=args.replay_cells)
     print("\n--- Running Agent with generated prompt ---\n")
     messages = [("user", prompt)]
-    for typ, chunk in agent_executor.stream({"messages": messages}, stream_mode=["values", "messages"]):
-        if typ == "messages":
-            print(chunk[0].content, end="")
-        elif typ == "values":
-            print("\n\n---answer---\n\n", chunk)
+    with tracer.trace() as trace_id, substitutions({args.slab_path: "<slab_path>"}):
+        for typ, chunk in agent_executor.stream({"messages": messages, "context": replay_context(messages)},
+                                                stream_mode=["values", "messages", "custom"]):
+            if typ == "messages":
+                print(chunk[0].content, end="")
+            elif typ == "custom" and "stdout" in chunk:
+                print(chunk["stdout"], end="")
+            elif typ == "values":
+                print("\n\n---answer---\n\n", chunk)
     print("\n\n--- Agent finished ---\n")
+    spans = tracer.get_spans(trace_id)
+    print(summary(spans).round(3).to_string(index=False))
+    if args.backend == "inprocess":
+        print(format_context_stats(context_store.stats()))
+    if args.trace:
+        write_chrome_trace(os.path.splitext(args.trace)[0] + ".chrome.json", spans)
 
 if __name__ == '__main__':
     main_cli()
\ No newline at end of file
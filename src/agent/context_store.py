@@ -0,0 +1,168 @@
+"""Process-local store for the variables of in-process CodeAct sessions.
+
+`eval_code` used to hand the whole exec scope back to LangGraph after every
+cell: every `ase.Atoms`, DataFrame and MD frame list, plus all of numpy,
+pandas, torch and the builtins, which the graph then copies into each new
+state. Now only small values (numbers, short strings) travel in the graph
+state by value. Larger objects stay in a `ContextStore` owned by this process
+and the state carries a `ContextRef` (session id, name, short description)
+in their place. The refs are resolved again when the next cell runs.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+SMALL_TYPES = (bool, int, float, complex, type(None))
+MAX_INLINE_STR = 256
+
+
+class ContextRef:
+    """Small, picklable stand-in for a variable kept in the `ContextStore`."""
+
+    __slots__ = ("session", "name", "description")
+
+    def __init__(self, session: str, name: str, description: str):
+        self.session = session
+        self.name = name
+        self.description = description
+
+    def __eq__(self, other):
+        return isinstance(other, ContextRef) and (self.session, self.name) == (other.session, other.name)
+
+    def __hash__(self):
+        return hash((self.session, self.name))
+
+    def __repr__(self):
+        return f"<ref {self.name}: {self.description}>"
+
+    def __getstate__(self):
+        return (self.session, self.name, self.description)
+
+    def __setstate__(self, state):
+        self.session, self.name, self.description = state
+
+
+def is_inline(value) -> bool:
+    """True for values cheap enough to be carried in the graph state by value."""
+    if isinstance(value, SMALL_TYPES):
+        return True
+    if isinstance(value, (str, bytes)):
+        return len(value) <= MAX_INLINE_STR
+    return False
+
+def describe(value) -> str:
+    """One-line description of a stored object, e.g. 'Atoms(Cu36CO)' or 'DataFrame(93x6)'."""
+    name = type(value).__name__
+    if hasattr(value, "get_chemical_formula"):
+        return f"{name}({value.get_chemical_formula()})"
+    if hasattr(value, "shape"):
+        return f"{name}({'x'.join(map(str, value.shape))})"
+    if isinstance(value, (list, tuple, dict, set)):
+        return f"{name}(len={len(value)})"
+    return name
+
+def nbytes(value, _depth: int = 0) -> int:
+    """Rough memory footprint of `value` in bytes (numpy/pandas/ase aware, containers one level deep)."""
+    if hasattr(value, "arrays") and isinstance(getattr(value, "arrays"), dict):
+        return sum(a.nbytes for a in value.arrays.values())
+    if hasattr(value, "memory_usage") and hasattr(value, "columns"):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, "nbytes") and isinstance(value.nbytes, int):
+        return value.nbytes
+    if isinstance(value, (list, tuple, set)) and _depth < 1:
+        return sys.getsizeof(value) + sum(nbytes(v, _depth + 1) for v in value)
+    if isinstance(value, dict) and _depth < 1:
+        return sys.getsizeof(value) + sum(nbytes(v, _depth + 1) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class ContextStore:
+    """Bounded table session -> {name: object}; the least recently used session is dropped first."""
+
+    def __init__(self, max_sessions: int = 16):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.steps = 0
+        self.overhead_s = 0.
+        self.evictions = 0
+
+    def new_session(self) -> str:
+        return uuid.uuid4().hex
+
+    def resolve(self, context: dict) -> tuple:
+        """Replace the refs in `context` by the stored objects.
+        returns:
+            scope: dict of variables for `exec`
+            missing: list of names whose objects are no longer stored
+        """
+        start = time.perf_counter()
+        scope, missing = {}, []
+        with self._lock:
+            for name, value in context.items():
+                if isinstance(value, ContextRef):
+                    objects = self._sessions.get(value.session, {})
+                    if value.name in objects:
+                        scope[name] = objects[value.name]
+                    else:
+                        missing.append(name)
+                else:
+                    scope[name] = value
+        self.overhead_s += time.perf_counter() - start
+        return scope, missing
+
+    def save(self, session: str, variables: dict) -> dict:
+        """Keep the non-inline `variables` of `session` and return the state-sized version (refs + inline values)."""
+        start = time.perf_counter()
+        state = {}
+        with self._lock:
+            objects = self._sessions.setdefault(session, {})
+            self._sessions.move_to_end(session)
+            for name, value in variables.items():
+                if is_inline(value):
+                    objects.pop(name, None)
+                    state[name] = value
+                else:
+                    objects[name] = value
+                    state[name] = ContextRef(session, name, describe(value))
+            while len(self._sessions) > max(self.max_sessions, 1):
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        self.steps += 1
+        self.overhead_s += time.perf_counter() - start
+        return state
+
+    def drop(self, session: str):
+        with self._lock:
+            self._sessions.pop(session, None)
+
+    def approx_bytes(self, session: str = None) -> int:
+        """Approximate size of the objects stored for `session`, or for every session."""
+        with self._lock:
+            sessions = [self._sessions.get(session, {})] if session is not None else list(self._sessions.values())
+            return sum(nbytes(v) for s in sessions for v in s.values())
+
+    def stats(self) -> dict:
+        """Sessions, stored objects, their approximate size and the time spent resolving/saving contexts."""
+        with self._lock:
+            n_sessions = len(self._sessions)
+            n_objects = sum(len(s) for s in self._sessions.values())
+        return {
+            "sessions": n_sessions,
+            "objects": n_objects,
+            "approx_bytes": self.approx_bytes(),
+            "steps": self.steps,
+            "overhead_s": self.overhead_s,
+            "evictions": self.evictions,
+        }
+
+def format_context_stats(stats: dict) -> str:
+    """One-line summary of `ContextStore.stats()` for command line output."""
+    return (f"context store: {stats['objects']} objects of {stats['sessions']} sessions, ~{stats['approx_bytes'] / 1e6:.1f} MB, "
+            f"{stats['overhead_s']:.3f} s resolving/saving over {stats['steps']} cells, {stats['evictions']} evictions")
+
+
+context_store = ContextStore(max_sessions=int(os.environ.get("ADSKRK_CONTEXT_SESSIONS", 16)))
@@ -0,0 +1,105 @@
+"""Tracing spans for the CodeAct graph (see `src.tools.tracing`).
+
+`TracingCallbackHandler` is a LangChain callback handler that records a span
+for the whole graph run, for every LangGraph node (`call_model`, `sandbox`)
+and for every chat model call, with its token counts. `traced_eval` wraps a
+CodeAct `eval_fn` so that every code cell is a span as well. The tools record
+their own spans, including the ones that run inside kernel processes.
+"""
+import functools
+import threading
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.tools.tracing import tracer as default_tracer
+
+
+def _token_usage(response) -> dict:
+    cache = (response.llm_output or {}).get("cache")
+    if cache in ("hit", "replay"):
+        # answered by `src.agent.llm_cache`, no tokens were spent
+        return {"cache": cache}
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if not usage:
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                usage = {"prompt_tokens": metadata.get("input_tokens"), "completion_tokens": metadata.get("output_tokens"),
+                         "total_tokens": metadata.get("total_tokens")}
+    tokens = {k: usage.get(k) for k in ("prompt_tokens", "completion_tokens", "total_tokens") if usage.get(k) is not None}
+    return {**tokens, "cache": cache} if cache else tokens
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Records graph, node and LLM spans of every run of a graph it is attached to.
+
+    The trace id is the one of the caller's `tracer.trace()` context, or derived from the run id.
+    """
+
+    run_inline = True
+
+    def __init__(self, tracer=None):
+        self.tracer = tracer or default_tracer
+        self._runs = {}  # run id -> (trace id, own span or None, id of the nearest span of the run or its ancestors)
+        self._lock = threading.Lock()
+
+    def _open(self, run_id, parent_run_id, name: str = None, category: str = None, **attrs):
+        with self._lock:
+            parent = self._runs.get(parent_run_id)
+        if parent is not None:
+            trace, nearest = parent[0], parent[2]
+        else:
+            trace, nearest = self.tracer.context()[0] or run_id.hex[:12], None
+        span = None
+        if name is not None:
+            span = self.tracer.start(name, category, trace=trace, parent=nearest, **attrs)
+        with self._lock:
+            self._runs[run_id] = (trace, span, span.span_id if span is not None else nearest)
+
+    def _close(self, run_id, error: BaseException = None, **attrs):
+        with self._lock:
+            entry = self._runs.pop(run_id, None)
+        if entry is not None and entry[1] is not None:
+            self.tracer.finish(entry[1], error=None if error is None else f"{type(error).__name__}: {error}", **attrs)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if parent_run_id is None:
+            self._open(run_id, None, kwargs.get("name") or "graph", "graph")
+        elif node and kwargs.get("name") == node and not node.startswith("__"):
+            self._open(run_id, parent_run_id, node, "node", step=(metadata or {}).get("langgraph_step"))
+        else:
+            self._open(run_id, parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id, parent_run_id=None, **kwargs):
+        self._close(run_id)
+
+    def on_chain_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._close(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        self._open(run_id, parent_run_id, "llm", "llm", model=(metadata or {}).get("ls_model_name"),
+                   n_messages=sum(len(m) for m in messages))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        self._open(run_id, parent_run_id, "llm", "llm", model=(metadata or {}).get("ls_model_name"))
+
+    def on_llm_end(self, response, *, run_id, parent_run_id=None, **kwargs):
+        self._close(run_id, **_token_usage(response))
+
+    def on_llm_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._close(run_id, error)
+
+
+def traced_eval(eval_fn, tracer=None):
+    """Wrap a CodeAct `eval_fn` so that every code cell records a "cell" span."""
+    tracer = tracer or default_tracer
+
+    @functools.wraps(eval_fn)
+    def wrapper(code: str, context: dict) -> tuple:
+        with tracer.span("cell", "cell", lines=code.count("\n") + 1) as span:
+            output, new_context = eval_fn(code, context)
+            span.annotate(failed=output.startswith("Error during execution") or "\nError during execution:\n" in output,
+                          output_chars=len(output))
+        return output, new_context
+    return wrapper
@@ -0,0 +1,262 @@
+"""Concurrent batch runner for SMILES x slab campaigns.
+
+A manifest (CSV or JSONL with columns `smiles`, `slab_path` and optionally
+`user_request`, `job_id`) lists the agent sessions to run. Sessions are
+scheduled concurrently with asyncio so their LLM round-trips overlap, while
+the heavy tools (`relax_atoms`, `relax_many`, `md_run_atoms`,
+`md_ensemble`, `adsorption_energy`, `screen_adsorption`) are sent to one shared, bounded process pool. Every
+finished job is appended to `<out_dir>/results.jsonl`; rerunning the same
+campaign skips jobs that already succeeded.
+
+    python -m src.agent.jobs --manifest campaign.csv --out_dir runs/campaign --max_sessions 8 --compute_workers 2
+    python -m src.agent.jobs --manifest campaign.csv --out_dir runs/offline --stub   # no network, scripted LLM
+
+With `--backend kernel` every session runs its code cells in its own kernel
+process instead (see `src.agent.kernels`) and `--compute_workers` is unused.
+"""
+import argparse
+import asyncio
+import csv
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, Optional
+
+import ase
+from ase.calculators.calculator import all_properties
+from ase.calculators.singlepoint import SinglePointCalculator
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.agent.agent import _prepare_prompt, get_agent_executor, registered_tools
+from src.agent.context_store import context_store, format_context_stats
+from src.agent.kernels import HEAVY_TOOLS, KernelPool
+from src.agent.llm_cache import replay_context, substitutions
+from src.tools.tracing import run_with_trace, tracer
+
+
+def load_manifest(path: str) -> list:
+    """Read a campaign manifest.
+    Args:
+        path: str, .csv or .jsonl file with 'smiles', 'slab_path' and optional 'user_request', 'job_id'
+    returns:
+        list of dict rows, each with a 'job_id'
+    """
+    with open(path, 'r') as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    for row in rows:
+        row.setdefault("user_request", "Find a stable adsorption configuration.")
+        if not row.get("job_id"):
+            key = "|".join([row["smiles"], row["slab_path"], row["user_request"]])
+            row["job_id"] = hashlib.sha1(key.encode()).hexdigest()[:12]
+    return rows
+
+
+def _detached(value):
+    # returned Atoms keep only the results of their calculator: the live model neither pickles nor belongs in the parent
+    if isinstance(value, ase.Atoms):
+        calc = value.calc
+        if calc is not None and not isinstance(calc, SinglePointCalculator):
+            results = {k: v for k, v in calc.results.items() if k in all_properties}
+            value.calc = SinglePointCalculator(value, **results) if results and not calc.check_state(value) else None
+        return value
+    if isinstance(value, (list, tuple)):
+        return type(value)(_detached(v) for v in value)
+    if isinstance(value, dict):
+        return {k: _detached(v) for k, v in value.items()}
+    return value
+
+def _run_detached(tool, context: tuple, args: tuple, kwargs: dict) -> tuple:
+    result, spans = run_with_trace(tool, context, args, kwargs)
+    return _detached(result), spans
+
+
+def pooled(tool, executor):
+    """Wrap a tool so that calls run on `executor` instead of the calling thread.
+    Atoms coming back from the pool carry a SinglePointCalculator with the results of the tool's calculator.
+    Streaming MD (`stream=True`) returns a live iterator and always runs locally.
+    """
+    @functools.wraps(tool)
+    def wrapper(*args, **kwargs):
+        if kwargs.get("stream"):
+            return tool(*args, **kwargs)
+        result, spans = executor.submit(_run_detached, tool, tracer.context(), args, kwargs).result()
+        tracer.extend(spans)
+        return result
+    return wrapper
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Offline stand-in for the OpenRouter LLM.
+
+    Answers the i-th model call of a session with `responses[i]` (the last one
+    is repeated), after sleeping `delay` seconds to mimic network latency.
+    Responses may use {smiles}, {slab_path} and {output_dir}, read from the prompt.
+    """
+
+    responses: List[str]
+    delay: float = 0.
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-stub"
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.delay)
+        n_calls = sum(isinstance(m, AIMessage) for m in messages)
+        prompt = next((m.content for m in messages if isinstance(m, HumanMessage)), "")
+        fields = {
+            "smiles": _between(prompt, "<ligand>", "</ligand>"),
+            "slab_path": _between(prompt, "<slab_xyz>", "</slab_xyz>"),
+            "output_dir": _between(prompt, "Save the dictionary to `", "/selected_site.json`") or "outputs",
+        }
+        text = self.responses[min(n_calls, len(self.responses) - 1)].format(**fields)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+def _between(text: str, start: str, end: str) -> str:
+    if start not in text:
+        return ""
+    return text.split(start, 1)[1].split(end, 1)[0].strip()
+
+STUB_SCRIPT = [
+    "```python\nslab = read_atoms_object('{slab_path}')\nsites = get_unique_sites_from_atoms(slab)\n"
+    "print(len(slab), 'atoms,', len(sites), 'unique sites')\n```",
+    "Stub session for {smiles} finished.\n<traj_analysis>\nNo relaxation was run by the offline stub.\n</traj_analysis>",
+]
+
+
+class CampaignRunner:
+    """Run a manifest of agent sessions concurrently and persist their outcomes."""
+
+    def __init__(self, manifest: list, out_dir: str, model=None, max_sessions: int = 4, compute_workers: int = 1,
+                 recursion_limit: int = 50, backend: str = "inprocess", llm_cache: str = None, record_dir: str = None,
+                 replay_cells: str = "reuse"):
+        self.manifest = manifest
+        self.out_dir = out_dir
+        self.model = model
+        self.max_sessions = max_sessions
+        self.compute_workers = compute_workers
+        self.recursion_limit = recursion_limit
+        self.backend = backend
+        # passed to `get_agent_executor`, see `src.agent.llm_cache`
+        self.llm_options = {"llm_cache": llm_cache, "record_dir": record_dir, "replay_cells": replay_cells}
+        self.results_path = os.path.join(out_dir, "results.jsonl")
+        os.makedirs(out_dir, exist_ok=True)
+
+    def completed_ids(self) -> set:
+        """Ids of jobs that already finished successfully in an earlier run."""
+        if not os.path.exists(self.results_path):
+            return set()
+        with open(self.results_path, 'r') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        return {r["job_id"] for r in records if r["status"] == "ok"}
+
+    def _append(self, record: dict):
+        with open(self.results_path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+
+    async def run_job(self, row: dict, graph, semaphore: asyncio.Semaphore) -> dict:
+        queued = time.time()
+        async with semaphore:
+            started = time.time()
+            job_dir = os.path.join(self.out_dir, "jobs", row["job_id"])
+            os.makedirs(job_dir, exist_ok=True)
+            prompt = _prepare_prompt(row["smiles"], row["slab_path"], row["user_request"], output_dir=job_dir)
+            record = {k: row[k] for k in ("job_id", "smiles", "slab_path", "user_request")}
+            try:
+                with tracer.trace(row["job_id"]), substitutions({row["slab_path"]: "<slab_path>", job_dir: "<output_dir>"}):
+                    messages = [("user", prompt)]
+                    state = await graph.ainvoke({"messages": messages, "context": replay_context(messages)},
+                                                config={"recursion_limit": self.recursion_limit})
+                messages = state["messages"]
+                record.update({
+                    "status": "ok",
+                    "final_answer": messages[-1].content,
+                    "n_llm_calls": sum(isinstance(m, AIMessage) for m in messages),
+                })
+            except Exception:
+                record.update({"status": "failed", "error": traceback.format_exc()})
+            finished = time.time()
+            record.update({
+                "output_dir": job_dir, "started": started, "finished": finished,
+                "queue_time_s": started - queued, "wall_time_s": finished - started,
+            })
+            self._append(record)
+            return record
+
+    async def run(self) -> list:
+        """Run every job not yet completed. returns: list of the new result records."""
+        done = self.completed_ids()
+        todo = [row for row in self.manifest if row["job_id"] not in done]
+        if not todo:
+            return []
+
+        if self.backend == "kernel":
+            pool = KernelPool(tools=registered_tools, max_kernels=self.max_sessions)
+            graph = get_agent_executor(model=self.model, tools=registered_tools, backend="kernel", kernel_pool=pool,
+                                       **self.llm_options)
+            try:
+                semaphore = asyncio.Semaphore(self.max_sessions)
+                return await asyncio.gather(*(self.run_job(row, graph, semaphore) for row in todo))
+            finally:
+                pool.close()
+
+        executor = None
+        tools = registered_tools
+        if self.compute_workers > 0:
+            # spawn keeps torch/CUDA state of the parent out of the workers
+            executor = ProcessPoolExecutor(max_workers=self.compute_workers, mp_context=multiprocessing.get_context("spawn"))
+            tools = [pooled(t, executor) if t.__name__ in HEAVY_TOOLS else t for t in registered_tools]
+        try:
+            graph = get_agent_executor(model=self.model, tools=tools, **self.llm_options)
+            semaphore = asyncio.Semaphore(self.max_sessions)
+            return await asyncio.gather(*(self.run_job(row, graph, semaphore) for row in todo))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a campaign of CodeAct agent sessions.")
+    parser.add_argument("--manifest", type=str, required=True, help="CSV/JSONL with smiles, slab_path[, user_request, job_id].")
+    parser.add_argument("--out_dir", type=str, required=True, help="Where results.jsonl and per-job outputs are written.")
+    parser.add_argument("--max_sessions", type=int, default=4, help="Agent sessions running at the same time.")
+    parser.add_argument("--compute_workers", type=int, default=1, help="Processes for heavy tool calls (0 runs them in the session thread).")
+    parser.add_argument("--backend", type=str, default="inprocess", choices=["inprocess", "kernel"], help="Where code cells run.")
+    parser.add_argument("--stub", action="store_true", help="Use the offline scripted LLM instead of OpenRouter.")
+    parser.add_argument("--stub_delay", type=float, default=0., help="Simulated LLM latency of the stub in seconds.")
+    parser.add_argument("--llm_cache", type=str, default=None, choices=["off", "cache", "record", "replay"],
+                        help="LLM response cache mode (default: ADSKRK_LLM_CACHE or off); replay needs no LLM access.")
+    parser.add_argument("--record_dir", type=str, default=None, help="Where sessions are recorded to / replayed from.")
+    parser.add_argument("--replay_cells", type=str, default="reuse", choices=["reuse", "execute"],
+                        help="On replay, reuse the recorded cell outputs or run the cells again.")
+    parser.add_argument("--trace", action="store_true", help="Write tracing spans of every job to <out_dir>/trace.jsonl (trace id = job_id).")
+    return parser.parse_args()
+
+def main_cli():
+    args = parse_args()
+    if args.trace:
+        os.makedirs(args.out_dir, exist_ok=True)
+        tracer.path = os.path.join(args.out_dir, "trace.jsonl")
+    model = ScriptedChatModel(responses=STUB_SCRIPT, delay=args.stub_delay) if args.stub else None
+    runner = CampaignRunner(load_manifest(args.manifest), args.out_dir, model=model,
+                            max_sessions=args.max_sessions, compute_workers=args.compute_workers, backend=args.backend,
+                            llm_cache=args.llm_cache, record_dir=args.record_dir, replay_cells=args.replay_cells)
+    start = time.time()
+    records = asyncio.run(runner.run())
+    failed = [r for r in records if r["status"] != "ok"]
+    print(f"{len(records)} jobs run in {time.time() - start:.1f} s, {len(failed)} failed; results in {runner.results_path}")
+    if args.backend == "inprocess":
+        print(format_context_stats(context_store.stats()))
+
+if __name__ == '__main__':
+    main_cli()
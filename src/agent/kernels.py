@@ -0,0 +1,510 @@
+"""Out-of-process execution backend for CodeAct cells.
+
+With the default `eval_code` the generated code runs with `exec` inside the
+graph's own process, so a multi-minute relaxation freezes the Streamlit UI
+and every other session living there. Here each agent session gets a kernel:
+a spawned worker process that keeps the session's variables between cells,
+like a Jupyter kernel. A cell is sent to the kernel and awaited with a time
+limit; stdout is streamed back line by line (as LangGraph "custom" stream
+events when running inside a graph); a kernel that overruns the limit is
+killed and replaced. Inside a kernel, long tool calls can be started with
+`background(relax_atoms, atoms)` and later polled (`job.done()`, `jobs()`)
+or awaited (`job.result()`).
+
+The graph state only carries the kernel id, and sync CodeAct nodes run in
+LangGraph's thread pool under `ainvoke`, so waiting on a kernel never blocks
+the event loop of a batch campaign.
+"""
+import contextvars
+import io
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from src.tools.tracing import tracer
+
+# tools that run simulations; inside a kernel they are serialized because calculators are not thread safe
+HEAVY_TOOLS = {"relax_atoms", "relax_many", "md_run_atoms", "md_ensemble", "adsorption_energy", "screen_adsorption"}
+
+KERNEL_PROMPT = """Your code runs in a persistent Python kernel with a time limit per code snippet.
+Long tool calls can run in the background while you keep working:
+- `job = background(relax_atoms, atoms, output_dir="...")` starts the call and returns immediately;
+- `job.done()` tells if it finished, `job.result(timeout=None)` waits for and returns its value (or raises its error);
+- `jobs()` lists all background jobs with their status.
+Simulation tools run one at a time, so a foreground call waits for running background simulations."""
+
+
+class KernelError(RuntimeError):
+    """The kernel process died or could not be started."""
+
+
+class CellTimeout(RuntimeError):
+    """A cell ran longer than the kernel pool allows."""
+
+
+# --- worker side ---------------------------------------------------------------------------------
+
+class _PipeStdout(io.TextIOBase):
+    """Line-buffered stdout of a kernel, forwarding every complete line to the parent process."""
+
+    def __init__(self, send):
+        self._send = send
+        self._buffer = ""
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            self._buffer += text
+            if "\n" in self._buffer:
+                lines, self._buffer = self._buffer.rsplit("\n", 1)
+                self._send("stdout", lines + "\n")
+        return len(text)
+
+    def flush(self):
+        with self._lock:
+            if self._buffer:
+                self._send("stdout", self._buffer)
+                self._buffer = ""
+
+
+class BackgroundJob:
+    """Handle of a tool call running in a kernel thread."""
+
+    def __init__(self, job_id: int, name: str, future):
+        self.job_id = job_id
+        self.name = name
+        self.future = future
+        self.submitted = time.time()
+
+    @property
+    def status(self) -> str:
+        """'running', 'done' or 'failed'."""
+        if not self.future.done():
+            return "running"
+        return "failed" if self.future.exception() is not None else "done"
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self, timeout: float = None):
+        """Wait up to `timeout` seconds (None: forever) and return the tool's return value."""
+        return self.future.result(timeout=timeout)
+
+    def __repr__(self):
+        return f"<BackgroundJob {self.job_id} {self.name}: {self.status}, {time.time() - self.submitted:.0f} s>"
+
+
+class _BackgroundRunner:
+
+    def __init__(self, max_workers: int = 2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="background")
+        self.jobs = []
+
+    def background(self, fn, *args, **kwargs) -> BackgroundJob:
+        """Start `fn(*args, **kwargs)` in the background. returns: BackgroundJob"""
+        # the job's spans belong to the trace of the cell that started it
+        future = self.executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        job = BackgroundJob(len(self.jobs), getattr(fn, "__name__", repr(fn)), future)
+        self.jobs.append(job)
+        return job
+
+    def list_jobs(self) -> list:
+        """Status of every background job. returns: list of dict with 'job_id', 'name', 'status', 'elapsed_s'"""
+        return [{"job_id": j.job_id, "name": j.name, "status": j.status, "elapsed_s": round(time.time() - j.submitted, 1)}
+                for j in self.jobs]
+
+
+def _serialized(tool, lock):
+    import functools
+
+    @functools.wraps(tool)
+    def wrapper(*args, **kwargs):
+        with lock:
+            return tool(*args, **kwargs)
+    return wrapper
+
+def _kernel_main(conn, tools):
+    send_lock = threading.Lock()
+
+    def send(*message):
+        with send_lock:
+            conn.send(message)
+
+    stdout = _PipeStdout(send)
+    sys.stdout = stdout
+    tracer.forward_to_parent()
+    try:
+        from src.agent.agent import exec_globals
+        from src.agent.lazy import warm_up
+        from src.tools.calculators import calculator_pool
+        compute_lock = threading.RLock()
+        session_tools = {t.__name__: _serialized(t, compute_lock) if t.__name__ in HEAVY_TOOLS else t for t in tools}
+
+        def new_session():
+            runner = _BackgroundRunner()
+            scope = exec_globals.copy()
+            scope.update(session_tools)
+            scope.update({"background": runner.background, "jobs": runner.list_jobs})
+            return runner, scope
+
+        runner, scope = new_session()
+    except Exception:
+        send("failed", traceback.format_exc())
+        return
+    send("ready", os.getpid())
+    warm_up()
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message[0] == "close":
+            break
+        if message[0] == "stats":
+            send("stats", calculator_pool.stats())
+            continue
+        if message[0] == "reset":
+            # a new session gets a clean namespace; imports and loaded calculators stay warm
+            running = any(job.status == "running" for job in runner.jobs)
+            if not running:
+                runner.executor.shutdown(wait=False)
+                runner, scope = new_session()
+            send("reset", not running)
+            continue
+        error = None
+        try:
+            with tracer.use_context(message[2]):
+                exec(message[1], scope)
+        except Exception:
+            error = traceback.format_exc()
+        stdout.flush()
+        # spans of this cell and of background jobs finished since the previous one
+        send("done", error, tracer.drain())
+    runner.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- parent side ---------------------------------------------------------------------------------
+
+class Kernel:
+    """A worker process holding the variables of one agent session."""
+
+    def __init__(self, tools: list, startup_timeout: float = 300.):
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_kernel_main, args=(child_conn, list(tools)), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.startup_timeout = startup_timeout
+        self.ready = False
+        self.busy = False
+        self.last_used = time.time()
+        self.n_cells = 0
+        self._stdout = []
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def _recv(self, timeout: float):
+        if not self.conn.poll(timeout):
+            raise CellTimeout()
+        try:
+            return self.conn.recv()
+        except EOFError:
+            raise KernelError(f"kernel process exited with code {self.process.exitcode}")
+
+    def _wait_ready(self):
+        if self.ready:
+            return
+        try:
+            with tracer.span("kernel_start", "kernel"):
+                message = self._recv(self.startup_timeout)
+        except CellTimeout:
+            self.terminate()
+            raise KernelError(f"kernel did not start within {self.startup_timeout:.0f} s")
+        if message[0] == "failed":
+            raise KernelError(f"kernel failed to start:\n{message[1]}")
+        self.ready = True
+
+    def run(self, code: str, timeout: float = None, on_stdout=None) -> str:
+        """Execute `code` in the kernel.
+        Args:
+            code: str, python source
+            timeout: float or None, seconds before the kernel is killed (CellTimeout is raised)
+            on_stdout: callable(str) or None, called with every line printed while the cell runs
+        returns:
+            str, captured stdout, followed by the traceback if the cell raised
+        """
+        self._wait_ready()
+        self.n_cells += 1
+        self.conn.send(("run", code, tracer.context()))
+        deadline = None if timeout is None else time.time() + timeout
+        chunks, self._stdout = self._stdout, []
+        while True:
+            remaining = None if deadline is None else max(deadline - time.time(), 0.)
+            try:
+                message = self._recv(remaining)
+            except CellTimeout:
+                self.terminate()
+                raise
+            if message[0] == "stdout":
+                chunks.append(message[1])
+                if on_stdout is not None:
+                    on_stdout(message[1])
+            elif message[0] == "done":
+                tracer.extend(message[2])
+                output = "".join(chunks)
+                if message[1] is not None:
+                    output += f"Error during execution:\n{message[1]}"
+                return output
+
+    def request(self, command: str, timeout: float = 30.):
+        """Send a control command ('stats' or 'reset') to an idle kernel and return its reply.
+        'stats' returns the kernel's calculator pool statistics; 'reset' clears the namespace for a new
+        session and returns False if background jobs are still running (the namespace is then kept)."""
+        self._wait_ready()
+        self.conn.send((command,))
+        while True:
+            message = self._recv(timeout)
+            if message[0] == command:
+                return message[1]
+            if message[0] == "stdout":
+                # printed by a background job, shown with the next cell
+                self._stdout.append(message[1])
+
+    def close(self):
+        """Ask the kernel to exit, killing it if it does not within a few seconds."""
+        try:
+            self.conn.send(("close",))
+        except (OSError, ValueError):
+            pass
+        self.process.join(5)
+        self.terminate()
+
+    def terminate(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(5)
+        self.conn.close()
+
+
+def _stream_writer():
+    try:
+        from langgraph.config import get_stream_writer
+        return get_stream_writer()
+    except (ImportError, RuntimeError):
+        return None
+
+
+class KernelPool:
+    """Bounded set of kernels, one per agent session, serving as a CodeAct `eval_fn`.
+
+    At most `max_kernels` kernels are alive; a new session takes over the least
+    recently used idle kernel (whose session is told its variables are gone on
+    its next cell) and waits if all kernels are busy. A kernel taken over only
+    has its namespace reset, so the new session starts with warm imports and
+    already loaded calculators. `release` marks a session as finished and keeps
+    its kernel warm, with a reset namespace, for the next new session.
+    """
+
+    CONTEXT_KEY = "__kernel__"
+
+    def __init__(self, tools: list = None, max_kernels: int = 4, timeout: float = 1800.):
+        if tools is None:
+            from src.agent.agent import registered_tools
+            tools = registered_tools
+        self.tools = list(tools)
+        self.max_kernels = max_kernels
+        self.timeout = timeout
+        self._kernels = OrderedDict()
+        self._spare = []
+        self._lost = set()
+        self._cond = threading.Condition()
+        self.restarts = 0
+        self.reuses = 0
+        self.timeouts = 0
+
+    def _acquire(self, session: str) -> tuple:
+        # kernels are claimed (busy) under the lock; requests to them run outside it, so that a slow or hung
+        # kernel only holds up its own session
+        with self._cond:
+            reset = False
+            while True:
+                kernel = self._kernels.get(session)
+                if kernel is not None and not kernel.busy:
+                    if kernel.alive():
+                        break
+                    del self._kernels[session]
+                    self._lost.add(session)
+                    continue
+                spare = next((k for k in self._spare if not k.busy), None) if kernel is None else None
+                if spare is not None:
+                    self._spare.remove(spare)
+                    kernel = self._kernels[session] = spare
+                    break
+                if kernel is None:
+                    idle = [s for s, k in self._kernels.items() if not k.busy]
+                    if len(self._kernels) + len(self._spare) < self.max_kernels:
+                        kernel = self._kernels[session] = Kernel(self.tools)
+                        break
+                    if idle:
+                        # take the idle kernel of another session away from it; it is reset below
+                        kernel = self._kernels[session] = self._kernels.pop(idle[0])
+                        self._lost.add(idle[0])
+                        reset = True
+                        break
+                self._cond.wait()
+            kernel.busy = True
+            self._kernels.move_to_end(session)
+            note = ""
+            if session in self._lost:
+                self._lost.discard(session)
+                note = "Note: the kernel of this session was restarted, variables defined in earlier code snippets are gone.\n"
+        if reset:
+            kernel = self._reuse(session, kernel)
+        return kernel, note
+
+    def _reset(self, kernel: Kernel) -> bool:
+        """Give the claimed `kernel` a clean namespace, or shut it down if it is dead, unresponsive or still running
+        background jobs. Called without the lock held. returns: True if the kernel can be reused"""
+        try:
+            if kernel.alive() and kernel.request("reset"):
+                kernel.n_cells = 0
+                kernel._stdout = []
+                return True
+        except (CellTimeout, KernelError, OSError):
+            pass
+        kernel.close()
+        with self._cond:
+            self.restarts += 1
+        return False
+
+    def _reuse(self, session: str, kernel: Kernel) -> Kernel:
+        """Reset the kernel `session` took over from another session, or replace it by a new one if it had to be shut down."""
+        if self._reset(kernel):
+            with self._cond:
+                self.reuses += 1
+            return kernel
+        with self._cond:
+            replacement = Kernel(self.tools)
+            replacement.busy = True
+            if self._kernels.get(session) is kernel:
+                self._kernels[session] = replacement
+            return replacement
+
+    def release(self, session: str):
+        """Mark `session` as finished: its idle kernel is reset and kept warm for the next new session."""
+        with self._cond:
+            kernel = self._kernels.get(session)
+            if kernel is None or kernel.busy:
+                return
+            kernel.busy = True
+        reusable = self._reset(kernel)
+        with self._cond:
+            kernel.busy = False
+            if self._kernels.get(session) is kernel:
+                del self._kernels[session]
+            if reusable:
+                self._spare.append(kernel)
+            self._cond.notify_all()
+
+    def _release(self, session: str, kernel: Kernel):
+        with self._cond:
+            kernel.busy = False
+            kernel.last_used = time.time()
+            if not kernel.alive() and self._kernels.get(session) is kernel:
+                del self._kernels[session]
+            self._cond.notify_all()
+
+    def run(self, session: str, code: str, on_stdout=None) -> str:
+        """Execute `code` in the kernel of `session`, starting one if needed. returns: str cell output"""
+        kernel, note = self._acquire(session)
+        try:
+            output = note + kernel.run(code, timeout=self.timeout, on_stdout=on_stdout)
+        except CellTimeout:
+            self.timeouts += 1
+            self._lost.discard(session)
+            output = (f"Error during execution:\nThe code ran longer than {self.timeout:.0f} s and was stopped; "
+                      "the kernel was restarted and variables defined in earlier code snippets are gone. "
+                      "Start long simulations with `background(...)` and poll the job instead.")
+        except KernelError as e:
+            output = f"Error during execution:\n{e}\nThe kernel was restarted, variables defined in earlier code snippets are gone."
+        finally:
+            self._release(session, kernel)
+        return output or "<code ran, no output printed to stdout>"
+
+    def eval_code(self, code: str, context: dict) -> tuple:
+        """CodeAct `eval_fn`: runs the cell in the session's kernel and keeps only the kernel id in the graph state."""
+        session = context.get(self.CONTEXT_KEY) or uuid.uuid4().hex
+        writer = _stream_writer()
+        on_stdout = None if writer is None else (lambda text: writer({"kernel": session, "stdout": text}))
+        return self.run(session, code, on_stdout=on_stdout), {self.CONTEXT_KEY: session}
+
+    def close(self, session: str = None):
+        """Shut down the kernel of `session`, or every kernel."""
+        with self._cond:
+            sessions = [session] if session is not None else list(self._kernels)
+            closing = [self._kernels.pop(s) for s in sessions if s in self._kernels]
+            if session is None:
+                closing += self._spare
+                self._spare = []
+            self._cond.notify_all()
+        for kernel in closing:
+            kernel.close()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "kernels": len(self._kernels) + len(self._spare),
+                "spare": len(self._spare),
+                "max_kernels": self.max_kernels,
+                "busy": sum(k.busy for k in self._kernels.values()),
+                "cells": {s: k.n_cells for s, k in self._kernels.items()},
+                "restarts": self.restarts,
+                "reuses": self.reuses,
+                "timeouts": self.timeouts,
+            }
+
+    def calculator_stats(self) -> dict:
+        """Calculator pool statistics (see `CalculatorPool.stats`) of every idle kernel, by session
+        ('spare <i>' for kernels kept warm by `release`); None for kernels that are busy running a cell."""
+        with self._cond:
+            kernels = list(self._kernels.items()) + [(f"spare {i}", k) for i, k in enumerate(self._spare)]
+        stats = {}
+        for session, kernel in kernels:
+            # claimed one at a time, so that only the kernel being asked is unavailable to its session
+            with self._cond:
+                claimed = not kernel.busy and kernel.alive()
+                kernel.busy = kernel.busy or claimed
+            stats[session] = None
+            if not claimed:
+                continue
+            try:
+                stats[session] = kernel.request("stats")
+            except (CellTimeout, KernelError, OSError):
+                pass
+            finally:
+                with self._cond:
+                    kernel.busy = False
+                    self._cond.notify_all()
+        return stats
+
+
+_kernel_pool = None
+
+def get_kernel_pool(tools: list = None) -> KernelPool:
+    """Process-wide kernel pool; size and cell time limit come from ADSKRK_MAX_KERNELS and ADSKRK_CELL_TIMEOUT."""
+    global _kernel_pool
+    if _kernel_pool is None:
+        _kernel_pool = KernelPool(
+            tools=tools,
+            max_kernels=int(os.environ.get("ADSKRK_MAX_KERNELS", 4)),
+            timeout=float(os.environ.get("ADSKRK_CELL_TIMEOUT", 1800)),
+        )
+    return _kernel_pool
@@ -0,0 +1,74 @@
+"""Lazily imported modules and a background warm-up.
+
+The namespace of the agent's code cells offers np, pd, scipy, sklearn, ase,
+autoadsorbate, torch and mace. Importing them all took several seconds on
+every CLI start, Streamlit cold start and kernel start, before the first LLM
+call was even sent. They are now `LazyModule` proxies that import the real
+module on first attribute access. `warm_up` imports them, and optionally
+loads the tools' calculator, in a background thread, so the cost overlaps
+with the first LLM round-trip instead of adding to it.
+
+Measure the import time with
+
+    python -m benchmarks.bench_import
+"""
+import importlib
+import threading
+import types
+
+# modules preloaded by `warm_up`, most useful first
+WARM_UP_MODULES = ("numpy", "ase.io", "pandas", "autoadsorbate", "torch", "mace.calculators", "scipy", "sklearn")
+
+
+class LazyModule(types.ModuleType):
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            module = self.__dict__["_lazy_module"] = importlib.import_module(self.__name__)
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_module"] is not None else "not loaded yet"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+    def __reduce__(self):
+        return importlib.import_module, (self.__name__,)
+
+
+def warm_up(modules: tuple = WARM_UP_MODULES, model: str = None, background: bool = True):
+    """Import `modules` (and load the calculator `model` into the calculator pool, if given).
+    Args:
+        modules: tuple of module names
+        model: str or None, e.g. `TOOLS_MODEL`; None skips the calculator
+        background: bool, do it in a daemon thread and return immediately
+    returns:
+        threading.Thread if `background`, else None
+    """
+    def run():
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+        if model is not None:
+            from src.tools.calculators import get_calculator
+            get_calculator(model=model)
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,334 @@
+"""Persistent LLM response cache and record/replay of agent sessions.
+
+Each step of a rerun of the same (SMILES, slab, request) went back to
+OpenRouter, with 600 s timeouts and 20k-token completions. `CachedChatModel`
+wraps the chat model used by `get_agent_executor` and works in one of four
+modes:
+
+- "off": every call goes to the model.
+- "cache": responses are stored in an sqlite table keyed by the normalized
+  message history and the model parameters. An identical call is answered
+  from disk.
+- "record": like "cache". In addition, the whole session is written to
+  `<record_dir>/<trajectory>.json`: every LLM response and every code cell
+  with its output.
+- "replay": never contacts the model. The n-th LLM call of a session returns
+  the n-th recorded response of the recording with the same initial prompt,
+  even if tool outputs differ slightly. `replay_eval` then either re-executes
+  the recorded cells or reuses their recorded outputs: the n-th cell of a
+  session gets the output of the n-th recorded cell of the same recording,
+  if its code is the same. Start the session with `replay_context` in its
+  initial CodeAct context to tell `replay_eval` which recording it replays.
+
+Keys ignore whitespace differences and object addresses. Callers also
+declare the volatile values of a session with `substitutions`: the slab
+path (the Streamlit app uploads the slab to a fresh temporary file on every
+run) and the output directory. Messages are keyed and stored with
+placeholders instead of these values, and the placeholders are filled in
+again with the current values when a response is reused. Inspect the cache
+with
+
+    python -m src.agent.llm_cache stats
+    python -m src.agent.llm_cache clear
+"""
+import argparse
+import contextlib
+import contextvars
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+DEFAULT_LLM_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "adskrk", "llm")
+MODES = ("off", "cache", "record", "replay")
+REPLAY_KEY = "__replay__"  # CodeAct context entry with the replayed trajectory and the next cell index
+
+_ADDRESS = re.compile(r" at 0x[0-9a-fA-F]+")
+_substitutions = contextvars.ContextVar("adskrk_llm_substitutions", default=())
+
+
+class ReplayMiss(RuntimeError):
+    """Replay mode was asked for a response that is neither recorded nor cached."""
+
+
+@contextlib.contextmanager
+def substitutions(mapping: dict):
+    """Within this context (and the graph nodes it runs), every occurrence of a key of `mapping` in the
+    messages is cached and recorded as its value, a placeholder such as "<output_dir>"."""
+    items = tuple(sorted(((str(k), str(v)) for k, v in mapping.items() if k), key=lambda kv: -len(kv[0])))
+    token = _substitutions.set(items)
+    try:
+        yield
+    finally:
+        _substitutions.reset(token)
+
+def _abstract(text):
+    if isinstance(text, str):
+        for value, placeholder in _substitutions.get():
+            text = text.replace(value, placeholder)
+    return text
+
+def _concrete(text):
+    if isinstance(text, str):
+        for value, placeholder in _substitutions.get():
+            text = text.replace(placeholder, value)
+    return text
+
+def _with_content(message: BaseMessage, convert) -> BaseMessage:
+    if not isinstance(message.content, str):
+        return message
+    return message.model_copy(update={"content": convert(message.content)})
+
+def normalize_text(text) -> str:
+    """Content with placeholders for the session's `substitutions`, object addresses and trailing whitespace made canonical."""
+    if not isinstance(text, str):
+        text = json.dumps(text, sort_keys=True, default=str)
+    text = _ADDRESS.sub(" at 0x?", _abstract(text.replace("\r\n", "\n")))
+    return "\n".join(line.rstrip() for line in text.strip().split("\n"))
+
+def request_key(messages: List[BaseMessage], params: dict) -> str:
+    """sha256 of the normalized message history and the model parameters."""
+    sha = hashlib.sha256()
+    for message in messages:
+        sha.update(message.type.encode() + b"\0" + normalize_text(message.content).encode() + b"\0")
+    sha.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return sha.hexdigest()
+
+def trajectory_id(messages: List[BaseMessage]) -> str:
+    """Id of a session: hash of its first human message (the task prompt)."""
+    first = next((m for m in messages if m.type == "human"), None)
+    return hashlib.sha256(normalize_text(first.content if first is not None else "").encode()).hexdigest()[:16]
+
+def model_params(model) -> dict:
+    """Parameters of `model` that change its answers (name, temperature, seed, token limit, ...)."""
+    if model is None:
+        return {}
+    params = dict(getattr(model, "_identifying_params", {}) or {})
+    params.pop("openai_api_key", None)
+    return {"class": type(model).__name__, **params}
+
+
+class LLMCache:
+    """sqlite table of chat responses keyed by `request_key`."""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.environ.get("ADSKRK_LLM_CACHE_DIR", DEFAULT_LLM_CACHE_DIR)
+        os.makedirs(self.path, exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, created REAL, last_access REAL, hits INTEGER DEFAULT 0, response TEXT)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        db = sqlite3.connect(os.path.join(self.path, "responses.sqlite"), timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        with self._connect() as db:
+            row = db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE responses SET hits = hits + 1, last_access = ? WHERE key = ?", (time.time(), key))
+        return _with_content(messages_from_dict([json.loads(row[0])])[0], _concrete)
+
+    def put(self, key: str, message: AIMessage, model: str = ""):
+        now = time.time()
+        stored = json.dumps(message_to_dict(_with_content(message, _abstract)))
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO responses (key, model, created, last_access, hits, response) VALUES (?, ?, ?, ?, 0, ?)",
+                       (key, model, now, now, stored))
+
+    def clear(self):
+        with self._connect() as db:
+            db.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        with self._connect() as db:
+            n, hits = db.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM responses").fetchone()
+        return {"path": self.path, "responses": n, "hits": hits}
+
+
+def _cells(messages: List[BaseMessage]) -> list:
+    """(code, output) of every executed code cell in a CodeAct message history."""
+    from langgraph_codeact import extract_and_combine_codeblocks
+
+    cells = []
+    for message, following in zip(messages, messages[1:]):
+        if message.type == "ai" and following.type == "human":
+            code = extract_and_combine_codeblocks(message.content if isinstance(message.content, str) else "")
+            if code:
+                cells.append({"code": _abstract(code), "output": _abstract(following.content)})
+    return cells
+
+
+class SessionRecordings:
+    """Recorded sessions in `path`, one `<trajectory>.json` file each."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._sessions = None
+        self._lock = threading.Lock()
+        self.diverged = 0
+
+    def _file(self, trajectory: str) -> str:
+        return os.path.join(self.path, f"{trajectory}.json")
+
+    def _load(self) -> dict:
+        if self._sessions is None:
+            self._sessions = {}
+            for file in sorted(glob.glob(os.path.join(self.path, "*.json"))):
+                with open(file) as f:
+                    session = json.load(f)
+                self._sessions[session["trajectory"]] = session
+        return self._sessions
+
+    def record(self, messages: List[BaseMessage], response: AIMessage, key: str, params: dict):
+        """Write the session of `messages` with `response` as its latest turn (rewritten on every turn)."""
+        trajectory = trajectory_id(messages)
+        history = list(messages) + [response]
+        with self._lock:
+            session = self._load().setdefault(trajectory, {"trajectory": trajectory, "params": params, "turns": []})
+            step = sum(m.type == "ai" for m in messages)
+            session["turns"] = session["turns"][:step] + [{"key": key, "response": message_to_dict(_with_content(response, _abstract))}]
+            session["cells"] = _cells(history)
+            session["recorded"] = time.time()
+            os.makedirs(self.path, exist_ok=True)
+            tmp = self._file(trajectory) + f".{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(session, f, indent=1)
+            os.replace(tmp, self._file(trajectory))
+
+    def params(self, messages: List[BaseMessage]) -> Optional[dict]:
+        with self._lock:
+            session = self._load().get(trajectory_id(messages))
+        return None if session is None else session.get("params")
+
+    def response(self, messages: List[BaseMessage], key: str) -> Optional[AIMessage]:
+        """The recorded response to the n-th LLM call of the session, n = AI messages in `messages`."""
+        with self._lock:
+            session = self._load().get(trajectory_id(messages))
+            step = sum(m.type == "ai" for m in messages)
+            if session is None or step >= len(session["turns"]):
+                return None
+            turn = session["turns"][step]
+            if turn["key"] != key:
+                self.diverged += 1
+        return _with_content(messages_from_dict([turn["response"]])[0], _concrete)
+
+    def cell_output(self, trajectory: str, index: int, code: str) -> Optional[str]:
+        """Recorded output of cell `index` of session `trajectory`, None if there is no such cell or its code differs."""
+        with self._lock:
+            session = self._load().get(trajectory)
+            cells = session.get("cells", []) if session is not None else []
+        if index >= len(cells) or normalize_text(cells[index]["code"]) != normalize_text(code):
+            return None
+        return _concrete(cells[index]["output"])
+
+
+class CachedChatModel(BaseChatModel):
+    """Chat model answering from `response_cache` / `recordings` before (or instead of) calling `model`."""
+
+    model: Optional[BaseChatModel] = None
+    mode: str = "cache"
+    response_cache: Any = None
+    recordings: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "cached-" + (self.model._llm_type if self.model is not None else "replay")
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        params = model_params(self.model)
+        if self.mode == "replay" and self.recordings is not None:
+            params = self.recordings.params(messages) or params
+        key = request_key(messages, {**params, "stop": stop})
+
+        source, message = "miss", None
+        if self.mode == "replay":
+            message = self.recordings.response(messages, key) if self.recordings is not None else None
+            source = "replay"
+        if message is None and self.mode in ("cache", "record", "replay") and self.response_cache is not None:
+            message = self.response_cache.get(key)
+            source = "hit"
+        if message is None:
+            if self.mode == "replay" or self.model is None:
+                raise ReplayMiss(f"no recorded or cached response for LLM call {sum(m.type == 'ai' for m in messages)} "
+                                 f"of session {trajectory_id(messages)}")
+            source = "miss"
+            # callbacks=[]: the LLM span of this wrapper already covers the call
+            message = self.model.invoke(messages, stop=stop, config={"callbacks": []}, **kwargs)
+            if self.mode in ("cache", "record") and self.response_cache is not None:
+                self.response_cache.put(key, message, model=params.get("model_name") or params.get("model") or "")
+        if self.mode == "record" and self.recordings is not None:
+            self.recordings.record(messages, message, key, params)
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"cache": source})
+
+
+def cached_model(model, mode: str = None, cache_dir: str = None, record_dir: str = None) -> BaseChatModel:
+    """Wrap `model` for `mode` (default ADSKRK_LLM_CACHE, or "off"); "off" returns `model` unchanged.
+    Recordings go to `record_dir` (default ADSKRK_RECORD_DIR, or `<cache dir>/sessions`)."""
+    mode = mode or os.environ.get("ADSKRK_LLM_CACHE", "off")
+    if mode not in MODES:
+        raise ValueError(f"Unknown LLM cache mode {mode!r}, expected one of {MODES}.")
+    if mode == "off":
+        return model
+    cache = LLMCache(cache_dir)
+    recordings = None
+    if mode in ("record", "replay"):
+        recordings = SessionRecordings(record_dir or os.environ.get("ADSKRK_RECORD_DIR") or os.path.join(cache.path, "sessions"))
+    return CachedChatModel(model=model, mode=mode, response_cache=cache, recordings=recordings)
+
+def replay_context(messages: list) -> dict:
+    """Initial CodeAct context of a session replayed with `replay_eval`: the id of the session the messages
+    start (call it within the session's `substitutions`) and the index of its next cell."""
+    from langchain_core.messages import convert_to_messages
+
+    return {REPLAY_KEY: {"trajectory": trajectory_id(convert_to_messages(messages)), "cell": 0}}
+
+def replay_eval(eval_fn, recordings: SessionRecordings):
+    """Wrap a CodeAct `eval_fn` to return the recorded outputs of the replayed session's cells instead of
+    executing them. Cells without a recording (or with other code) and sessions without `replay_context` are executed."""
+    def wrapper(code: str, context: dict) -> tuple:
+        position = context.get(REPLAY_KEY)
+        if position is None:
+            return eval_fn(code, context)
+        advanced = {REPLAY_KEY: {**position, "cell": position["cell"] + 1}}
+        output = recordings.cell_output(position["trajectory"], position["cell"], code)
+        if output is None:
+            output, new_vars = eval_fn(code, context)
+            return output, {**new_vars, **advanced}
+        return output, advanced
+    return wrapper
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect the LLM response cache.")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--path", type=str, default=None, help="Cache directory (default: ADSKRK_LLM_CACHE_DIR).")
+    return parser.parse_args()
+
+def main_cli():
+    args = parse_args()
+    cache = LLMCache(args.path)
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), indent=2))
+    elif args.command == "clear":
+        cache.clear()
+
+if __name__ == '__main__':
+    main_cli()
@@ -36,19 +36,21 @@ TASK 2:
 
 Pass the slab atom coordinates to the `get_sites_from_atoms` tool to get a Dataframe containing all possible binding sites.
 Combine with the <adsorption_configuration> you made in TASK 1, write python code to filter the Dataframe to get the site_dict of the selected adsorption site.
-Return only the first entry of the filtered Dataframe as a dictionary. Save the dictionary to `outputs/selected_site.json`.
+For filtering by connectivity, composition or distance, `get_site_index` gives the same sites as numpy columns with fast queries; `index.site_dict(row)` returns the site_dict of a selected row.
+Return only the first entry of the filtered Dataframe as a dictionary. Save the dictionary to `{{OUTPUT_DIR}}/selected_site.json`.
 
 TASK 3:
 
 Using the retrieved site_dict, call the tool `get_ads_slab` to place the ligand on the slab. 
+If the user asks to compare several sites, rotations or heights, do not place and relax them one by one: pass the candidate sites to `screen_adsorption` and reason over the ranked energy table it returns. For large screens set `refine_top_k` so that only the most promising placements are relaxed accurately, and `prerank_fraction` so that only the most promising fraction is relaxed at all. To compare adsorption energies, call `adsorption_energy(ads_slab, slab, smiles)` instead of relaxing the bare slab and the molecule yourself; their reference energies are stored and reused.
 
 TASK 4:
 
-Relax the adsorption structure using the tool `relax_atoms`. Save the relaxed structure to a .xyz file at "outputs/relaxed_ads_slab.xyz" using tool `save_ase_atoms`.
+Relax the adsorption structure using the tool `relax_atoms` with `output_dir="{{OUTPUT_DIR}}"`. Save the relaxed structure to a .xyz file at "{{OUTPUT_DIR}}/relaxed_ads_slab.xyz" using tool `save_ase_atoms`. If the slab has several hundred atoms or more, pass `embed_radius=6.` so that only the atoms near the adsorbate are evaluated.
 
 TASK 5:
 
-Based the configuration before and after the relaxation, compute the displacement of the ligand atoms, based on this estimate if the change is significant. Then report if the initial binding configuration is stable. Give your reasoning and analysis in the following format:
+Based the configuration before and after the relaxation, compute the displacement of the ligand atoms, based on this estimate if the change is significant. Then report if the initial binding configuration is stable. If the user asks how stable the binding is at a temperature, run `md_ensemble` on the relaxed structure instead of a single `md_run_atoms` and base the answer on its desorption probability and residence time. Give your reasoning and analysis in the following format:
 
 <traj_analysis>
 Your analysis here.
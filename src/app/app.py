@@ -1,6 +1,7 @@
 import sys
 import os
 import re
+import json
 import tempfile
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -8,17 +9,29 @@ project_root = os.path.abspath(os.path.join(current_dir, "..", ".."))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
+import altair as alt
+import pandas as pd
 import streamlit as st
 from src.agent.agent import get_agent_executor, _prepare_prompt
+from src.agent.kernels import KernelPool, get_kernel_pool
+from src.agent.lazy import warm_up
+from src.agent.llm_cache import replay_context, substitutions
+from src.tools.tracing import summary, to_chrome_trace, tracer
 
 st.set_page_config(page_title="LLM Agent Demo", layout="wide")
 st.title("adsKRK")
 
 @st.cache_resource
 def initialize_agent_executor():
-    return get_agent_executor()
+    # code cells run in kernel processes so a long simulation does not freeze other sessions
+    return get_agent_executor(backend="kernel")
 
-agent_executor = initialize_agent_executor()
+@st.cache_resource
+def start_warm_up():
+    # the app only builds the graph, the tools run in kernels that warm up themselves
+    return warm_up(modules=("langgraph_codeact", "langchain_openai"))
+
+start_warm_up()
 
 def render_message(content):
     parts = re.split(r"(```python\n.*\n```)", content, flags=re.DOTALL)
@@ -40,6 +53,27 @@ def render_message_in_status(content, status):
             else:
                 status.markdown(part)
 
+def render_timeline(trace_id):
+    # where the time of one agent run went: per-span summary and a gantt chart of every span
+    spans = tracer.get_spans(trace_id)
+    if not spans:
+        st.caption("No spans recorded for this run.")
+        return
+    st.dataframe(summary(spans).round(3), hide_index=True)
+    start = min(s["ts"] for s in spans)
+    frame = pd.DataFrame([{
+        "span": f"{s['cat']}: {s['name']}", "category": s["cat"], "start_s": s["ts"] - start,
+        "end_s": s["ts"] - start + s["dur"], "duration_s": round(s["dur"], 3), "force_calls": s.get("force_calls", 0),
+    } for s in spans])
+    chart = alt.Chart(frame).mark_bar().encode(
+        x=alt.X("start_s:Q", title="time since start (s)"), x2="end_s:Q",
+        y=alt.Y("span:N", sort=None, title=None), color="category:N",
+        tooltip=["span", "duration_s", "force_calls"],
+    )
+    st.altair_chart(chart, width="stretch")
+    st.download_button("Download Chrome trace", json.dumps(to_chrome_trace(spans), default=str),
+                       file_name=f"trace_{trace_id}.json", mime="application/json")
+
 st.sidebar.header("Settings")
 openrouter_api_key = st.sidebar.text_input("OpenRouter API Key", type="password", key="openrouter_api_key")
 if openrouter_api_key:
@@ -73,6 +107,7 @@ if run_button:
             tmp_file_path = tmp_file.name
         
         try:
+            agent_executor = initialize_agent_executor()
             prompt = _prepare_prompt(smiles=smiles_input, slab_path=tmp_file_path, user_request=user_query)
             
             st.session_state.messages.append({"role": "user", "content": f"**Inputs provided:**\n- SMILES: `{smiles_input}`\n- Slab file: `{xyz_file.name}`\n- Query: `{user_query}`\n\n**Generated prompt for the agent...**"})
@@ -81,11 +116,18 @@ if run_button:
 
             with st.chat_message("assistant"):
                 final_answer = ""
-                with st.status("Thinking...", expanded=True) as status:
-                    for event in agent_executor.stream(
-                        {"messages": [("user", prompt)]},
-                        stream_mode="values",
+                session = None
+                # the uploaded slab gets a new temporary name on every run; cached LLM responses refer to it by placeholder
+                with st.status("Thinking...", expanded=True) as status, tracer.trace() as trace_id, \
+                        substitutions({tmp_file_path: "<slab_path>"}):
+                    for mode, event in agent_executor.stream(
+                        {"messages": [("user", prompt)], "context": replay_context([("user", prompt)])},
+                        stream_mode=["values", "custom"],
                     ):
+                        if mode == "custom":
+                            if "stdout" in event:
+                                status.text(event["stdout"].rstrip("\n"))
+                            continue
                         if "tool_calls" in event:
                             for tc in event["tool_calls"]:
                                 status.markdown(f"Calling tool: `{tc['name']}` with args: `{tc['args']}`")
@@ -94,6 +136,7 @@ if run_button:
                             for to in event["tool_output"]:
                                 status.markdown(f"Tool output: `{to}`")
                             status.divider()
+                        session = event.get("context", {}).get(KernelPool.CONTEXT_KEY, session)
                         if "messages" in event:
                             last_message = event["messages"][-1]
                             if last_message.type == "ai" and last_message.content:
@@ -103,12 +146,17 @@ if run_button:
                                 final_answer = content
                     
                     status.update(label="Agent finished.", state="complete", expanded=False)
+                if session is not None:
+                    # the next run starts on this kernel, with its imports and calculators already loaded
+                    get_kernel_pool().release(session)
 
                 if final_answer:
                     render_message(final_answer)
                     st.session_state.messages.append({"role": "assistant", "content": final_answer})
                 else:
                     st.warning("The agent did not produce a final answer.")
+                with st.expander("Timeline"):
+                    render_timeline(trace_id)
             
             os.remove(tmp_file_path)
 
@@ -119,4 +167,9 @@ if run_button:
                 os.remove(tmp_file_path)
 
 st.sidebar.markdown("---")
+with st.sidebar.expander("Calculator pool"):
+    # the calculators live in the kernels, not in the streamlit process
+    st.json(get_kernel_pool().calculator_stats())
+with st.sidebar.expander("Kernels"):
+    st.json(get_kernel_pool().stats())
 st.sidebar.info("Provide SMILES, a slab file, and a query, then click 'Run Agent'.")
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""Batched force evaluation and lock-step relaxation of many structures.
+
+Relaxing candidates one by one means one MACE forward pass on one small graph
+per optimizer step. Here all still-active structures are packed into a single
+batched graph per step; each structure keeps its own FIRE state and FixAtoms
+mask and leaves the batch as soon as it is converged.
+"""
+import numpy as np
+import ase
+from ase.calculators.singlepoint import SinglePointCalculator
+from ase.constraints import FixAtoms
+
+
+def is_batchable(calculator) -> bool:
+    """True if `calculator` is a MACECalculator whose models can evaluate a multi-graph batch."""
+    if not (hasattr(calculator, "models") and hasattr(calculator, "z_table")):
+        return False
+    from mace import data as mace_data
+    return hasattr(mace_data, "KeySpecification")
+
+def _mace_graph(calculator, atoms: ase.Atoms):
+    # same graph construction as MACECalculator._atoms_to_batch, without the single-graph batching
+    from mace import data as mace_data
+    from mace.tools import torch_tools
+
+    keyspec = mace_data.KeySpecification(
+        info_keys=calculator.info_keys, arrays_keys={**calculator.arrays_keys, calculator.charges_key: "charges"}
+    )
+    with torch_tools.default_dtype(calculator.default_dtype):
+        config = mace_data.config_from_atoms(atoms, key_specification=keyspec, head_name=calculator.head)
+        return mace_data.AtomicData.from_config(
+            config, z_table=calculator.z_table, cutoff=calculator.r_max, heads=calculator.available_heads
+        )
+
+def _mace_energy_forces(calculator, atoms_list: list):
+    from mace.tools import torch_geometric
+
+    graphs = [_mace_graph(calculator, atoms) for atoms in atoms_list]
+    batch_base = torch_geometric.Batch.from_data_list(graphs).to(calculator.device)
+    ptr = batch_base["ptr"].cpu().numpy()
+
+    energies, forces = 0., 0.
+    for model in calculator.models:
+        batch = batch_base.clone()
+        model_dtype = next(model.parameters()).dtype
+        for key in batch.keys:
+            value = batch[key]
+            if hasattr(value, "is_floating_point") and value.is_floating_point():
+                batch[key] = value.to(dtype=model_dtype)
+        out = model(batch.to_dict(), compute_stress=False, training=False)
+        energies = energies + out["energy"].detach().cpu().numpy().astype(float)
+        forces = forces + out["forces"].detach().cpu().numpy().astype(float)
+
+    n_models = len(calculator.models)
+    energies = energies / n_models * calculator.energy_units_to_eV
+    forces = forces / n_models * calculator.energy_units_to_eV / calculator.length_units_to_A
+    return energies, [forces[ptr[i]:ptr[i + 1]] for i in range(len(atoms_list))]
+
+def batched_energy_forces(calculator, atoms_list: list):
+    """Energies and unconstrained forces of several structures.
+    Args:
+        calculator: ase calculator; MACE calculators evaluate all structures in one forward pass,
+            any other calculator falls back to a loop
+        atoms_list: list of ase.Atoms
+    returns:
+        energies: np.ndarray of shape (N,) in eV
+        forces: list of np.ndarray of shape (n_atoms_i, 3) in eV/A
+    """
+    if not atoms_list:
+        return np.zeros(0), []
+    if is_batchable(calculator):
+        from src.tools.calculators import count_force_calls
+        count_force_calls(len(atoms_list))
+        return _mace_energy_forces(calculator, atoms_list)
+
+    energies, forces = [], []
+    for atoms in atoms_list:
+        atoms = atoms.copy()
+        atoms.calc = calculator
+        energies.append(atoms.get_potential_energy())
+        forces.append(atoms.get_forces(apply_constraint=False))
+    return np.array(energies), forces
+
+
+def fixed_mask(atoms: ase.Atoms) -> np.ndarray:
+    """Boolean mask of the atoms held in place by FixAtoms constraints."""
+    mask = np.zeros(len(atoms), dtype=bool)
+    for constraint in atoms.constraints:
+        if isinstance(constraint, FixAtoms):
+            mask[constraint.index] = True
+    return mask
+
+
+class _FIREState:
+    """Per-structure FIRE state, same parameters and update rule as ase.optimize.FIRE."""
+
+    def __init__(self, n_atoms: int, dt: float = 0.1, maxstep: float = 0.2, dtmax: float = 1.0,
+                 Nmin: int = 5, finc: float = 1.1, fdec: float = 0.5, astart: float = 0.1, fa: float = 0.99):
+        self.v = None
+        self.dt, self.maxstep, self.dtmax = dt, maxstep, dtmax
+        self.Nmin, self.finc, self.fdec = Nmin, finc, fdec
+        self.astart, self.a, self.fa = astart, astart, fa
+        self.Nsteps = 0
+        self.n_atoms = n_atoms
+
+    def step(self, forces: np.ndarray) -> np.ndarray:
+        if self.v is None:
+            self.v = np.zeros((self.n_atoms, 3))
+        else:
+            vf = np.vdot(forces, self.v)
+            if vf > 0.:
+                self.v = (1. - self.a) * self.v + self.a * forces / np.sqrt(np.vdot(forces, forces)) * np.sqrt(np.vdot(self.v, self.v))
+                if self.Nsteps > self.Nmin:
+                    self.dt = min(self.dt * self.finc, self.dtmax)
+                    self.a *= self.fa
+                self.Nsteps += 1
+            else:
+                self.v[:] = 0.
+                self.a = self.astart
+                self.dt *= self.fdec
+                self.Nsteps = 0
+
+        self.v += self.dt * forces
+        dr = self.dt * self.v
+        normdr = np.sqrt(np.vdot(dr, dr))
+        if normdr > self.maxstep:
+            dr = self.maxstep * dr / normdr
+        return dr
+
+
+def batch_relax(atoms_list: list, calculator, fmax: float = 0.01, steps: int = 1000, **fire_kwargs) -> list:
+    """Relax several structures in lock-step with one batched force call per step.
+    Args:
+        atoms_list: list of ase.Atoms, each with its own FixAtoms constraints
+        calculator: ase calculator used for all structures
+        fmax: float, convergence criterion on the largest force on a free atom (eV/A)
+        steps: int, maximum number of optimizer steps per structure
+        fire_kwargs: passed to the per-structure FIRE state (dt, maxstep, dtmax, ...)
+    returns:
+        list of relaxed ase.Atoms in input order; each carries a SinglePointCalculator with its
+        final energy/forces and atoms.info['relax_converged'], atoms.info['relax_steps']
+    """
+    relaxed = [atoms.copy() for atoms in atoms_list]
+    masks = [fixed_mask(atoms) for atoms in relaxed]
+    states = [_FIREState(len(atoms), **fire_kwargs) for atoms in relaxed]
+    n_steps = [0] * len(relaxed)
+    converged = [False] * len(relaxed)
+    last = [None] * len(relaxed)
+
+    active = list(range(len(relaxed)))
+    while active:
+        energies, forces = batched_energy_forces(calculator, [relaxed[i] for i in active])
+        still_active = []
+        for i, energy, f in zip(active, energies, forces):
+            last[i] = (energy, f)
+            f = f.copy()
+            f[masks[i]] = 0.
+            if np.sqrt((f ** 2).sum(axis=1).max(initial=0.)) < fmax:
+                converged[i] = True
+                continue
+            if n_steps[i] >= steps:
+                continue
+            relaxed[i].positions += states[i].step(f)
+            n_steps[i] += 1
+            still_active.append(i)
+        active = still_active
+
+    for i, atoms in enumerate(relaxed):
+        energy, forces = last[i]
+        atoms.calc = SinglePointCalculator(atoms, energy=float(energy), forces=forces)
+        atoms.info["relax_converged"] = converged[i]
+        atoms.info["relax_steps"] = n_steps[i]
+    return relaxed
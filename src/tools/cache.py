@@ -0,0 +1,239 @@
+"""Persistent, content-addressed cache of relaxation and MD results.
+
+Agents often re-issue the same `relax_atoms` / `md_run_atoms` call on an
+identical structure (after an error, on a rerun of `launch.sh`, from another
+Streamlit session). Results are stored as trajectory stores (run directories
+of `src.tools.trajstore`) named by a hash of the structure, constraints,
+calculator identity and run parameters; an sqlite index next to them tracks
+sizes and access times for LRU eviction and is safe to share between
+processes.
+
+Inspect the cache from the command line with:
+
+    python -m src.tools.cache stats
+    python -m src.tools.cache list
+    python -m src.tools.cache evict --max-bytes 500000000
+    python -m src.tools.cache clear
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import ase
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "adskrk", "results")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def _to_jsonable(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def atoms_hash(atoms: ase.Atoms, calculator: str, **params) -> str:
+    """Canonical sha256 of a structure and how it is going to be computed.
+    Args:
+        atoms: ase.Atoms, hashed through numbers, positions (rounded to 1e-6 A), cell, pbc and constraints
+        calculator: str, calculator identity, e.g. from `src.tools.calculators.calculator_identity`
+        params: run parameters (fmax, steps, temperature_K, ...)
+    returns:
+        str, hex digest
+    """
+    sha = hashlib.sha256()
+    sha.update(np.ascontiguousarray(atoms.numbers, dtype=np.int64).tobytes())
+    sha.update((np.round(atoms.positions, 6) + 0.).tobytes())
+    sha.update((np.round(np.asarray(atoms.cell), 6) + 0.).tobytes())
+    sha.update(np.asarray(atoms.pbc, dtype=bool).tobytes())
+    constraints = [c.todict() for c in atoms.constraints]
+    sha.update(json.dumps(constraints, sort_keys=True, default=_to_jsonable).encode())
+    sha.update(calculator.encode())
+    sha.update(json.dumps(params, sort_keys=True, default=_to_jsonable).encode())
+    return sha.hexdigest()
+
+
+class ResultCache:
+    """Size-bounded LRU store of trajectory stores (or single files) keyed by `atoms_hash`."""
+
+    def __init__(self, path: str = None, max_bytes: int = None):
+        self.path = path or os.environ.get("ADSKRK_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = int(max_bytes or os.environ.get("ADSKRK_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        os.makedirs(self.path, exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, kind TEXT, created REAL, last_access REAL, "
+                "size INTEGER, hits INTEGER DEFAULT 0, meta TEXT)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        db = sqlite3.connect(os.path.join(self.path, "index.sqlite"), timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    @staticmethod
+    def _size(path: str) -> int:
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        return os.path.getsize(path)
+
+    def _remove(self, key: str):
+        path = self._file(key)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(f"{path}.traj"):
+            # entry written before results were stored as trajectory stores
+            os.remove(f"{path}.traj")
+
+    def get(self, key: str) -> str:
+        """Path of the cached trajectory store for `key`, or None on a miss. Marks the entry as recently used."""
+        path = self._file(key)
+        with self._connect() as db:
+            found = db.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone()
+            if found is None or not os.path.exists(path):
+                return None
+            db.execute("UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+        return path
+
+    def get_meta(self, key: str) -> dict:
+        """Metadata stored with `key` by `put`, or an empty dict."""
+        with self._connect() as db:
+            row = db.execute("SELECT meta FROM entries WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0] or "{}") if row else {}
+
+    def put(self, key: str, trajectory: str, kind: str, **meta):
+        """Copy a finished trajectory into the cache and evict old entries if over budget.
+        Args:
+            key: str, from `atoms_hash`
+            trajectory: str, run directory of a `src.tools.trajstore` store (or a single file) to store
+            kind: str, e.g. 'relax' or 'md'
+            meta: small json-serializable description shown by `entries()`
+        """
+        path = self._file(key)
+        # copy next to the entry under a unique name, then rename: readers never see a partial entry
+        staging = tempfile.mkdtemp(dir=self.path, prefix=".put-")
+        try:
+            staged = os.path.join(staging, "new")
+            if os.path.isdir(trajectory):
+                shutil.copytree(trajectory, staged)
+            else:
+                shutil.copyfile(trajectory, staged)
+            size = self._size(staged)
+            if os.path.lexists(path):
+                # an entry stored earlier under this key is replaced; it is moved aside first because
+                # a directory cannot be renamed over an existing one
+                with contextlib.suppress(FileNotFoundError):
+                    os.rename(path, os.path.join(staging, "old"))
+            try:
+                os.rename(staged, path)
+            except OSError:
+                if not os.path.lexists(path):
+                    raise
+                # another process stored this key in the meantime: keep its entry and index row
+                return
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, created, last_access, size, hits, meta) VALUES (?, ?, ?, ?, ?, 0, ?)",
+                (key, kind, now, now, size, json.dumps(meta, default=_to_jsonable)),
+            )
+        self.evict()
+
+    def evict(self, max_bytes: int = None) -> int:
+        """Drop least recently used entries until the cache fits in `max_bytes`.
+        returns:
+            int, number of evicted entries
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        evicted = 0
+        with self._connect() as db:
+            rows = db.execute("SELECT key, size FROM entries ORDER BY last_access DESC").fetchall()
+            total = sum(size for _, size in rows)
+            while rows and total > max_bytes:
+                key, size = rows.pop()
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._remove(key)
+                total -= size
+                evicted += 1
+        return evicted
+
+    def clear(self):
+        """Remove every cached result."""
+        self.evict(max_bytes=0)
+
+    def entries(self) -> list:
+        """All entries, most recently used first, as a list of dicts."""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT key, kind, created, last_access, size, hits, meta FROM entries ORDER BY last_access DESC"
+            ).fetchall()
+        return [
+            {"key": key, "kind": kind, "created": created, "last_access": last_access,
+             "size": size, "hits": hits, "meta": json.loads(meta or "{}")}
+            for key, kind, created, last_access, size, hits, meta in rows
+        ]
+
+    def stats(self) -> dict:
+        """Number of entries, total size, hits and budget of the cache."""
+        with self._connect() as db:
+            n, size, hits = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM entries").fetchone()
+        return {"path": self.path, "entries": n, "size": size, "max_bytes": self.max_bytes, "hits": hits}
+
+
+_result_cache = None
+
+def get_result_cache() -> ResultCache:
+    """Process-wide `ResultCache`, created on first use from the ADSKRK_CACHE_* environment."""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache()
+    return _result_cache
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect the relaxation/MD result cache.")
+    parser.add_argument("--path", type=str, default=None, help="Cache directory (default: $ADSKRK_CACHE_DIR or ~/.cache/adskrk/results).")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Show entry count and total size.")
+    sub.add_parser("list", help="List entries, most recently used first.")
+    evict = sub.add_parser("evict", help="Evict least recently used entries.")
+    evict.add_argument("--max-bytes", type=int, required=True, help="Size to shrink the cache to.")
+    sub.add_parser("clear", help="Remove every entry.")
+    return parser.parse_args()
+
+def main_cli():
+    args = parse_args()
+    cache = ResultCache(path=args.path)
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), indent=2))
+    elif args.command == "list":
+        for entry in cache.entries():
+            print(f"{entry['key'][:16]}  {entry['kind']:<6} {entry['size']:>12d} B  hits={entry['hits']:<4d} "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_access']))}  {json.dumps(entry['meta'])}")
+    elif args.command == "evict":
+        print(f"evicted {cache.evict(max_bytes=args.max_bytes)} entries")
+    elif args.command == "clear":
+        cache.clear()
+        print("cache cleared")
+
+if __name__ == '__main__':
+    main_cli()
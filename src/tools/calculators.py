@@ -0,0 +1,193 @@
+"""Process-wide pool of ASE calculators.
+
+Loading a MACE foundation model (download check, checkpoint unpickling,
+moving weights to the device) takes seconds, which used to be paid on every
+`relax_atoms` / `md_run_atoms` call. Calculators are now loaded lazily once
+per (model, device, dtype, dispersion) key and reused by every tool call,
+agent session and Streamlit rerun living in the same process.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from ase.calculators.calculator import Calculator, all_changes
+
+from src.tools import tracing
+
+
+def _load_mace_mp(model: str, device: str, default_dtype: str, dispersion: bool):
+    from mace.calculators import mace_mp
+    return mace_mp(model=model, device=device, default_dtype=default_dtype, dispersion=dispersion)
+
+def _load_emt(model: str, device: str, default_dtype: str, dispersion: bool):
+    from ase.calculators.emt import EMT
+    return EMT()
+
+# model name -> loader; anything not listed here is handed to `mace_mp`
+# (e.g. "small", "medium", "large" or a path to a model file)
+CALCULATOR_LOADERS = {
+    "emt": _load_emt,
+}
+
+# models that never touch torch and always run on the cpu
+CPU_ONLY_MODELS = {"emt"}
+
+# structures evaluated by pooled calculators in this process; recorded by every tracing span
+_force_calls = 0
+_force_calls_lock = threading.Lock()
+
+def count_force_calls(n: int = 1):
+    global _force_calls
+    with _force_calls_lock:
+        _force_calls += n
+
+def force_calls() -> int:
+    return _force_calls
+
+tracing.register_counter("force_calls", force_calls)
+
+def _counted(calculator):
+    # count on the instance, so batched MACE evaluation and ase both still see the original calculator
+    calculate = calculator.calculate
+
+    def counted_calculate(*args, **kwargs):
+        count_force_calls()
+        return calculate(*args, **kwargs)
+    calculator.calculate = counted_calculate
+    return calculator
+
+# model used by the agent tools; ADSKRK_MODEL=emt runs every tool offline with a cheap calculator
+TOOLS_MODEL = os.environ.get("ADSKRK_MODEL", "medium")
+# cheap model of the loose first stage of two-stage screens: MACE-MP "small" when the tools use a larger
+# MACE-MP foundation model, otherwise the tools' model itself; ADSKRK_PRESCREEN_MODEL overrides it
+PRESCREEN_MODEL = os.environ.get("ADSKRK_PRESCREEN_MODEL") or ("small" if TOOLS_MODEL in ("medium", "large") else TOOLS_MODEL)
+
+
+def resolve_device(model: str, device: str = None) -> str:
+    """Pick the device a calculator should run on.
+    Args:
+        model: str, model name as understood by `get_calculator`
+        device: str or None, explicit device; None selects cuda when available
+    returns:
+        str, device name
+    """
+    if model in CPU_ONLY_MODELS:
+        return "cpu"
+    if device:
+        return str(device)
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def calculator_identity(model: str = "medium", default_dtype: str = "float32", dispersion: bool = False) -> str:
+    """Device independent name of a calculator configuration, used to key cached results."""
+    if model in CPU_ONLY_MODELS:
+        return str(model)
+    return f"mace_mp/{model}/{default_dtype}/dispersion={bool(dispersion)}"
+
+
+class CalculatorPool:
+    """Bounded LRU pool of loaded calculators with load-time and hit/miss stats.
+
+    Calculators are not thread safe (they cache results for the last atoms
+    they saw), so concurrent workers should live in separate processes, each
+    holding its own pool.
+    """
+
+    def __init__(self, max_size: int = 2):
+        self.max_size = max_size
+        self._calculators = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_times = {}
+
+    @staticmethod
+    def make_key(model: str = "medium", device: str = None, default_dtype: str = "float32", dispersion: bool = False) -> tuple:
+        """Normalized pool key (model, device, dtype, dispersion)."""
+        return (str(model), resolve_device(model, device), str(default_dtype), bool(dispersion))
+
+    def get(self, model: str = "medium", device: str = None, default_dtype: str = "float32", dispersion: bool = False):
+        """Return a cached calculator, loading it on first use.
+        Args:
+            model: str, "emt" or any model accepted by `mace_mp` ("small", "medium", "large", path)
+            device: str or None, None selects cuda when available
+            default_dtype: str, "float32" or "float64"
+            dispersion: bool, add D3 dispersion correction
+        returns:
+            ase calculator
+        """
+        key = self.make_key(model, device, default_dtype, dispersion)
+        with self._lock:
+            if key in self._calculators:
+                self.hits += 1
+                self._calculators.move_to_end(key)
+                return self._calculators[key]
+
+            self.misses += 1
+            loader = CALCULATOR_LOADERS.get(key[0], _load_mace_mp)
+            start = time.perf_counter()
+            with tracing.tracer.span("load_calculator", "model", model=key[0], device=key[1]):
+                calculator = _counted(loader(*key))
+            self.load_times[key] = self.load_times.get(key, 0.) + time.perf_counter() - start
+
+            self._calculators[key] = calculator
+            while len(self._calculators) > max(self.max_size, 1):
+                self._calculators.popitem(last=False)
+                self.evictions += 1
+            return calculator
+
+    def __contains__(self, key) -> bool:
+        return key in self._calculators
+
+    def __len__(self) -> int:
+        return len(self._calculators)
+
+    def clear(self):
+        """Drop every loaded calculator and reset the statistics."""
+        with self._lock:
+            self._calculators.clear()
+            self.hits = self.misses = self.evictions = 0
+            self.load_times = {}
+
+    def stats(self) -> dict:
+        """Summary of pool usage.
+        returns:
+            dict with 'size', 'max_size', 'hits', 'misses', 'evictions',
+            'total_load_time' (s) and per-key 'load_times' (s)
+        """
+        with self._lock:
+            return {
+                "size": len(self._calculators),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "total_load_time": sum(self.load_times.values()),
+                "load_times": {"/".join(map(str, k)): v for k, v in self.load_times.items()},
+                "loaded": ["/".join(map(str, k)) for k in self._calculators],
+            }
+
+
+calculator_pool = CalculatorPool(max_size=int(os.environ.get("ADSKRK_CALC_POOL_SIZE", 2)))
+
+class CountingCalculator(Calculator):
+    """Wrap an ase calculator and count how many structures it actually evaluates (`n_calls`)."""
+
+    def __init__(self, calculator):
+        self.implemented_properties = list(getattr(calculator, "implemented_properties", ["energy", "forces"]))
+        super().__init__()
+        self.calculator = calculator
+        self.n_calls = 0
+
+    def calculate(self, atoms=None, properties=("energy",), system_changes=all_changes):
+        super().calculate(atoms, properties, system_changes)
+        self.calculator.calculate(self.atoms, properties, system_changes)
+        self.results = dict(self.calculator.results)
+        self.n_calls += 1
+
+def get_calculator(model: str = "medium", device: str = None, default_dtype: str = "float32", dispersion: bool = False):
+    """Shortcut for `calculator_pool.get(...)` on the process-wide pool."""
+    return calculator_pool.get(model=model, device=device, default_dtype=default_dtype, dispersion=dispersion)
@@ -0,0 +1,135 @@
+"""Persistent library of fragment conformers.
+
+`Fragment(SMILES, to_initialize=n)` embeds and UFF-optimizes all n conformers
+with RDKit, and `get_fragment` used to do this again for every conformer
+index an agent tried, in every session. Conformer sets are now generated once
+per (surrogate SMILES, to_initialize, seed), aligned exactly like
+`Fragment.get_conformer` aligns them, and kept as one array of shape
+(n_conformers, n_atoms, 3) in memory and in a small .npz file. Any later call
+in any process picks a conformer by index from that array.
+
+Sets are keyed by the SMILES exactly as given, so a cached conformer is the
+one `Fragment(smiles)` returns, with atoms in the order of that SMILES.
+Equivalent spellings of a molecule (compare them with
+`canonical_surrogate_smiles`) order their atoms differently and get a set
+each.
+"""
+import functools
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import ase
+
+DEFAULT_CONFORMER_DIR = os.path.join(os.path.expanduser("~"), ".cache", "adskrk", "conformers")
+DEFAULT_SEED = 2104  # autoadsorbate.Fragment default
+
+
+@functools.lru_cache(maxsize=1024)
+def canonical_surrogate_smiles(smiles: str) -> str:
+    """RDKit canonical SMILES rooted at atom 0, so the surrogate marker stays first.
+    Two-atom 'S1S' markers and SMILES RDKit cannot parse are returned unchanged.
+    """
+    if smiles.startswith("S1S"):
+        return smiles
+    from rdkit import Chem, RDLogger
+    RDLogger.DisableLog("rdApp.*")
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return smiles
+    return Chem.MolToSmiles(mol, rootedAtAtom=0)
+
+def _generate(smiles: str, to_initialize: int, seed: int) -> tuple:
+    from autoadsorbate import Fragment
+    fragment = Fragment(smiles, to_initialize=to_initialize, random_seed=seed)
+    conformers = [fragment.get_conformer(i) for i in range(len(fragment.conformers))]
+    return conformers[0].numbers.copy(), np.stack([c.positions for c in conformers])
+
+
+class ConformerLibrary:
+    """Conformer sets keyed by (SMILES, to_initialize, seed), cached in memory and on disk."""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.environ.get("ADSKRK_CONFORMER_DIR", DEFAULT_CONFORMER_DIR)
+        self._sets = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.generated = 0
+
+    @staticmethod
+    def make_key(smiles: str, to_initialize: int = 1, seed: int = DEFAULT_SEED) -> tuple:
+        # not canonicalized: a canonical SMILES orders the atoms differently from the caller's
+        return (smiles, int(to_initialize), int(seed))
+
+    def _file(self, key: tuple) -> str:
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.path, f"{name}.npz")
+
+    def conformer_set(self, smiles: str, to_initialize: int = 1, seed: int = DEFAULT_SEED) -> tuple:
+        """Atomic numbers (n_atoms,) and aligned positions (n_conformers, n_atoms, 3), generated on first use."""
+        key = self.make_key(smiles, to_initialize, seed)
+        with self._lock:
+            if key in self._sets:
+                self.hits += 1
+                return self._sets[key]
+
+            path = self._file(key)
+            if os.path.exists(path):
+                with np.load(path) as data:
+                    entry = (data["numbers"], data["positions"])
+                self.disk_hits += 1
+            else:
+                entry = _generate(key[0], to_initialize, seed)
+                self.generated += 1
+                os.makedirs(self.path, exist_ok=True)
+                # write then rename, so that other processes never read a partial file
+                tmp = f"{path}.{os.getpid()}.tmp.npz"
+                np.savez(tmp, numbers=entry[0], positions=entry[1], smiles=key[0])
+                os.replace(tmp, path)
+            self._sets[key] = entry
+            return entry
+
+    def get_conformer(self, smiles: str, i=0, to_initialize: int = 1, seed: int = DEFAULT_SEED) -> ase.Atoms:
+        """The i-th conformer as ase.Atoms, marker atom at the origin; float `i` in [0, 1] picks by fraction
+        of the set, as in `Fragment.get_conformer`."""
+        numbers, positions = self.conformer_set(smiles, to_initialize, seed)
+        if isinstance(i, float):
+            if not 0. <= i <= 1.:
+                raise ValueError("Float index must be between 0 and 1.")
+            i = min(int(i * len(positions)), len(positions) - 1)
+        elif i >= len(positions):
+            raise KeyError(f"Index {i} is larger than number of initialized conformers ({len(positions)}).")
+        atoms = ase.Atoms(numbers=numbers, positions=positions[i])
+        atoms.info["smiles"] = smiles
+        return atoms
+
+    def prefetch(self, smiles_list: list, to_initialize: int = 1, seed: int = DEFAULT_SEED, n_workers: int = 1):
+        """Generate the conformer sets of several SMILES ahead of time, in `n_workers` processes if > 1."""
+        todo = [s for s in dict.fromkeys(smiles_list) if not os.path.exists(self._file(self.make_key(s, to_initialize, seed)))]
+        if n_workers > 1 and len(todo) > 1:
+            # each worker writes its .npz file, which this process then reads back
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx) as executor:
+                list(executor.map(_prefetch_one, todo, [to_initialize] * len(todo), [seed] * len(todo), [self.path] * len(todo)))
+        for smiles in smiles_list:
+            self.conformer_set(smiles, to_initialize, seed)
+
+    def stats(self) -> dict:
+        return {"in_memory": len(self._sets), "hits": self.hits, "disk_hits": self.disk_hits, "generated": self.generated}
+
+def _prefetch_one(smiles: str, to_initialize: int, seed: int, path: str):
+    ConformerLibrary(path).conformer_set(smiles, to_initialize, seed)
+
+
+_conformer_library = None
+
+def get_conformer_library() -> ConformerLibrary:
+    """Process-wide conformer library (location from ADSKRK_CONFORMER_DIR)."""
+    global _conformer_library
+    if _conformer_library is None:
+        _conformer_library = ConformerLibrary()
+    return _conformer_library
@@ -0,0 +1,116 @@
+"""Frozen-region embedding: run dynamics on the atoms near the adsorbate only.
+
+`relax_atoms` and `md_run_atoms` hold the bottom of the slab fixed but still
+evaluate the whole structure on every step. On large supercells most of that
+work goes to atoms that never move and are far from the adsorbate. An
+`Embedding` carves out a smaller subsystem from the full structure:
+
+- the free atoms; with `free_radius`, slab atoms farther than that from the
+  adsorbate are frozen as well;
+- a buffer of fixed atoms within `buffer` of any free atom, by default the
+  receptive field of the calculator (`receptive_field`).
+
+The optimizer or MD integrator then runs on the subsystem alone, with the
+outer region frozen. Each subsystem frame is expanded back into the full
+structure (`expand`). Atoms outside the subsystem keep their positions and
+get zero forces. Energies are shifted by a constant, the full-system energy
+minus the subsystem energy of the starting structure (`calibrate`), so they
+are on the scale of full-system energies.
+
+    python -m benchmarks.bench_embedding --model emt --repeats 2 3 4
+"""
+import numpy as np
+import ase
+from ase.calculators.singlepoint import SinglePointCalculator
+from ase.constraints import FixAtoms
+from ase.neighborlist import neighbor_list
+
+from src.tools.batch import fixed_mask
+
+# buffer in angstrom for calculators whose receptive field is unknown
+DEFAULT_BUFFER = 10.
+
+
+def receptive_field(calculator, atoms: ase.Atoms = None) -> float:
+    """Distance in angstrom over which a calculator sees other atoms: r_max times the number of interactions
+    for MACE, the neighbor cutoff for EMT (needs `atoms`), `DEFAULT_BUFFER` otherwise."""
+    if hasattr(calculator, "models") and hasattr(calculator, "r_max"):
+        return float(calculator.r_max) * max(int(model.num_interactions) for model in calculator.models)
+    if hasattr(calculator, "_calc_cutoff") and atoms is not None:
+        return float(calculator._calc_cutoff(atoms)[1])
+    return DEFAULT_BUFFER
+
+
+class Embedding:
+    """Subsystem of a structure: its free atoms plus the fixed atoms within `buffer` of them.
+    Args:
+        atoms: ase.Atoms, full structure with FixAtoms constraints; atoms.info['n_slab'] marks the adsorbate
+        buffer: float, fixed atoms closer than this (angstrom) to a free atom are kept in the subsystem
+        free_radius: float or None, also freeze slab atoms farther than this (angstrom) from every adsorbate atom
+    """
+
+    def __init__(self, atoms: ase.Atoms, buffer: float, free_radius: float = None):
+        self.atoms = atoms.copy()
+        self.atoms.calc = None
+        self.buffer = float(buffer)
+        n_slab = atoms.info.get("n_slab")
+
+        fixed = fixed_mask(atoms)
+        if free_radius is not None and n_slab is not None and len(atoms) > n_slab:
+            i, j = neighbor_list("ij", atoms, float(free_radius))
+            near = np.zeros(len(atoms), dtype=bool)
+            near[j[i >= n_slab]] = True
+            fixed[:n_slab] |= ~near[:n_slab]
+        self.fixed = fixed
+        self.atoms.constraints = [self.constraint]
+
+        region = ~fixed
+        i, j = neighbor_list("ij", atoms, self.buffer)
+        region[j[~fixed[i]]] = True
+        self.indices = np.flatnonzero(region)
+
+        subsystem = atoms[self.indices]
+        subsystem.calc = None
+        subsystem.constraints = [FixAtoms(mask=fixed[self.indices])]
+        if n_slab is not None:
+            subsystem.info["n_slab"] = int((self.indices < n_slab).sum())
+        self.subsystem = subsystem
+        self.offset = 0.
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    @property
+    def constraint(self) -> FixAtoms:
+        """FixAtoms of the full structure, including the atoms frozen by `free_radius`."""
+        return FixAtoms(mask=self.fixed)
+
+    def calibrate(self, calculator) -> float:
+        """Set the energy offset from one full-system and one subsystem evaluation of the starting structure."""
+        full = self.atoms.copy()
+        full.calc = calculator
+        sub = self.subsystem.copy()
+        sub.calc = calculator
+        self.offset = full.get_potential_energy() - sub.get_potential_energy()
+        return self.offset
+
+    def expand(self, sub: ase.Atoms) -> ase.Atoms:
+        """Full-structure frame of the subsystem state `sub`, with a SinglePointCalculator holding the
+        shifted subsystem energy and the subsystem forces (zero outside the subsystem)."""
+        frame = self.atoms.copy()
+        self.write_back(frame, sub)
+        frame.info.update({k: v for k, v in sub.info.items() if k != "n_slab"})
+        forces = np.zeros((len(frame), 3))
+        forces[self.indices] = sub.get_forces(apply_constraint=False)
+        frame.calc = SinglePointCalculator(frame, energy=sub.get_potential_energy() + self.offset, forces=forces)
+        return frame
+
+    def write_back(self, atoms: ase.Atoms, sub: ase.Atoms):
+        """Copy the positions and momenta of the subsystem into the full structure `atoms`."""
+        positions = atoms.positions.copy()
+        positions[self.indices] = sub.positions
+        atoms.set_positions(positions, apply_constraint=False)
+        if sub.has("momenta"):
+            momenta = np.zeros((len(atoms), 3))
+            momenta[self.indices] = sub.get_momenta()
+            atoms.set_momenta(momenta, apply_constraint=False)
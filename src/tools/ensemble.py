@@ -0,0 +1,179 @@
+"""Lock-step Langevin MD of several replicas for binding-stability statistics.
+
+One `md_run_atoms` trajectory is one random velocity draw, so whether the
+adsorbate stays bound is judged on a single noisy sample, and running
+replicas one after another multiplies the wall time. `ensemble_langevin`
+advances N replicas (different seeds, temperatures or starting structures)
+together: every MD step is one batched force evaluation of all replicas still
+running (see `src.tools.batch`). No frames are kept; each replica only
+accumulates running sums of its adsorbate observables, from which
+`summarize_replicas` derives the desorption probability, residence time and
+mean binding distance of the ensemble. A replica stopped because its
+adsorbate dissociated or its forces diverged is censored: whether and when
+it would have desorbed is unknown, so it is counted apart and left out of the
+desorption probability and residence time.
+
+The integrator is BAOAB Langevin with the friction and timestep conventions
+of `ase.md.langevin.Langevin` (friction in inverse ASE time units); atoms held
+by FixAtoms do not move.
+"""
+import numpy as np
+import pandas as pd
+import ase
+from ase import units
+from ase.calculators.singlepoint import SinglePointCalculator
+
+from src.tools.batch import batched_energy_forces, fixed_mask
+from src.tools.md import adsorbate_observables
+from src.tools.observers import ObserverSet, default_observers
+
+# stop reasons after which the replica's desorption is unobserved
+CENSORED_REASONS = ("dissociated", "diverged")
+
+
+class _Replica:
+    """State and running statistics of one replica."""
+
+    def __init__(self, atoms: ase.Atoms, temperature_K: float, seed: int, n_slab: int, observers: ObserverSet):
+        self.atoms = atoms
+        self.temperature_K = temperature_K
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.n_slab = n_slab
+        self.observers = observers
+        self.free = ~fixed_mask(atoms)
+        self.masses = atoms.get_masses()[:, None]
+        self.kT = units.kB * temperature_K
+        self.velocities = np.sqrt(self.kT / self.masses) * self.rng.standard_normal((len(atoms), 3)) * self.free[:, None]
+        self.forces = None
+        self.steps = 0
+        self.stop = None
+        self.sums = {}
+        self.n_samples = 0
+        self.first_desorbed_step = None
+        self.last = {}
+
+    def sample(self, energy: float, step: int, desorption_distance: float):
+        kinetic = 0.5 * (self.masses * self.velocities ** 2).sum()
+        values = {"energy": energy, "temperature_K": 2 * kinetic / (3 * max(int(self.free.sum()), 1) * units.kB)}
+        if self.n_slab is not None and len(self.atoms) > self.n_slab:
+            observables = adsorbate_observables(self.atoms, self.n_slab, desorption_distance)
+            if observables.pop("desorbed") and self.first_desorbed_step is None:
+                self.first_desorbed_step = step
+            values.update(observables)
+        for k, v in values.items():
+            total, squares = self.sums.get(k, (0., 0.))
+            self.sums[k] = (total + v, squares + v * v)
+        self.n_samples += 1
+        self.last = values
+
+    def row(self, timestep_fs: float) -> dict:
+        row = {"replica": None, "seed": self.seed, "temperature_K": self.temperature_K, "steps": self.steps,
+               "stop_reason": (self.stop or {}).get("reason", "completed")}
+        if "binding_distance" in self.sums:
+            residence = self.first_desorbed_step if self.first_desorbed_step is not None else self.steps
+            row.update(desorbed=self.first_desorbed_step is not None, first_desorbed_step=self.first_desorbed_step,
+                       residence_time_fs=residence * timestep_fs, censored=row["stop_reason"] in CENSORED_REASONS)
+        for k, (total, squares) in self.sums.items():
+            mean = total / self.n_samples
+            row[f"mean_{k}"] = mean
+            if k in ("binding_distance", "adsorbate_height"):
+                row[f"std_{k}"] = float(np.sqrt(max(squares / self.n_samples - mean ** 2, 0.)))
+                row[f"final_{k}"] = self.last[k]
+        return row
+
+
+def ensemble_langevin(replicas: list, calculator, steps: int, temperatures_K: list, seeds: list, timestep_fs: float = 1.0,
+                      friction: float = 0.002, stride: int = 1, desorption_distance: float = 3.0,
+                      early_stop: bool = True) -> pd.DataFrame:
+    """Run Langevin MD of all `replicas` in lock-step.
+    Args:
+        replicas: list of ase.Atoms (with FixAtoms constraints and, for the adsorbate observables, info['n_slab'])
+        calculator: ase calculator shared by all replicas; MACE evaluates them in one batched forward pass
+        steps: int, MD steps per replica
+        temperatures_K, seeds: one temperature and one random seed (velocities and noise) per replica
+        timestep_fs, friction: as in `ase.md.langevin.Langevin`
+        stride: int, sample the observables every `stride` steps
+        desorption_distance: float, binding distance in angstrom above which the adsorbate counts as desorbed
+        early_stop: bool, a replica leaves the batch once it desorbed, dissociated or diverged
+    returns:
+        pandas.DataFrame, one row per replica (see `summarize_replicas`)
+    """
+    dt = timestep_fs * units.fs
+    states = []
+    for atoms, temperature_K, seed in zip(replicas, temperatures_K, seeds):
+        atoms = atoms.copy()
+        n_slab = atoms.info.get("n_slab")
+        observers = default_observers(atoms, kind="md", max_distance=desorption_distance) if early_stop else ObserverSet()
+        states.append(_Replica(atoms, temperature_K, seed, n_slab, observers))
+
+    def evaluate(active):
+        energies, forces = batched_energy_forces(calculator, [states[i].atoms for i in active])
+        for i, energy, f in zip(active, energies, forces):
+            state = states[i]
+            state.forces = f * state.free[:, None]
+            state.atoms.calc = SinglePointCalculator(state.atoms, energy=float(energy), forces=f)
+        return energies
+
+    active = list(range(len(states)))
+    for i, energy in zip(active, evaluate(active)):
+        states[i].sample(float(energy), 0, desorption_distance)
+    c1 = np.exp(-friction * dt)
+    for step in range(1, steps + 1):
+        if not active:
+            break
+        for i in active:
+            # B A O A: half kick, half drift, thermostat, half drift
+            state = states[i]
+            state.velocities += 0.5 * dt * state.forces / state.masses
+            state.atoms.positions += 0.5 * dt * state.velocities
+            noise = state.rng.standard_normal(state.velocities.shape) * state.free[:, None]
+            state.velocities = c1 * state.velocities + np.sqrt((1 - c1 ** 2) * state.kT / state.masses) * noise
+            state.atoms.positions += 0.5 * dt * state.velocities
+        energies = evaluate(active)
+        still_active = []
+        for i, energy in zip(active, energies):
+            state = states[i]
+            state.velocities += 0.5 * dt * state.forces / state.masses  # B: second half kick
+            state.steps = step
+            stop = state.observers(state.atoms, step)
+            if step % stride == 0 or stop or step == steps:
+                state.sample(float(energy), step, desorption_distance)
+            if stop:
+                state.stop = state.observers.report("completed")
+                continue
+            still_active.append(i)
+        active = still_active
+
+    rows = []
+    for i, state in enumerate(states):
+        row = state.row(timestep_fs)
+        row["replica"] = i
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def summarize_replicas(table: pd.DataFrame) -> dict:
+    """Ensemble statistics of a replica table from `ensemble_langevin`.
+    returns:
+        dict with 'n_replicas', 'stop_reasons' (count per reason) and, if the adsorbate is known, 'n_censored'
+        (replicas stopped as dissociated or diverged), 'desorption_probability' and its standard error and
+        'mean_residence_time_fs' over the other replicas (runs that stayed bound count with their full length, so
+        it is a lower bound; NaN if every replica is censored) and the mean and spread over replicas of the mean
+        binding distance; with several temperatures also the same per temperature under 'by_temperature'
+    """
+    summary = {"n_replicas": len(table), "stop_reasons": table["stop_reason"].value_counts().to_dict()}
+    if "desorbed" in table:
+        observed = table[~table["censored"].astype(bool)]
+        p = float(observed["desorbed"].mean()) if len(observed) else float("nan")
+        summary.update({
+            "n_censored": len(table) - len(observed),
+            "desorption_probability": p,
+            "desorption_probability_stderr": float(np.sqrt(p * (1 - p) / len(observed))) if len(observed) else float("nan"),
+            "mean_residence_time_fs": float(observed["residence_time_fs"].mean()) if len(observed) else float("nan"),
+            "mean_binding_distance": float(table["mean_binding_distance"].mean()),
+            "std_binding_distance": float(table["mean_binding_distance"].std(ddof=0)),
+        })
+    summary["mean_energy"] = float(table["mean_energy"].mean())
+    if table["temperature_K"].nunique() > 1:
+        summary["by_temperature"] = {float(t): summarize_replicas(group) for t, group in table.groupby("temperature_K")}
+    return summary
@@ -0,0 +1,145 @@
+"""Surface-layer detection and bottom-layer constraints.
+
+The tools used to fix every atom below half the cell height, built atom by
+atom in Python. That rule is slow on large supercells and wrong for slabs
+that are not centred in z or that wrap around the periodic boundary. Here
+the slab atoms are grouped into layers in one numpy pass. The heights along
+the surface normal are sorted, split wherever the gap exceeds `tol`, and
+unwrapped across the vacuum for periodic cells. Callers then fix the bottom
+N layers, everything deeper than a depth below the top layer, or the bottom
+fraction of the slab thickness. Results are cached per slab geometry.
+
+Layers are only detected among the slab atoms, so the number of slab atoms
+has to be known (`n_slab`, set by `get_ads_slab`); otherwise the default
+constraint is the old half-cell rule, and a `depth` below the top layer is
+refused, since an adsorbate would be taken for the top layer.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import ase
+from ase.constraints import FixAtoms
+
+
+def _surface_heights(atoms: ase.Atoms) -> np.ndarray:
+    """Atom heights along the normal of the a-b plane, unwrapped so that the vacuum is above the slab."""
+    cell = np.asarray(atoms.cell)
+    normal = np.cross(cell[0], cell[1])
+    norm = np.linalg.norm(normal)
+    if norm < 1e-8:
+        return atoms.positions[:, 2].copy()
+    normal /= norm
+    heights = atoms.positions @ normal
+    if not atoms.pbc[2] or len(heights) < 2:
+        return heights
+    period = abs(cell[2] @ normal)
+    heights = np.mod(heights, period)
+    order = np.sort(heights)
+    gaps = np.append(np.diff(order), order[0] + period - order[-1])
+    start = order[(np.argmax(gaps) + 1) % len(order)]  # first height after the largest gap, i.e. the vacuum
+    return np.where(heights < start, heights + period, heights)
+
+
+class Layers:
+    """Layer assignment of the slab atoms of a structure; layer 0 is the bottom one."""
+
+    def __init__(self, labels: np.ndarray, heights: np.ndarray, n_atoms: int):
+        self.labels = labels            # (n_slab,) layer of every slab atom
+        self.heights = heights          # (n_layers,) mean height of every layer
+        self.n_atoms = n_atoms
+
+    @property
+    def n_layers(self) -> int:
+        return len(self.heights)
+
+    @property
+    def thickness(self) -> float:
+        return float(self.heights[-1] - self.heights[0]) if self.n_layers else 0.
+
+    def _atoms_mask(self, fixed_layers: np.ndarray) -> np.ndarray:
+        mask = np.zeros(self.n_atoms, dtype=bool)
+        mask[:len(self.labels)] = fixed_layers[self.labels]
+        return mask
+
+    def bottom(self, n_layers: int) -> np.ndarray:
+        """Mask (n_atoms,) of the atoms in the lowest `n_layers` layers."""
+        return self._atoms_mask(np.arange(self.n_layers) < n_layers)
+
+    def deeper_than(self, depth: float) -> np.ndarray:
+        """Mask of the atoms whose layer lies more than `depth` angstrom below the top layer."""
+        return self._atoms_mask(self.heights < self.heights[-1] - depth)
+
+    def bottom_fraction(self, fraction: float = 0.5) -> np.ndarray:
+        """Mask of the atoms whose layer lies in the lowest `fraction` of the slab thickness."""
+        return self._atoms_mask(self.heights < self.heights[0] + fraction * self.thickness)
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 64
+
+def _cache_key(atoms: ase.Atoms, n_slab: int, tol: float) -> str:
+    sha = hashlib.sha1()
+    sha.update(atoms.numbers[:n_slab].tobytes())
+    sha.update((np.round(atoms.positions[:n_slab], 2) + 0.).tobytes())
+    sha.update((np.round(np.asarray(atoms.cell), 6) + 0.).tobytes())
+    sha.update(np.asarray(atoms.pbc, dtype=bool).tobytes())
+    sha.update(f"{len(atoms)}/{tol}".encode())
+    return sha.hexdigest()
+
+def detect_layers(atoms: ase.Atoms, n_slab: int = None, tol: float = 0.3) -> Layers:
+    """Group slab atoms into layers.
+    Args:
+        atoms: ase.Atoms, slab or adsorbate on slab
+        n_slab: int or None, number of slab atoms (they come first); defaults to atoms.info['n_slab'],
+            as set by `get_ads_slab`, or all atoms. Adsorbate atoms are never part of a layer.
+        tol: float, height gap in angstrom that separates two layers
+    returns:
+        Layers
+    """
+    n_slab = atoms.info.get("n_slab", len(atoms)) if n_slab is None else n_slab
+    key = _cache_key(atoms, n_slab, tol)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    heights = _surface_heights(atoms[:n_slab]) if n_slab else np.zeros(0)
+    order = np.argsort(heights, kind="stable")
+    sorted_labels = np.concatenate([[0], np.cumsum(np.diff(heights[order]) > tol)]) if n_slab else np.zeros(0, dtype=int)
+    labels = np.empty(n_slab, dtype=int)
+    labels[order] = sorted_labels
+    counts = np.bincount(labels)
+    layers = Layers(labels, np.bincount(labels, weights=heights) / np.maximum(counts, 1), len(atoms))
+
+    with _cache_lock:
+        _cache[key] = layers
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return layers
+
+def fix_bottom(atoms: ase.Atoms, n_layers: int = None, depth: float = None, fraction: float = 0.5,
+               n_slab: int = None, tol: float = 0.3) -> FixAtoms:
+    """FixAtoms constraint for the bottom of the slab.
+    Exactly one rule applies, in this order: the lowest `n_layers` layers; every layer more than
+    `depth` angstrom below the top layer; the layers in the lowest `fraction` of the slab thickness
+    (0.5 by default, which matches the old half-cell rule for slabs centred in the cell).
+    If the number of slab atoms is unknown (no `n_slab` argument and no atoms.info['n_slab']), adsorbate
+    atoms cannot be told apart from the slab; the default rule then falls back to the old half-cell rule,
+    fixing every atom below half the cell height, and `depth` raises a ValueError.
+    """
+    if n_slab is None and "n_slab" not in atoms.info and n_layers is None:
+        if depth is not None:
+            raise ValueError("A fixed depth needs the number of slab atoms, otherwise an adsorbate counts as the top layer: "
+                             "pass n_slab (len(slab) for a bare slab) or place the adsorbate with get_ads_slab.")
+        return FixAtoms(mask=atoms.positions[:, 2] < atoms.cell[2][2] * .5)
+    layers = detect_layers(atoms, n_slab=n_slab, tol=tol)
+    if n_layers is not None:
+        mask = layers.bottom(n_layers)
+    elif depth is not None:
+        mask = layers.deeper_than(depth)
+    else:
+        mask = layers.bottom_fraction(fraction)
+    return FixAtoms(mask=mask)
@@ -0,0 +1,134 @@
+"""Streaming molecular dynamics with on-the-fly adsorbate observables.
+
+Frames are produced one at a time from `Dynamics.irun`, optionally thinned by
+a stride, written once to the run's trajectory store (`src.tools.trajstore`)
+and handed to the caller; the adsorbate height, binding-atom distance and
+desorption flag are computed on every yielded frame, so only a small table of
+numbers has to be kept in memory for long runs.
+"""
+import numpy as np
+import pandas as pd
+import ase
+from ase import units
+from ase.calculators.singlepoint import SinglePointCalculator
+from ase.md.langevin import Langevin
+
+from src.tools.trajstore import TrajectoryWriter
+
+
+def adsorbate_observables(atoms: ase.Atoms, n_slab: int, desorption_distance: float = 3.0) -> dict:
+    """Geometric descriptors of the adsorbate of one frame.
+    Args:
+        atoms: ase.Atoms, slab atoms first, adsorbate atoms after index `n_slab`;
+            the first adsorbate atom is the binding atom, as placed by `get_ads_slab`
+        n_slab: int, number of slab atoms
+        desorption_distance: float, binding distance in angstrom above which the adsorbate counts as desorbed
+    returns:
+        dict with
+        - 'adsorbate_height': lowest adsorbate atom z minus highest slab atom z (A);
+        - 'binding_distance': distance of the binding atom to its closest slab atom, periodic images included (A);
+        - 'desorbed': bool, binding_distance > desorption_distance.
+    """
+    z = atoms.positions[:, 2]
+    binding_distance = atoms.get_distances(n_slab, np.arange(n_slab), mic=True).min()
+    return {
+        "adsorbate_height": float(z[n_slab:].min() - z[:n_slab].max()),
+        "binding_distance": float(binding_distance),
+        "desorbed": bool(binding_distance > desorption_distance),
+    }
+
+def _snapshot(atoms: ase.Atoms) -> ase.Atoms:
+    frame = atoms.copy()
+    frame.calc = SinglePointCalculator(frame, energy=atoms.get_potential_energy(), forces=atoms.get_forces())
+    return frame
+
+def langevin_frames(atoms: ase.Atoms, steps: int, temperature_K: float, stride: int = 1, store_path: str = None,
+                    timestep_fs: float = 1.0, friction: float = 0.002, observers=None, embedding=None):
+    """Run Langevin MD on `atoms` (calculator already attached) and yield every `stride`-th frame.
+    The initial frame is yielded first; each yielded frame (with its momenta and MD step)
+    is also appended to the trajectory store at `store_path` if given.
+    `observers` (see `src.tools.observers.ObserverSet`) is checked after every step; the run ends,
+    with the triggering frame yielded, as soon as it returns a reason code.
+    If `atoms` is the subsystem of an `src.tools.embedding.Embedding`, pass it as `embedding`:
+    frames are then expanded to the full structure before they are stored and yielded.
+    """
+    dyn = Langevin(atoms, timestep=timestep_fs * units.fs, temperature_K=temperature_K, friction=friction)
+    template = embedding.atoms if embedding is not None else atoms
+    traj = TrajectoryWriter(store_path, template, fields=("positions", "forces", "energy", "momenta")) if store_path else None
+    try:
+        for step, _ in enumerate(dyn.irun(steps)):
+            stop = observers is not None and step > 0 and observers(atoms, step)
+            if step % stride and not stop:
+                continue
+            frame = embedding.expand(atoms) if embedding is not None else _snapshot(atoms)
+            frame.info["md_step"] = step
+            if traj is not None:
+                traj.write(frame, md_step=step)
+            yield frame
+            if stop:
+                break
+    finally:
+        if traj is not None:
+            traj.close()
+
+
+class MDStream:
+    """Iterator over MD frames that records adsorbate observables as frames pass through.
+
+    Iterate over it to get the frames (ase.Atoms); `observables` holds one row
+    per frame seen so far and `summary()` condenses it. `on_finish` is called
+    once the stream has been fully consumed. If the run was cut short by an
+    observer, `stop` holds its structured reason. `trajectory` is the run
+    directory the frames are stored in (see `src.tools.trajstore`), if any.
+    """
+
+    def __init__(self, frames, n_slab: int = None, desorption_distance: float = 3.0, stride: int = 1, on_finish=None, observers=None,
+                 trajectory: str = None):
+        self._frames = frames
+        self.trajectory = trajectory
+        self.stride = stride
+        self.observers = observers
+        self.n_slab = n_slab
+        self.desorption_distance = desorption_distance
+        self._on_finish = on_finish
+        self._rows = []
+        self.finished = False
+
+    def __iter__(self):
+        for i, frame in enumerate(self._frames):
+            row = {"frame": i, "md_step": frame.info.get("md_step", i * self.stride), "energy": frame.get_potential_energy()}
+            if self.n_slab is not None and len(frame) > self.n_slab:
+                row.update(adsorbate_observables(frame, self.n_slab, self.desorption_distance))
+            self._rows.append(row)
+            yield frame
+        self.finished = True
+        if self._on_finish is not None:
+            self._on_finish()
+
+    @property
+    def observables(self) -> pd.DataFrame:
+        """Per-frame table with 'frame', 'md_step', 'energy' and, if the adsorbate is known,
+        'adsorbate_height', 'binding_distance' and 'desorbed'."""
+        return pd.DataFrame(self._rows)
+
+    @property
+    def stop(self) -> dict:
+        """{'reason', 'step', 'details'}: 'completed' for a full run, otherwise the reason code of the observer that ended it."""
+        if self.observers is None:
+            return {"reason": "completed" if self.finished else None, "step": None, "details": {}}
+        return self.observers.report("completed" if self.finished else None)
+
+    def summary(self) -> dict:
+        """Frame count, stop reason, mean/final binding distance and the first MD step at which the adsorbate desorbed (None if it stayed)."""
+        table = self.observables
+        summary = {"n_frames": len(table), "finished": self.finished, "stop_reason": self.stop["reason"]}
+        if "binding_distance" in table:
+            desorbed = table.loc[table["desorbed"], "md_step"]
+            summary.update({
+                "mean_binding_distance": float(table["binding_distance"].mean()),
+                "final_binding_distance": float(table["binding_distance"].iloc[-1]),
+                "final_adsorbate_height": float(table["adsorbate_height"].iloc[-1]),
+                "desorbed": bool(len(desorbed)),
+                "first_desorbed_step": int(desorbed.iloc[0]) if len(desorbed) else None,
+            })
+        return summary
@@ -0,0 +1,172 @@
+"""Verlet neighbor lists with a skin for MACE relaxations and MD.
+
+`MACECalculator` builds the neighbor graph of the whole structure from scratch
+on every call, although between two optimizer or MD steps the atoms barely
+move and most of the slab is held in place by FixAtoms. `SkinNeighborCalculator`
+keeps a list of candidate pairs within `r_max + skin` and on each step only
+filters them down to the pairs within `r_max`. The list is rebuilt when a
+free atom has moved more than half the skin since the last build, or when
+the cell, the elements or the fixed atoms change.
+
+Pairs of two fixed atoms keep their distance as long as the fixed atoms stay
+in place. They are filtered once per build and skipped in the per-step
+filter. The remaining pairs are the only ones whose distances are recomputed.
+
+    python -m benchmarks.bench_neighbors --model medium
+"""
+import os
+
+import numpy as np
+import ase
+from ase.calculators.calculator import Calculator, all_changes
+
+from src.tools.batch import fixed_mask, is_batchable
+
+# skin in angstrom of the neighbor lists used by the tools; 0 turns the wrapper off
+NEIGHBOR_SKIN = float(os.environ.get("ADSKRK_NEIGHBOR_SKIN", 1.0))
+
+
+class VerletList:
+    """Candidate pairs within `cutoff + skin`, filtered to `cutoff` on every `pairs` call.
+
+    Pairs follow the MACE convention: for an edge (i, j) with shift vector s,
+    the edge vector is positions[j] - positions[i] + s.
+    """
+
+    def __init__(self, cutoff: float, skin: float = 1.0):
+        self.cutoff = float(cutoff)
+        self.skin = float(skin)
+        self.rebuilds = 0
+        self.calls = 0
+        self._reference = None
+
+    def needs_rebuild(self, atoms: ase.Atoms, fixed: np.ndarray) -> bool:
+        """True if the candidate pairs are no longer guaranteed to contain every pair within the cutoff."""
+        ref = self._reference
+        if ref is None:
+            return True
+        if (len(atoms) != len(ref["numbers"]) or not np.array_equal(atoms.numbers, ref["numbers"])
+                or not np.array_equal(atoms.pbc, ref["pbc"]) or not np.array_equal(atoms.cell.array, ref["cell"])
+                or not np.array_equal(fixed, ref["fixed"])):
+            return True
+        displacement = atoms.positions - ref["positions"]
+        if np.any(displacement[fixed]):
+            return True
+        return (displacement ** 2).sum(axis=1).max(initial=0.) > (self.skin / 2) ** 2
+
+    def build(self, atoms: ase.Atoms, fixed: np.ndarray):
+        from mace.data.neighborhood import get_neighborhood
+
+        positions = atoms.positions.copy()
+        edge_index, shifts, unit_shifts, _ = get_neighborhood(
+            positions=positions, cutoff=self.cutoff + self.skin, pbc=tuple(bool(p) for p in atoms.pbc),
+            cell=atoms.cell.array.copy(),
+        )
+        sender, receiver = edge_index
+        # pairs of fixed atoms never change length: decide once whether they are within the cutoff
+        static = fixed[sender] & fixed[receiver]
+        vectors = positions[receiver[static]] - positions[sender[static]] + shifts[static]
+        self._keep = static.copy()
+        self._keep[static] = (vectors ** 2).sum(axis=1) < self.cutoff ** 2
+        self._mobile = np.flatnonzero(~static)
+        self._candidates = (edge_index, shifts, unit_shifts)
+        self._reference = {"numbers": atoms.numbers.copy(), "pbc": atoms.pbc.copy(), "cell": atoms.cell.array.copy(),
+                           "fixed": fixed.copy(), "positions": positions}
+        self.rebuilds += 1
+
+    def pairs(self, atoms: ase.Atoms, fixed: np.ndarray = None):
+        """Pairs within the cutoff for the current positions, rebuilding the candidates if needed.
+        returns:
+            edge_index: np.ndarray (2, n_edges) of sender and receiver indices
+            shifts: np.ndarray (n_edges, 3), cartesian shift vectors
+            unit_shifts: np.ndarray (n_edges, 3), shifts in units of the cell vectors
+        """
+        fixed = fixed_mask(atoms) if fixed is None else fixed
+        if self.needs_rebuild(atoms, fixed):
+            self.build(atoms, fixed)
+        self.calls += 1
+
+        edge_index, shifts, unit_shifts = self._candidates
+        mobile = self._mobile
+        positions = atoms.positions
+        vectors = positions[edge_index[1, mobile]] - positions[edge_index[0, mobile]] + shifts[mobile]
+        keep = self._keep.copy()
+        keep[mobile] = (vectors ** 2).sum(axis=1) < self.cutoff ** 2
+        # same pair order as a fresh neighbor list, so results match the wrapped calculator
+        return edge_index[:, keep], shifts[keep], unit_shifts[keep]
+
+
+class SkinNeighborCalculator(Calculator):
+    """Energy and forces of a MACECalculator, evaluated on a graph taken from a `VerletList`.
+
+    The graph has the same edges in the same order as the one built by the
+    wrapped calculator, so energies and forces are the same. Stress is not
+    computed; use the wrapped calculator for cell relaxations.
+    """
+
+    implemented_properties = ["energy", "free_energy", "forces"]
+
+    def __init__(self, calculator, skin: float = 1.0, **kwargs):
+        Calculator.__init__(self, **kwargs)
+        self.calculator = calculator
+        self.neighbors = VerletList(float(calculator.r_max), skin)
+        self._batch = None
+        self._topology = None
+
+    @property
+    def rebuilds(self) -> int:
+        return self.neighbors.rebuilds
+
+    def _base_batch(self, atoms: ase.Atoms):
+        # node attributes, cell and head only depend on the elements and the cell; positions and edges are replaced per step
+        topology = (atoms.numbers.tobytes(), atoms.cell.array.tobytes(), atoms.pbc.tobytes())
+        if topology != self._topology:
+            from mace.tools import torch_geometric
+            from src.tools.batch import _mace_graph
+
+            self._batch = torch_geometric.Batch.from_data_list([_mace_graph(self.calculator, atoms)])
+            self._topology = topology
+        return self._batch
+
+    def calculate(self, atoms=None, properties=None, system_changes=all_changes):
+        import torch
+        from src.tools.calculators import count_force_calls
+
+        Calculator.calculate(self, atoms, properties, system_changes)
+        count_force_calls()
+        calc = self.calculator
+        edge_index, shifts, unit_shifts = self.neighbors.pairs(self.atoms)
+
+        base = self._base_batch(self.atoms)
+        energy, forces = 0., 0.
+        for model in calc.models:
+            model_dtype = next(model.parameters()).dtype
+            batch = base.clone()
+            for key in batch.keys:
+                value = batch[key]
+                if torch.is_tensor(value) and torch.is_floating_point(value):
+                    batch[key] = value.to(dtype=model_dtype)
+            batch["positions"] = torch.tensor(self.atoms.positions, dtype=model_dtype)
+            batch["edge_index"] = torch.tensor(edge_index, dtype=torch.long)
+            batch["shifts"] = torch.tensor(shifts, dtype=model_dtype)
+            batch["unit_shifts"] = torch.tensor(unit_shifts, dtype=model_dtype)
+            out = model(batch.to(calc.device).to_dict(), compute_stress=False, training=False)
+            energy = energy + float(out["energy"].detach().cpu().numpy()[0])
+            forces = forces + out["forces"].detach().cpu().numpy().astype(float)
+
+        n_models = len(calc.models)
+        energy = energy / n_models * calc.energy_units_to_eV
+        self.results = {
+            "energy": energy,
+            "free_energy": energy,
+            "forces": forces / n_models * calc.energy_units_to_eV / calc.length_units_to_A,
+        }
+
+
+def with_neighbor_skin(calculator, skin: float = None):
+    """`calculator` wrapped in a `SkinNeighborCalculator` if it is a MACE calculator and the skin is positive,
+    else `calculator` itself (e.g. EMT, which keeps its own neighbor list)."""
+    skin = NEIGHBOR_SKIN if skin is None else skin
+    if skin <= 0 or not is_batchable(calculator):
+        return calculator
+    return SkinNeighborCalculator(calculator, skin=skin)
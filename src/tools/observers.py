@@ -0,0 +1,159 @@
+"""Early-termination observers for relaxations and MD runs.
+
+An observer looks at the current atoms after every optimizer/MD step and
+returns a reason code when the run is hopeless and should stop:
+
+- 'desorbed': the binding atom left the surface;
+- 'dissociated': a bond of the initial adsorbate broke;
+- 'diverged': forces exploded or became non-finite;
+- 'stalled': neither the energy nor the largest force improved any more.
+
+Normal terminations are reported as 'converged' / 'max_steps' (relaxation)
+and 'completed' (MD).
+"""
+import numpy as np
+import ase
+from ase.data import covalent_radii
+
+from src.tools.md import adsorbate_observables
+
+
+class DesorptionObserver:
+    """Stop when the binding atom is farther than `max_distance` from every slab atom.
+    Structures placed above that distance on purpose only stop once they moved `margin` further away.
+    """
+
+    reason = "desorbed"
+
+    def __init__(self, atoms: ase.Atoms, n_slab: int, max_distance: float = 3.0, margin: float = 1.0):
+        self.n_slab = n_slab
+        initial = adsorbate_observables(atoms, n_slab)["binding_distance"]
+        self.max_distance = max(max_distance, initial + margin) if initial > max_distance else max_distance
+
+    def __call__(self, atoms: ase.Atoms, step: int):
+        distance = adsorbate_observables(atoms, self.n_slab)["binding_distance"]
+        if distance > self.max_distance:
+            return {"binding_distance": distance}
+
+
+class DissociationObserver:
+    """Stop when a bond present in the initial adsorbate stretches beyond `scale` x the sum of covalent radii."""
+
+    reason = "dissociated"
+
+    def __init__(self, atoms: ase.Atoms, n_slab: int, bond_scale: float = 1.2, scale: float = 1.6):
+        self.n_slab = n_slab
+        adsorbate = atoms[n_slab:]
+        radii = covalent_radii[adsorbate.numbers]
+        cutoffs = radii[:, None] + radii[None, :]
+        i, j = np.triu_indices(len(adsorbate), k=1)
+        distances = adsorbate.get_all_distances(mic=True)[i, j]
+        bonded = distances < bond_scale * cutoffs[i, j]
+        self.i, self.j = i[bonded], j[bonded]
+        self.max_lengths = scale * cutoffs[self.i, self.j]
+
+    def __call__(self, atoms: ase.Atoms, step: int):
+        if not len(self.i):
+            return None
+        adsorbate = atoms[self.n_slab:]
+        lengths = adsorbate.get_all_distances(mic=True)[self.i, self.j]
+        broken = lengths > self.max_lengths
+        if broken.any():
+            return {"broken_bonds": [(int(a) + self.n_slab, int(b) + self.n_slab) for a, b in zip(self.i[broken], self.j[broken])]}
+
+
+class DivergenceObserver:
+    """Stop when the largest force exceeds `max_force` (eV/A) or forces/energy are not finite."""
+
+    reason = "diverged"
+
+    def __init__(self, max_force: float = 50.):
+        self.max_force = max_force
+
+    def __call__(self, atoms: ase.Atoms, step: int):
+        forces = atoms.get_forces()
+        energy = atoms.get_potential_energy()
+        fmax = np.sqrt((forces ** 2).sum(axis=1).max(initial=0.))
+        if not np.isfinite(fmax) or not np.isfinite(energy) or fmax > self.max_force:
+            return {"fmax": float(fmax), "energy": float(energy)}
+
+
+class EnergyStallObserver:
+    """Stop when the energy changed by less than `tol` (eV) over the last `window` steps while the largest
+    force did not decrease. A relaxation creeping down a flat landscape with shrinking forces is left to run."""
+
+    reason = "stalled"
+
+    def __init__(self, window: int = 50, tol: float = 1e-4):
+        self.window = window
+        self.tol = tol
+        self.energies = []
+        self.fmax = []
+
+    def __call__(self, atoms: ase.Atoms, step: int):
+        forces = atoms.get_forces()
+        self.energies.append(atoms.get_potential_energy())
+        self.fmax.append(np.sqrt((forces ** 2).sum(axis=1).max(initial=0.)))
+        self.energies = self.energies[-(self.window + 1):]
+        self.fmax = self.fmax[-(self.window + 1):]
+        if len(self.energies) <= self.window or np.ptp(self.energies) >= self.tol:
+            return None
+        if min(self.fmax[1:]) >= self.fmax[0]:
+            return {"energy_change": float(np.ptp(self.energies)), "window": self.window, "fmax": float(self.fmax[-1])}
+
+
+class ObserverSet:
+    """Run several observers and remember the first one that fired."""
+
+    def __init__(self, observers: list = None):
+        self.observers = list(observers or [])
+        self.reason = None
+        self.step = None
+        self.details = {}
+
+    def __call__(self, atoms: ase.Atoms, step: int):
+        """Check all observers. returns: str reason code of the first firing observer, or None."""
+        for observer in self.observers:
+            details = observer(atoms, step)
+            if details is not None:
+                self.reason, self.step, self.details = observer.reason, step, details
+                return self.reason
+        return None
+
+    def report(self, default: str) -> dict:
+        """Structured outcome: {'reason', 'step', 'details'}; `default` is used if no observer fired."""
+        return {"reason": self.reason or default, "step": self.step, "details": self.details}
+
+
+def default_observers(atoms: ase.Atoms, kind: str = "relax", n_slab: int = None, max_distance: float = 3.0,
+                      max_force: float = 50., stall_window: int = 50, stall_tol: float = 1e-4) -> ObserverSet:
+    """Standard observer set for `relax_atoms` ('relax') or `md_run_atoms` ('md').
+    Desorption and dissociation are only watched when the number of slab atoms is known
+    (argument or atoms.info['n_slab'] as set by `get_ads_slab`); energy stalling only for relaxations.
+    """
+    n_slab = atoms.info.get("n_slab") if n_slab is None else n_slab
+    observers = [DivergenceObserver(max_force=max_force)]
+    if n_slab is not None and len(atoms) > n_slab:
+        observers += [DesorptionObserver(atoms, n_slab, max_distance=max_distance), DissociationObserver(atoms, n_slab)]
+    if kind == "relax":
+        observers.append(EnergyStallObserver(window=stall_window, tol=stall_tol))
+    return ObserverSet(observers)
+
+def run_observed(dyn, atoms: ase.Atoms, observers: ObserverSet, **irun_kwargs) -> dict:
+    """Run an ASE optimizer/MD object step by step, stopping as soon as an observer fires.
+    Args:
+        dyn: ase.optimize.Optimizer or ase.md.MolecularDynamics attached to `atoms`
+        atoms: ase.Atoms being propagated
+        observers: ObserverSet
+        irun_kwargs: passed to `dyn.irun` (fmax, steps)
+    returns:
+        dict {'reason', 'step', 'details'}
+    """
+    converged = False
+    for step, converged in enumerate(dyn.irun(**irun_kwargs)):
+        if converged:
+            break
+        if observers(atoms, step):
+            break
+    default = "completed" if "fmax" not in irun_kwargs else ("converged" if converged else "max_steps")
+    return observers.report(default)
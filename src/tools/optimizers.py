@@ -0,0 +1,138 @@
+"""Selectable geometry optimizers for `relax_atoms`, and a benchmark to choose between them.
+
+Only the free atoms are handed to the optimizer (through an `ase.filters.Filter`),
+so BFGS-type Hessians scale with the number of free atoms instead of the whole
+slab. PreconLBFGS is the exception: its preconditioner is built from the
+neighbor list of a real Atoms object (it fails on a Filter once it is used,
+from 100 atoms on), so it gets the whole structure and keeps the fixed atoms
+in place through their FixAtoms constraint. Compare the optimizers on the bundled slabs with
+
+    python -m src.tools.optimizers --model emt
+    python -m src.tools.optimizers --model medium --fmax 0.01 --output optimizers.csv
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import ase
+from ase.io import read
+from ase.filters import Filter
+from ase.optimize import BFGS, BFGSLineSearch, FIRE, LBFGS
+
+from src.tools.batch import fixed_mask
+
+
+def _precon_lbfgs(atoms, **kwargs):
+    from ase.optimize.precon import PreconLBFGS
+    return PreconLBFGS(atoms, use_armijo=True, **kwargs)
+
+# optimizers that are given the whole structure instead of the free-atom Filter
+FULL_ATOMS_OPTIMIZERS = {"PreconLBFGS"}
+
+OPTIMIZERS = {
+    "BFGS": BFGS,
+    "LBFGS": LBFGS,
+    "FIRE": FIRE,
+    "BFGSLineSearch": BFGSLineSearch,
+    "PreconLBFGS": _precon_lbfgs,
+}
+
+
+def free_atoms(atoms: ase.Atoms):
+    """`atoms` itself if nothing is fixed, otherwise a Filter exposing only the atoms not held by FixAtoms."""
+    mask = fixed_mask(atoms)
+    if not mask.any():
+        return atoms
+    return Filter(atoms, indices=np.flatnonzero(~mask))
+
+def make_optimizer(name: str, atoms: ase.Atoms, trajectory: str = None, logfile: str = None, free_only: bool = True):
+    """Build one of the `OPTIMIZERS` on `atoms` (restricted to the free atoms if `free_only`, except for the
+    `FULL_ATOMS_OPTIMIZERS`). The trajectory always contains the full structure."""
+    if name not in OPTIMIZERS:
+        raise ValueError(f"Unknown optimizer {name!r}, expected one of {sorted(OPTIMIZERS)}.")
+    target = free_atoms(atoms) if free_only and name not in FULL_ATOMS_OPTIMIZERS else atoms
+    return OPTIMIZERS[name](target, trajectory=trajectory, logfile=logfile)
+
+
+def benchmark_structures(slab_paths: list = None, smiles: str = "Cl[C-]=O") -> dict:
+    """Adsorbate-on-slab test systems: `smiles` on the first unique site of every slab, bottom half fixed."""
+    from src.tools.tools import get_unique_sites_from_atoms, get_fragment, get_ads_slab
+    from src.tools.layers import fix_bottom
+
+    if slab_paths is None:
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        slab_paths = sorted(glob.glob(os.path.join(root, "notebooks", "*.xyz")))
+    fragment = get_fragment(smiles)
+    structures = {}
+    for path in slab_paths:
+        slab = read(path)
+        site = get_unique_sites_from_atoms(slab).iloc[0].to_dict()
+        atoms = get_ads_slab(slab, fragment, site)
+        atoms.constraints = fix_bottom(atoms)
+        structures[os.path.splitext(os.path.basename(path))[0]] = atoms
+    return structures
+
+def benchmark_optimizers(structures: dict, calculator_factory, optimizers: list = None, fmax: float = 0.05,
+                         steps: int = 500, free_only: bool = True) -> pd.DataFrame:
+    """Relax every structure with every optimizer.
+    Args:
+        structures: dict name -> ase.Atoms (with constraints)
+        calculator_factory: callable returning a fresh ase calculator
+        optimizers: list of names from `OPTIMIZERS` (default: all)
+        fmax, steps: convergence criterion (eV/A) and step budget
+        free_only: bool, optimize only the free atoms
+    returns:
+        pandas.DataFrame with 'structure', 'optimizer', 'converged', 'steps', 'force_calls', 'wall_time_s',
+        'energy' and 'error' (message if the run failed, e.g. elements the calculator does not support)
+    """
+    from src.tools.calculators import CountingCalculator
+
+    rows = []
+    for name, atoms in structures.items():
+        for optimizer in optimizers or list(OPTIMIZERS):
+            row = {"structure": name, "optimizer": optimizer, "n_atoms": len(atoms), "n_free": int((~fixed_mask(atoms)).sum())}
+            trial = atoms.copy()
+            counter = CountingCalculator(calculator_factory())
+            trial.calc = counter
+            try:
+                with tempfile.TemporaryDirectory() as tmp:
+                    dyn = make_optimizer(optimizer, trial, trajectory=os.path.join(tmp, "relax.traj"), free_only=free_only)
+                    start = time.perf_counter()
+                    converged = dyn.run(fmax=fmax, steps=steps)
+                    row.update(wall_time_s=time.perf_counter() - start, converged=bool(converged), steps=dyn.nsteps,
+                               force_calls=counter.n_calls, energy=trial.get_potential_energy(), error=None)
+                    dyn.close()
+            except Exception as e:
+                row.update(converged=False, error=f"{type(e).__name__}: {e}")
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare relax_atoms optimizers on the bundled slabs.")
+    parser.add_argument("--model", type=str, default="emt", help="Calculator, 'emt' or a MACE-MP model.")
+    parser.add_argument("--fmax", type=float, default=0.05)
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--optimizers", nargs="+", default=list(OPTIMIZERS), choices=list(OPTIMIZERS))
+    parser.add_argument("--slabs", nargs="+", default=None, help="Slab files (default: notebooks/*.xyz).")
+    parser.add_argument("--all_atoms", action="store_true", help="Optimize all atoms instead of the free ones only.")
+    parser.add_argument("--output", type=str, default=None, help="Write the table to this .csv file.")
+    return parser.parse_args()
+
+def main_cli():
+    from src.tools.calculators import get_calculator
+
+    args = parse_args()
+    table = benchmark_optimizers(benchmark_structures(args.slabs), lambda: get_calculator(model=args.model),
+                                 optimizers=args.optimizers, fmax=args.fmax, steps=args.steps, free_only=not args.all_atoms)
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(table.round(4).to_string(index=False))
+    if args.output:
+        table.to_csv(args.output, index=False)
+
+if __name__ == '__main__':
+    main_cli()
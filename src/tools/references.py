@@ -0,0 +1,209 @@
+"""Persistent table of slab and gas-phase reference energies.
+
+An adsorption energy needs the energy of the relaxed bare slab and of the
+relaxed gas-phase molecule. The agent used to relax both again in generated
+code in every session. `ReferenceTable` keeps them in an sqlite table,
+keyed by:
+
+- the slab content hash (`atoms_hash` of the structure and its constraints);
+- the canonical SMILES of the molecule;
+- the calculator identity and the relaxation settings.
+
+A reference is relaxed only when it is missing, with the same optimizer,
+step limit and early stopping as the `relax_atoms` run it is compared with;
+like a `relax_atoms` cache entry, it is only stored if the relaxation was not
+cut short by an observer. A per-key file lock makes concurrent processes that
+need the same reference wait for the first one instead of relaxing it twice
+(`fcntl.flock` where available, an exclusively created lock file elsewhere).
+
+    python -m src.tools.references list
+    python -m src.tools.references clear
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import ase
+
+from src.tools.cache import atoms_hash
+from src.tools.tracing import annotate, tracer
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+DEFAULT_REFERENCE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "adskrk", "references")
+
+
+def gas_phase_molecule(smiles: str, conformer_i: int = 0, to_initialize: int = 1, vacuum: float = 10.) -> ase.Atoms:
+    """Isolated molecule of a surrogate SMILES: the `get_fragment` conformer without its marker atom(s)
+    ('Cl' or 'S1S'), centred in a non-periodic box."""
+    from src.tools.conformers import get_conformer_library
+
+    fragment = get_conformer_library().get_conformer(smiles, conformer_i, to_initialize=to_initialize)
+    n_marker = 2 if smiles.startswith("S1S") else 1
+    molecule = fragment[n_marker:]
+    molecule.center(vacuum=vacuum)
+    molecule.pbc = False
+    molecule.info = {"smiles": smiles}
+    return molecule
+
+def relax_reference(atoms: ase.Atoms, calculator, fmax: float = 0.01, steps: int = None, optimizer: str = "BFGS",
+                    early_stop: bool = True) -> dict:
+    """Relax a reference structure (only its free atoms), stopped early like `relax_atoms` if `early_stop`.
+    returns: dict with 'energy' (eV), 'steps', 'converged', 'stop_reason' and 'formula'"""
+    from src.tools.observers import ObserverSet, default_observers, run_observed
+    from src.tools.optimizers import make_optimizer
+
+    atoms = atoms.copy()
+    atoms.calc = calculator
+    dyn = make_optimizer(optimizer, atoms, logfile=None)
+    observers = default_observers(atoms, kind="relax") if early_stop else ObserverSet()
+    stop = run_observed(dyn, atoms, observers, fmax=fmax, **({"steps": steps} if steps is not None else {}))
+    dyn.close()
+    return {"energy": float(atoms.get_potential_energy()), "steps": dyn.nsteps, "converged": stop["reason"] == "converged",
+            "stop_reason": stop["reason"], "formula": atoms.get_chemical_formula()}
+
+@contextlib.contextmanager
+def _file_lock(path: str, poll: float = 0.1):
+    """Exclusive lock between processes: `flock` on `path`, or where fcntl is missing, creating `path`
+    exclusively (a lock file left by a killed process has to be removed by hand)."""
+    if fcntl is not None:
+        with open(path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return
+    while True:
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            time.sleep(poll)
+    try:
+        yield
+    finally:
+        os.remove(path)
+
+
+class ReferenceTable:
+    """Reference energies keyed by structure or molecule, calculator and settings, shared between processes."""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.environ.get("ADSKRK_REFERENCE_DIR", DEFAULT_REFERENCE_DIR)
+        os.makedirs(os.path.join(self.path, "locks"), exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS refs ("
+                "key TEXT PRIMARY KEY, kind TEXT, label TEXT, calculator TEXT, energy REAL, created REAL, meta TEXT)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        db = sqlite3.connect(os.path.join(self.path, "references.sqlite"), timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def slab_key(slab: ase.Atoms, calculator: str, **params) -> str:
+        """Key of a bare slab: its content hash (structure and constraints), calculator and relaxation settings."""
+        bare = ase.Atoms(numbers=slab.numbers, positions=slab.positions, cell=slab.cell, pbc=slab.pbc,
+                         constraint=slab.constraints)
+        return atoms_hash(bare, calculator, kind="slab_reference", **params)
+
+    @staticmethod
+    def molecule_key(smiles: str, calculator: str, **params) -> str:
+        """Key of a gas-phase molecule: canonical SMILES, calculator and relaxation settings."""
+        from src.tools.conformers import canonical_surrogate_smiles
+
+        payload = json.dumps([canonical_surrogate_smiles(smiles), calculator, params], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> dict:
+        """Stored reference for `key` ({'kind', 'label', 'calculator', 'energy', 'created', **meta}) or None."""
+        with self._connect() as db:
+            row = db.execute("SELECT kind, label, calculator, energy, created, meta FROM refs WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        kind, label, calculator, energy, created, meta = row
+        return {"kind": kind, "label": label, "calculator": calculator, "energy": energy, "created": created,
+                **json.loads(meta or "{}")}
+
+    def put(self, key: str, kind: str, label: str, calculator: str, energy: float, **meta):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO refs (key, kind, label, calculator, energy, created, meta) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (key, kind, label, calculator, float(energy), time.time(), json.dumps(meta)))
+
+    def get_or_compute(self, key: str, compute, kind: str, label: str, calculator: str) -> dict:
+        """Stored reference for `key`; if missing, `compute()` (returning a dict with 'energy') is run and stored,
+        unless its 'stop_reason' says an observer cut the relaxation short (then it is returned without storing).
+        Only one process computes a given key, the others wait for its result."""
+        found = self.get(key)
+        if found is not None:
+            annotate(**{f"{kind}_cached": True})
+            return found
+        with _file_lock(os.path.join(self.path, "locks", f"{key}.lock")):
+            found = self.get(key)
+            if found is None:
+                with tracer.span("reference", "reference", kind=kind, label=label):
+                    result = compute()
+                annotate(**{f"{kind}_cached": False})
+                if result.get("stop_reason", "converged") not in ("converged", "max_steps"):
+                    return {"kind": kind, "label": label, "calculator": calculator, "created": time.time(), **result}
+                self.put(key, kind, label, calculator, **result)
+                found = self.get(key)
+        return found
+
+    def entries(self, kind: str = None) -> list:
+        """All references, newest first, optionally of one kind ('slab' or 'molecule')."""
+        with self._connect() as db:
+            rows = db.execute("SELECT key FROM refs WHERE ? IS NULL OR kind = ? ORDER BY created DESC", (kind, kind)).fetchall()
+        return [{"key": key, **self.get(key)} for (key,) in rows]
+
+    def clear(self):
+        with self._connect() as db:
+            db.execute("DELETE FROM refs")
+
+
+_reference_table = None
+
+def get_reference_table() -> ReferenceTable:
+    """Process-wide reference table (location from ADSKRK_REFERENCE_DIR)."""
+    global _reference_table
+    if _reference_table is None:
+        _reference_table = ReferenceTable()
+    return _reference_table
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect the slab and gas-phase reference energies.")
+    parser.add_argument("--path", type=str, default=None, help="Table directory (default: $ADSKRK_REFERENCE_DIR or ~/.cache/adskrk/references).")
+    sub = parser.add_subparsers(dest="command", required=True)
+    listing = sub.add_parser("list", help="List references, newest first.")
+    listing.add_argument("--kind", choices=["slab", "molecule"], default=None)
+    sub.add_parser("clear", help="Remove every reference.")
+    return parser.parse_args()
+
+def main_cli():
+    args = parse_args()
+    table = ReferenceTable(path=args.path)
+    if args.command == "list":
+        for entry in table.entries(kind=args.kind):
+            print(f"{entry['key'][:16]}  {entry['kind']:<8} {entry['label']:<24} {entry['energy']:14.6f} eV  {entry['calculator']}  "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['created']))}")
+    elif args.command == "clear":
+        table.clear()
+        print("references cleared")
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,269 @@
+"""Exhaustive site x rotation x height x conformer screening of adsorption configurations.
+
+Instead of the agent picking and relaxing one placement per LLM round-trip,
+`screen_adsorption` enumerates every requested placement, drops the ones that
+are equivalent under the slab symmetry (see `src.tools.symmetry`),
+relaxes the rest on a pool of worker processes and returns one ranked table.
+
+With `refine_top_k` the relaxation runs in two stages (`two_stage_relax`):
+every candidate is relaxed loosely with a small model, and only the best
+stable ones are refined to full accuracy. With `prerank_fraction` only the
+placements ranked most promising by the surrogate of `src.tools.surrogate`
+are relaxed at all, and every relaxed placement becomes a training example
+of that surrogate.
+"""
+import atexit
+import itertools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import ase
+
+from src.tools.tools import get_sites_from_atoms, get_unique_sites_from_atoms, get_fragment, get_ads_slab, relax_many
+from src.tools.calculators import PRESCREEN_MODEL, TOOLS_MODEL, calculator_identity, get_calculator
+from src.tools.cache import atoms_hash
+from src.tools.symmetry import ConfigurationIndex
+from src.tools.observers import DesorptionObserver, DissociationObserver
+from src.tools.surrogate import FEATURES, get_surrogate_store, prerank, ranking_report
+from src.tools.tracing import run_with_trace, traced, tracer
+
+
+def enumerate_placements(slab: ase.Atoms, smiles: str, sites=None, rotations=(0.,), heights=(1.5,), conformers=(0,), dedup_tol: float = 0.1):
+    """Place every (site, conformer, rotation, height) combination and drop symmetry-equivalent duplicates.
+    Args:
+        slab: ase.Atoms of the bare slab
+        smiles: surrogate SMILES of the adsorbate
+        sites: None for one site per symmetry class, a list of row indices of `get_sites_from_atoms(slab)`, or a (filtered) site DataFrame
+        rotations: iterable of rotations in degrees around the site n_vector
+        heights: iterable of heights in angstrom above the site
+        conformers: iterable of conformer indices
+        dedup_tol: float, distance tolerance in angstrom used to detect equivalent placements
+    returns:
+        placements: pandas.DataFrame with columns ['site_index', 'conformer', 'rotation', 'height', 'connectivity', 'site_formula', 'atoms']
+    """
+    if sites is None:
+        site_df = get_unique_sites_from_atoms(slab)
+    elif isinstance(sites, pd.DataFrame):
+        site_df = sites
+    else:
+        site_df = get_sites_from_atoms(slab).loc[list(sites)]
+
+    conformers = list(conformers)
+    fragments = {i: get_fragment(smiles, to_initialize=max(conformers) + 1, conformer_i=i) for i in conformers}
+
+    rows, index = [], ConfigurationIndex(len(slab), tol=dedup_tol)
+    for (site_index, site), conformer, rotation, height in itertools.product(site_df.iterrows(), conformers, rotations, heights):
+        ads_slab = get_ads_slab(slab.copy(), fragments[conformer], site.to_dict(), height=height, n_rotation=rotation)
+        if not index.add(ads_slab):
+            continue
+        rows.append({
+            "site_index": site_index, "conformer": conformer, "rotation": rotation, "height": height,
+            "connectivity": site["connectivity"], "site_formula": site["site_formula"], "atoms": ads_slab,
+        })
+    return pd.DataFrame(rows, columns=["site_index", "conformer", "rotation", "height", "connectivity", "site_formula", "atoms"])
+
+def _relax_chunk(atoms_list: list, fmax: float, steps: int, model: str = None) -> list:
+    return relax_many(atoms_list, fmax=fmax, steps=steps, model=model)
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+def _worker_pool(n_workers: int) -> ProcessPoolExecutor:
+    """Process pool shared by all screens, created on first use and only replaced when more workers are needed.
+    Workers outlive a screen, so their imports and pooled calculators are reused by the next one."""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers < n_workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            # spawn keeps torch/CUDA state of the parent out of the workers
+            _executor = ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn"))
+            _executor_workers = n_workers
+        return _executor
+
+@atexit.register
+def _shutdown_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+def _relax_parallel(candidates: list, fmax: float, steps: int, n_workers: int = 1, model: str = None) -> list:
+    n_workers = max(1, min(n_workers, len(candidates)))
+    if n_workers == 1:
+        return _relax_chunk(candidates, fmax, steps, model)
+    chunks = [candidates[i::n_workers] for i in range(n_workers)]
+    pool = _worker_pool(n_workers)
+    futures = [pool.submit(run_with_trace, _relax_chunk, tracer.context(), (chunk, fmax, steps, model)) for chunk in chunks]
+    results = [f.result() for f in futures]
+    relaxed = [None] * len(candidates)
+    for i, (chunk, spans) in enumerate(results):
+        relaxed[i::n_workers] = chunk
+        tracer.extend(spans)
+    return relaxed
+
+def is_stable(initial: ase.Atoms, relaxed: ase.Atoms, max_distance: float = 3.0) -> bool:
+    """False if the adsorbate desorbed or one of its bonds broke between `initial` and `relaxed`.
+    Structures without atoms.info['n_slab'] (set by `get_ads_slab`) always count as stable."""
+    n_slab = initial.info.get("n_slab")
+    if n_slab is None or len(initial) <= n_slab:
+        return True
+    observers = [DesorptionObserver(initial, n_slab, max_distance=max_distance), DissociationObserver(initial, n_slab)]
+    return all(observer(relaxed, 0) is None for observer in observers)
+
+def two_stage_relax(atoms_list: list, top_k: int = 3, prescreen_model: str = None, prescreen_fmax: float = 0.1,
+                    prescreen_steps: int = 100, model: str = None, fmax: float = 0.01, steps: int = 1000,
+                    require_stable: bool = True, n_workers: int = 1) -> pd.DataFrame:
+    """Multi-fidelity relaxation: relax every candidate loosely, refine only the most promising ones.
+    Args:
+        atoms_list: list of ase.Atoms candidates
+        top_k: int, number of candidates promoted to the accurate stage
+        prescreen_model, prescreen_fmax, prescreen_steps: stage 1 model, force criterion (eV/A) and step budget;
+            the model defaults to `PRESCREEN_MODEL`: ADSKRK_PRESCREEN_MODEL if set, else MACE-MP "small" for a
+            medium or large tools model, else the tools' model
+        model, fmax, steps: stage 2 model (None: the tools' default), force criterion and step budget;
+            stage 2 starts from the stage 1 geometry
+        require_stable: bool, promote only candidates whose adsorbate neither desorbed nor dissociated in stage 1
+            (if none is stable, the top_k of all candidates are promoted)
+        n_workers: int, worker processes for stage 1
+    returns:
+        pandas.DataFrame in input order with columns ['stage1_energy', 'stage1_converged', 'stage1_steps', 'stable',
+        'stage1_rank', 'promoted', 'energy', 'converged', 'steps', 'final_rank', 'atoms']; 'energy' / 'final_rank'
+        are NaN for candidates that were not refined, 'atoms' is the most accurate relaxed structure of each candidate.
+        `table.attrs['report']` holds per-stage wall times and how the stage 1 ranking compares with the final one
+        (best candidate of each stage, as positions in `atoms_list`, and Kendall's tau over the refined candidates).
+    """
+    start = time.perf_counter()
+    coarse = _relax_parallel(list(atoms_list), prescreen_fmax, prescreen_steps, n_workers=n_workers,
+                             model=prescreen_model or PRESCREEN_MODEL)
+    stage1_time = time.perf_counter() - start
+
+    table = pd.DataFrame({
+        "stage1_energy": [atoms.get_potential_energy() for atoms in coarse],
+        "stage1_converged": [atoms.info["relax_converged"] for atoms in coarse],
+        "stage1_steps": [atoms.info["relax_steps"] for atoms in coarse],
+        "stable": [is_stable(initial, relaxed) for initial, relaxed in zip(atoms_list, coarse)],
+    })
+    table["stage1_rank"] = table["stage1_energy"].rank(method="first").astype(int)
+    pool = table[table["stable"]] if require_stable and table["stable"].any() else table
+    promoted = pool.sort_values("stage1_energy", kind="stable").index[:top_k]
+    table["promoted"] = table.index.isin(promoted)
+
+    start = time.perf_counter()
+    refined = _relax_chunk([coarse[i] for i in promoted], fmax, steps, model) if len(promoted) else []
+    stage2_time = time.perf_counter() - start
+
+    table["energy"], table["converged"], table["steps"] = np.nan, False, 0
+    for i, atoms in zip(promoted, refined):
+        table.loc[i, ["energy", "converged", "steps"]] = [atoms.get_potential_energy(), atoms.info["relax_converged"], atoms.info["relax_steps"]]
+    table["final_rank"] = table["energy"].rank(method="first")
+    final = list(coarse)
+    for i, atoms in zip(promoted, refined):
+        final[i] = atoms
+    table["atoms"] = final
+
+    refined_rows = table[table["promoted"]]
+    from scipy import stats
+    tau = stats.kendalltau(refined_rows["stage1_energy"], refined_rows["energy"]).statistic if len(refined_rows) > 1 else np.nan
+    table.attrs["report"] = {
+        "n_candidates": len(table),
+        "n_stable": int(table["stable"].sum()),
+        "n_promoted": len(promoted),
+        "stage1_time_s": stage1_time,
+        "stage2_time_s": stage2_time,
+        "stage1_best": int(table["stage1_energy"].idxmin()) if len(table) else None,
+        "final_best": int(refined_rows["energy"].idxmin()) if len(refined_rows) else None,
+        "kendall_tau_promoted": float(tau),
+    }
+    return table
+
+@traced
+def screen_adsorption(slab: ase.Atoms, smiles: str, sites=None, rotations=(0.,), heights=(1.5,), conformers=(0,),
+                      fmax: float = 0.05, steps: int = 500, n_workers: int = 1, dedup_tol: float = 0.1,
+                      refine_top_k: int = None, prescreen_model: str = None, prescreen_fmax: float = 0.1, prescreen_steps: int = 100,
+                      prerank_fraction: float = None):
+    """Screen many adsorption configurations and rank them by relaxed energy.
+    Args:
+        slab: ase.Atoms of the bare slab
+        smiles: surrogate SMILES of the adsorbate
+        sites: None for one site per symmetry class, a list of row indices of `get_sites_from_atoms(slab)`, or a filtered site DataFrame
+        rotations: list of rotations in degrees around the site n_vector, e.g. [0, 60, 120]
+        heights: list of heights in angstrom above the site, e.g. [1.5, 2.0]
+        conformers: list of conformer indices of the fragment, e.g. [0, 1, 2]
+        fmax: float, force convergence criterion in eV/A
+        steps: int, maximum number of optimizer steps per structure
+        n_workers: int, number of worker processes; 1 relaxes in the current process
+        dedup_tol: float, distance tolerance in angstrom used to detect equivalent placements
+        refine_top_k: int or None, if set, relax all placements loosely with `prescreen_model` (to `prescreen_fmax`,
+            at most `prescreen_steps` steps) and refine only the `refine_top_k` best stable ones to `fmax`;
+            much faster for large screens
+        prescreen_model: str or None, model of the loose stage, e.g. "small"; None uses the configured cheap model
+        prerank_fraction: float or None, if set, score all placements without relaxing them (geometric descriptors,
+            one single-point energy and a model trained on earlier relaxations) and relax only this fraction of them,
+            the most promising ones; use it when there are many more placements than can be relaxed
+    returns:
+        pandas.DataFrame sorted from most to least stable, with columns
+        ['site_index', 'conformer', 'rotation', 'height', 'connectivity', 'site_formula', 'energy', 'converged', 'steps', 'initial_atoms', 'atoms'];
+        'atoms' holds the relaxed ase.Atoms, 'initial_atoms' the placement before relaxation.
+        With refine_top_k the table also has the `two_stage_relax` columns (refined placements first, unrefined
+        ones after them by stage 1 energy) and `table.attrs['report']` tells the time of each stage.
+        With prerank_fraction the table also has 'sp_energy', 'predicted_energy', 'prerank' and 'selected'; placements
+        that were not selected have a NaN 'energy', no 'atoms' and come last, and `table.attrs['report']['prerank']` compares
+        the predicted ranking of the relaxed placements with their relaxed energies.
+    """
+    table = enumerate_placements(slab, smiles, sites=sites, rotations=rotations, heights=heights,
+                                 conformers=conformers, dedup_tol=dedup_tol)
+    candidates = list(table.pop("atoms"))
+    table["initial_atoms"] = candidates
+    report = {}
+    selected = np.arange(len(candidates))
+    order = ["energy"]
+
+    if prerank_fraction is not None:
+        start = time.perf_counter()
+        calculator_id = calculator_identity(model=TOOLS_MODEL, dispersion=False)
+        # screens relax with batched FIRE (`relax_many`)
+        ranking = prerank(candidates, get_calculator(model=TOOLS_MODEL, dispersion=False), calculator_id, keep_fraction=prerank_fraction,
+                          fmax=fmax, optimizer="FIRE")
+        table[["sp_energy", "predicted_energy", "prerank", "selected"]] = ranking[["sp_energy", "predicted_energy", "prerank", "selected"]]
+        selected = np.flatnonzero(ranking["selected"])
+        report["prerank"] = {"scorer": ranking.attrs["scorer"], "n_candidates": len(candidates), "n_selected": len(selected),
+                             "time_s": time.perf_counter() - start}
+        order.append("predicted_energy")
+
+    subset = [candidates[i] for i in selected]
+    if refine_top_k is not None:
+        stages = two_stage_relax(subset, top_k=refine_top_k, prescreen_model=prescreen_model, prescreen_fmax=prescreen_fmax,
+                                 prescreen_steps=prescreen_steps, fmax=fmax, steps=steps, n_workers=n_workers)
+        report.update(stages.attrs["report"])
+        stages.index = selected
+        table = pd.concat([table, stages.reindex(table.index)], axis=1)
+        order.insert(1, "stage1_energy")
+    else:
+        relaxed = _relax_parallel(subset, fmax, steps, n_workers=n_workers)
+        table["energy"], table["converged"], table["steps"] = np.nan, False, 0
+        table.loc[selected, "energy"] = [atoms.get_potential_energy() for atoms in relaxed]
+        table.loc[selected, "converged"] = [atoms.info["relax_converged"] for atoms in relaxed]
+        table.loc[selected, "steps"] = [atoms.info["relax_steps"] for atoms in relaxed]
+        table["atoms"] = pd.Series(dict(zip(selected, relaxed)), index=table.index, dtype=object)
+
+    if prerank_fraction is not None:
+        relaxed_rows = table.loc[selected].dropna(subset=["energy"])
+        report["prerank"].update({
+            **ranking_report(relaxed_rows["predicted_energy"], relaxed_rows["energy"]),
+            "single_point_kendall_tau": ranking_report(relaxed_rows["sp_energy"], relaxed_rows["energy"])["kendall_tau"],
+        })
+        # every relaxed placement teaches the surrogate
+        store = get_surrogate_store()
+        for i, row in relaxed_rows.iterrows():
+            store.add(atoms_hash(candidates[i], calculator_id, kind="surrogate"), calculator_id, ranking.loc[i, FEATURES].to_dict(),
+                      row["sp_energy"], row["energy"], fmax=fmax, optimizer="FIRE")
+    if report:
+        table.attrs["report"] = report
+    return table.sort_values(order, kind="stable").reset_index(drop=True)
@@ -0,0 +1,241 @@
+"""Persisted, columnar index of the adsorption sites of a slab.
+
+`Surface(atoms)` site detection takes about a second on a ~100 atom slab, and
+a campaign asks for the sites of the same few slabs over and over. The sites
+are now detected once per slab content hash and stored as plain numpy
+columns in a compressed .npz file:
+
+- coordinates, n_vector, h_vector: (n_sites, 3) float arrays;
+- connectivity: (n_sites,) ints;
+- topology: (n_sites, max_connectivity) slab atom indices, padded with -1;
+- composition: (n_sites, n_elements) atom counts per element of `elements`.
+
+Queries by connectivity, composition and distance are vectorized over these
+arrays. `to_dataframe` gives back the `Surface.site_df` layout for code that
+expects the DataFrame, and `site_dict` gives one row for `get_ads_slab`.
+"""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import ase
+from ase.geometry import find_mic
+
+from src.tools.cache import atoms_hash
+from src.tools.tracing import tracer
+
+DEFAULT_SITE_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "adskrk", "sites")
+COLUMNS = ("coordinates", "n_vector", "h_vector", "connectivity", "topology", "composition")
+
+
+class SiteIndex:
+    """Column arrays of all adsorption sites of one slab, with vectorized queries.
+
+    Query methods return integer arrays of site indices (rows), which can be
+    chained with numpy (`np.intersect1d`) or passed to `to_dataframe` / `site_dict`.
+    """
+
+    def __init__(self, coordinates, n_vector, h_vector, connectivity, topology, composition, elements,
+                 cell, pbc, key: str = None):
+        self.coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 3)
+        self.n_vector = np.asarray(n_vector, dtype=float).reshape(-1, 3)
+        self.h_vector = np.asarray(h_vector, dtype=float).reshape(-1, 3)
+        self.connectivity = np.asarray(connectivity, dtype=int)
+        self.topology = np.asarray(topology, dtype=int).reshape(len(self.connectivity), -1)
+        self.composition = np.asarray(composition, dtype=int).reshape(len(self.connectivity), -1)
+        self.elements = [str(e) for e in elements]
+        self.cell = np.asarray(cell, dtype=float)
+        self.pbc = np.asarray(pbc, dtype=bool)
+        self.key = key
+
+    @classmethod
+    def from_site_df(cls, site_df: pd.DataFrame, atoms: ase.Atoms, key: str = None) -> "SiteIndex":
+        """Convert a `Surface(atoms).site_df` to columns."""
+        n = len(site_df)
+        width = int(site_df["connectivity"].max()) if n else 0
+        topology = np.full((n, width), -1, dtype=int)
+        for row, top in enumerate(site_df["topology"]):
+            topology[row, :len(top)] = top
+        elements = sorted({e for formula in site_df["site_formula"] for e in formula})
+        composition = np.array([[formula.get(e, 0) for e in elements] for formula in site_df["site_formula"]], dtype=int)
+        return cls(
+            coordinates=np.stack(site_df["coordinates"].to_numpy()) if n else np.zeros((0, 3)),
+            n_vector=np.stack(site_df["n_vector"].to_numpy()) if n else np.zeros((0, 3)),
+            h_vector=np.stack(site_df["h_vector"].to_numpy()) if n else np.zeros((0, 3)),
+            connectivity=site_df["connectivity"].to_numpy(),
+            topology=topology,
+            composition=composition.reshape(n, len(elements)),
+            elements=elements, cell=atoms.cell[:], pbc=atoms.pbc, key=key,
+        )
+
+    @classmethod
+    def build(cls, atoms: ase.Atoms, key: str = None) -> "SiteIndex":
+        """Run autoadsorbate site detection on `atoms`."""
+        from autoadsorbate import Surface
+        with tracer.span("site_detection", "sites", n_atoms=len(atoms)):
+            return cls.from_site_df(Surface(atoms).site_df, atoms, key=key)
+
+    def save(self, path: str):
+        """Write the columns to a compressed .npz file (written to a temporary name, then renamed)."""
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp, elements=np.array(self.elements, dtype=str), cell=self.cell, pbc=self.pbc,
+                            key=np.array(self.key or ""), **{c: getattr(self, c) for c in COLUMNS})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SiteIndex":
+        with np.load(path) as data:
+            columns = {c: data[c] for c in COLUMNS}
+            return cls(elements=list(data["elements"]), cell=data["cell"], pbc=data["pbc"], key=str(data["key"]) or None,
+                       **columns)
+
+    def __len__(self) -> int:
+        return len(self.connectivity)
+
+    # --- queries -----------------------------------------------------------------------------------
+
+    def _all(self) -> np.ndarray:
+        return np.arange(len(self))
+
+    def _element_column(self, element: str) -> np.ndarray:
+        if element not in self.elements:
+            return np.zeros(len(self), dtype=int)
+        return self.composition[:, self.elements.index(element)]
+
+    def by_connectivity(self, connectivity) -> np.ndarray:
+        """Sites with the given connectivity (int, or list of ints): 1 top, 2 bridge, 3 hollow, ..."""
+        return np.flatnonzero(np.isin(self.connectivity, np.atleast_1d(connectivity)))
+
+    def by_formula(self, formula: dict) -> np.ndarray:
+        """Sites whose composition is exactly `formula`, e.g. {'Ni': 2, 'O': 1}."""
+        mask = self.composition.sum(axis=1) == sum(formula.values())
+        for element, count in formula.items():
+            mask &= self._element_column(element) == count
+        return np.flatnonzero(mask)
+
+    def containing(self, element: str, min_count: int = 1) -> np.ndarray:
+        """Sites with at least `min_count` atoms of `element`."""
+        return np.flatnonzero(self._element_column(element) >= min_count)
+
+    def distance_to(self, point, xy_only: bool = False) -> np.ndarray:
+        """Distance of every site to `point` (A), shortest periodic image; `xy_only` ignores the height."""
+        vectors = self.coordinates - np.asarray(point, dtype=float)
+        if xy_only:
+            vectors[:, 2] = 0.
+        vectors, _ = find_mic(vectors, self.cell, self.pbc)
+        if xy_only:
+            vectors[:, 2] = 0.
+        return np.linalg.norm(vectors, axis=1)
+
+    @property
+    def center(self) -> np.ndarray:
+        """Middle of the cell in the surface plane, at the mean site height."""
+        center = 0.5 * (self.cell[0] + self.cell[1])
+        center[2] = self.coordinates[:, 2].mean() if len(self) else 0.
+        return center
+
+    def distance_to_center(self) -> np.ndarray:
+        """In-plane distance of every site to the middle of the cell (A)."""
+        return self.distance_to(self.center, xy_only=True)
+
+    def within(self, point, radius: float, xy_only: bool = False) -> np.ndarray:
+        """Sites closer than `radius` (A) to `point`, nearest first."""
+        distance = self.distance_to(point, xy_only=xy_only)
+        rows = np.flatnonzero(distance < radius)
+        return rows[np.argsort(distance[rows], kind="stable")]
+
+    def nearest(self, point, k: int = 1, rows=None, xy_only: bool = False) -> np.ndarray:
+        """The `k` sites closest to `point`, optionally only among `rows`."""
+        rows = self._all() if rows is None else np.asarray(rows, dtype=int)
+        distance = self.distance_to(point, xy_only=xy_only)[rows]
+        return rows[np.argsort(distance, kind="stable")[:k]]
+
+    def query(self, connectivity=None, formula: dict = None, contains: str = None, near=None, radius: float = None) -> np.ndarray:
+        """Combined filter; every given criterion must hold. With `near` the result is sorted by distance
+        to it (and cut at `radius` if given), otherwise by site index."""
+        rows = self._all()
+        if connectivity is not None:
+            rows = np.intersect1d(rows, self.by_connectivity(connectivity))
+        if formula is not None:
+            rows = np.intersect1d(rows, self.by_formula(formula))
+        if contains is not None:
+            rows = np.intersect1d(rows, self.containing(contains))
+        if near is not None:
+            distance = self.distance_to(near)
+            if radius is not None:
+                rows = rows[distance[rows] < radius]
+            rows = rows[np.argsort(distance[rows], kind="stable")]
+        return rows
+
+    # --- conversion --------------------------------------------------------------------------------
+
+    def site_formula(self, row: int) -> dict:
+        return {e: int(c) for e, c in zip(self.elements, self.composition[row]) if c}
+
+    def site_dict(self, row: int) -> dict:
+        """One site in the `get_sites_from_atoms` row format, ready for `get_ads_slab`."""
+        return {
+            "coordinates": self.coordinates[row].copy(),
+            "connectivity": int(self.connectivity[row]),
+            "topology": [int(i) for i in self.topology[row] if i >= 0],
+            "n_vector": self.n_vector[row].copy(),
+            "h_vector": self.h_vector[row].copy(),
+            "site_formula": self.site_formula(row),
+        }
+
+    def to_dataframe(self, rows=None) -> pd.DataFrame:
+        """Sites as a DataFrame with the `Surface.site_df` columns; index = site row."""
+        rows = self._all() if rows is None else np.asarray(rows, dtype=int)
+        records = [self.site_dict(row) for row in rows]
+        columns = ["coordinates", "connectivity", "topology", "n_vector", "h_vector", "site_formula"]
+        return pd.DataFrame(records, index=rows, columns=columns)
+
+
+class SiteIndexStore:
+    """Site indices keyed by slab content hash, kept in memory and as .npz files."""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.environ.get("ADSKRK_SITE_INDEX_DIR", DEFAULT_SITE_INDEX_DIR)
+        self._indices = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.built = 0
+
+    @staticmethod
+    def make_key(atoms: ase.Atoms) -> str:
+        bare = ase.Atoms(numbers=atoms.numbers, positions=atoms.positions, cell=atoms.cell, pbc=atoms.pbc)
+        return atoms_hash(bare, "autoadsorbate.Surface", kind="sites")
+
+    def get(self, atoms: ase.Atoms) -> SiteIndex:
+        """Site index of `atoms`, built on first use."""
+        key = self.make_key(atoms)
+        with self._lock:
+            if key in self._indices:
+                self.hits += 1
+                return self._indices[key]
+            path = os.path.join(self.path, f"{key}.npz")
+            if os.path.exists(path):
+                index = SiteIndex.load(path)
+                self.disk_hits += 1
+            else:
+                index = SiteIndex.build(atoms, key=key)
+                self.built += 1
+                os.makedirs(self.path, exist_ok=True)
+                index.save(path)
+            self._indices[key] = index
+            return index
+
+    def stats(self) -> dict:
+        return {"in_memory": len(self._indices), "hits": self.hits, "disk_hits": self.disk_hits, "built": self.built}
+
+
+_site_index_store = None
+
+def get_site_index_store() -> SiteIndexStore:
+    """Process-wide site index store (location from ADSKRK_SITE_INDEX_DIR)."""
+    global _site_index_store
+    if _site_index_store is None:
+        _site_index_store = SiteIndexStore()
+    return _site_index_store
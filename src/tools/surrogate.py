@@ -0,0 +1,375 @@
+"""Surrogate pre-ranking of adsorption placements before any relaxation.
+
+Even after symmetry deduplication, sites x rotations x heights x conformers
+gives far more placements than can be relaxed, and which ones to relax was
+left to the LLM. `prerank` scores every placement cheaply and keeps only the
+most promising fraction:
+
+- geometric descriptors: closest adsorbate-slab contacts (absolute and
+  relative to the covalent radii), coordination and element composition of
+  the binding site, and adsorbate height;
+- one single-point energy and the forces on the adsorbate, evaluated for all
+  placements in one batched call (see `src.tools.batch`);
+- a scikit-learn model that predicts how much energy the relaxation will
+  release. The predicted relaxed energy is the single-point energy plus that
+  amount.
+
+The model is trained on past relaxations. `SurrogateStore` keeps one example
+per relaxed placement in an sqlite table: every `relax_atoms` result in the
+result cache (its stored first and last frame), and every placement relaxed
+by `screen_adsorption`. Each example records the force criterion and the
+optimizer of its relaxation (`relax_atoms`: BFGS or another optimizer to
+0.01 eV/A, screens: batched FIRE to their `fmax`, 0.05 by default), and a
+model only learns from examples relaxed like the placements it ranks. Every
+cache entry looked at by `harvest` is remembered, also the ones without
+an example (MD runs, bare slabs), so that a harvest only opens new entries.
+The model is refitted when new examples have arrived. With fewer than
+`MIN_EXAMPLES` examples, placements are ranked by their single-point energy
+alone.
+
+Ranking quality against relaxed energies is reported by `ranking_report`.
+Measure it on the bundled slabs, where every placement is relaxed as ground
+truth, with
+
+    python -m src.tools.surrogate evaluate --model emt
+    python -m src.tools.surrogate stats
+"""
+import argparse
+import contextlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import ase
+import ase.io
+from ase.data import covalent_radii, chemical_symbols
+from ase.geometry import get_distances
+
+from src.tools.batch import batched_energy_forces
+
+DEFAULT_SURROGATE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "adskrk", "surrogate")
+MIN_EXAMPLES = 20
+CONTACT_SCALE = 1.25  # contact: distance below this factor x sum of covalent radii
+SITE_ELEMENTS = ("Cu", "Ni", "Fe", "O", "Pt", "Pd", "Ag", "Au", "Co", "Zn")
+
+
+def placement_descriptors(atoms: ase.Atoms, n_slab: int = None) -> dict:
+    """Geometric descriptors of one placement (slab atoms first, then the adsorbate, binding atom first).
+    returns:
+        dict with 'n_adsorbate', 'min_distance', 'min_scaled_distance', 'mean_closest_3', 'binding_distance',
+        'binding_scaled_distance', 'binding_coordination', 'contacts', 'height' and 'site_<element>', the count of each
+        element among the slab atoms in contact with the binding atom
+    """
+    n_slab = atoms.info.get("n_slab") if n_slab is None else n_slab
+    slab_pos, ads_pos = atoms.positions[:n_slab], atoms.positions[n_slab:]
+    _, distances = get_distances(ads_pos, slab_pos, cell=atoms.cell, pbc=atoms.pbc)
+    radii = covalent_radii[atoms.numbers]
+    scaled = distances / (radii[n_slab:, None] + radii[None, :n_slab])
+    contacts = scaled < CONTACT_SCALE
+    site = contacts[0]
+    site_numbers = atoms.numbers[:n_slab][site]
+    closest = np.sort(distances.ravel())
+    row = {
+        "n_adsorbate": len(ads_pos),
+        "min_distance": float(closest[0]),
+        "min_scaled_distance": float(scaled.min()),
+        "mean_closest_3": float(closest[:3].mean()),
+        "binding_distance": float(distances[0].min()),
+        "binding_scaled_distance": float(scaled[0].min()),
+        "binding_coordination": int(site.sum()),
+        "contacts": int(contacts.sum()),
+        "height": float(ads_pos[:, 2].min() - slab_pos[:, 2].max()),
+    }
+    for element in SITE_ELEMENTS:
+        row[f"site_{element}"] = int((site_numbers == chemical_symbols.index(element)).sum())
+    return row
+
+def force_descriptors(forces: np.ndarray, n_slab: int) -> dict:
+    """Largest and mean force norm on the adsorbate atoms (log-scaled, forces of bad placements span decades)."""
+    norms = np.linalg.norm(forces[n_slab:], axis=1)
+    return {"log_max_force": float(np.log1p(norms.max())), "log_mean_force": float(np.log1p(norms.mean()))}
+
+def describe(candidates: list, calculator) -> pd.DataFrame:
+    """Descriptors and single-point energy ('sp_energy') of every candidate, the energies in one batched call."""
+    energies, forces = batched_energy_forces(calculator, candidates)
+    rows = []
+    for atoms, energy, f in zip(candidates, energies, forces):
+        n_slab = atoms.info["n_slab"]
+        rows.append({**placement_descriptors(atoms, n_slab), **force_descriptors(f, n_slab), "sp_energy": float(energy)})
+    return pd.DataFrame(rows)
+
+def _feature_names() -> list:
+    dummy = ase.Atoms("Cu2CO", positions=[[0, 0, 0], [2.5, 0, 0], [0, 0, 2.0], [0, 0, 3.1]], cell=[5, 5, 10], pbc=[True, True, False])
+    return list(placement_descriptors(dummy, 2)) + ["log_max_force", "log_mean_force"]
+
+FEATURES = _feature_names()
+
+
+class SurrogateStore:
+    """Training examples (descriptors of an unrelaxed placement, energy released by its relaxation) and the fitted model."""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.environ.get("ADSKRK_SURROGATE_DIR", DEFAULT_SURROGATE_DIR)
+        os.makedirs(self.path, exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS examples ("
+                "key TEXT PRIMARY KEY, calculator TEXT, features TEXT, sp_energy REAL, relaxed_energy REAL, source TEXT, created REAL, "
+                "fmax REAL, optimizer TEXT)"
+            )
+            columns = {row[1] for row in db.execute("PRAGMA table_info(examples)")}
+            for column, kind in (("fmax", "REAL"), ("optimizer", "TEXT")):
+                if column not in columns:
+                    # examples stored before the relaxation settings were recorded keep NULL
+                    db.execute(f"ALTER TABLE examples ADD COLUMN {column} {kind}")
+            db.execute("CREATE TABLE IF NOT EXISTS harvested (key TEXT PRIMARY KEY, used INTEGER, created REAL)")
+        self._models = {}  # (calculator, fmax, optimizer) -> (number of examples it was fitted on, model)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _connect(self):
+        db = sqlite3.connect(os.path.join(self.path, "examples.sqlite"), timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def add(self, key: str, calculator: str, features: dict, sp_energy: float, relaxed_energy: float, source: str = "screening",
+            fmax: float = None, optimizer: str = None):
+        """Store one relaxed placement; `features` as returned by `describe` (without 'sp_energy'),
+        `fmax` and `optimizer` the settings of its relaxation (None: unknown)."""
+        features = {k: features[k] for k in FEATURES}
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO examples (key, calculator, features, sp_energy, relaxed_energy, source, created, fmax, optimizer) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (key, calculator, json.dumps(features), float(sp_energy), float(relaxed_energy), source, time.time(),
+                        None if fmax is None else float(fmax), optimizer))
+
+    def harvest(self, result_cache=None) -> int:
+        """Add an example for every relaxation in the result cache that no earlier harvest has looked at.
+        Only adsorbate structures (info['n_slab']) whose calculator is recorded in the cache are used; the other
+        entries are remembered as seen and not opened again.
+        returns: int, number of new examples"""
+        from src.tools.cache import get_result_cache
+        from src.tools.trajstore import TrajectoryStore
+
+        cache = result_cache or get_result_cache()
+        with self._connect() as db:
+            seen = {key for (key,) in db.execute("SELECT key FROM harvested UNION SELECT key FROM examples")}
+        added, looked_at = 0, []
+        for entry in cache.entries():
+            if entry["key"] in seen:
+                continue
+            looked_at.append((entry["key"], 0, time.time()))
+            calculator = entry["meta"].get("calculator")
+            path = os.path.join(cache.path, entry["key"])
+            if entry["kind"] != "relax" or calculator is None or not os.path.isdir(path):
+                continue
+            store = TrajectoryStore(path)
+            n_slab = store.meta["info"].get("n_slab")
+            if n_slab is None or store.meta["n_atoms"] <= n_slab or "energy" not in store.fields or len(store) < 1:
+                continue
+            first = store[0]
+            features = {**placement_descriptors(first, n_slab), **force_descriptors(first.get_forces(apply_constraint=False), n_slab)}
+            energies = store.array("energy")
+            self.add(entry["key"], calculator, features, energies[0], energies[-1], source="result_cache",
+                     fmax=entry["meta"].get("fmax"), optimizer=entry["meta"].get("optimizer"))
+            looked_at[-1] = (entry["key"], 1, looked_at[-1][2])
+            added += 1
+        with self._connect() as db:
+            db.executemany("INSERT OR REPLACE INTO harvested (key, used, created) VALUES (?, ?, ?)", looked_at)
+        return added
+
+    def examples(self, calculator: str = None, fmax: float = None, optimizer: str = None) -> pd.DataFrame:
+        """Stored examples, optionally only those of one calculator, force criterion and optimizer:
+        the `FEATURES` columns plus 'sp_energy', 'relaxed_energy', 'calculator', 'source', 'fmax' and 'optimizer'."""
+        with self._connect() as db:
+            rows = db.execute("SELECT calculator, features, sp_energy, relaxed_energy, source, fmax, optimizer FROM examples "
+                              "WHERE (? IS NULL OR calculator = ?) AND (? IS NULL OR fmax = ?) AND (? IS NULL OR optimizer = ?)",
+                              (calculator, calculator, fmax, fmax, optimizer, optimizer)).fetchall()
+        return pd.DataFrame([{**json.loads(features), "sp_energy": sp, "relaxed_energy": relaxed, "calculator": calc, "source": source,
+                              "fmax": f, "optimizer": opt}
+                             for calc, features, sp, relaxed, source, f, opt in rows],
+                            columns=FEATURES + ["sp_energy", "relaxed_energy", "calculator", "source", "fmax", "optimizer"])
+
+    def model(self, calculator: str, fmax: float = None, optimizer: str = None):
+        """Regressor of the relaxation energy (relaxed minus single-point energy) from `FEATURES`, fitted on the examples
+        of `calculator` (and of `fmax` and `optimizer` if given), refitted when examples were added since the last fit;
+        None below `MIN_EXAMPLES` examples."""
+        data = self.examples(calculator, fmax=fmax, optimizer=optimizer)
+        if len(data) < MIN_EXAMPLES:
+            return None
+        with self._lock:
+            fitted = self._models.get((calculator, fmax, optimizer))
+            if fitted is None or fitted[0] != len(data):
+                from sklearn.ensemble import RandomForestRegressor
+                model = RandomForestRegressor(n_estimators=200, min_samples_leaf=2, random_state=0, n_jobs=1)
+                model.fit(data[FEATURES].to_numpy(float), (data["relaxed_energy"] - data["sp_energy"]).to_numpy(float))
+                fitted = self._models[(calculator, fmax, optimizer)] = (len(data), model)
+        return fitted[1]
+
+    def stats(self) -> dict:
+        with self._connect() as db:
+            rows = db.execute("SELECT calculator, source, fmax, optimizer, COUNT(*) FROM examples "
+                              "GROUP BY calculator, source, fmax, optimizer").fetchall()
+        return {"path": self.path, "examples": [{"calculator": c, "source": s, "fmax": f, "optimizer": o, "count": n}
+                                               for c, s, f, o, n in rows]}
+
+    def clear(self):
+        with self._connect() as db:
+            db.execute("DELETE FROM examples")
+            db.execute("DELETE FROM harvested")
+        self._models = {}
+
+
+_surrogate_store = None
+
+def get_surrogate_store() -> SurrogateStore:
+    """Process-wide surrogate store (location from ADSKRK_SURROGATE_DIR)."""
+    global _surrogate_store
+    if _surrogate_store is None:
+        _surrogate_store = SurrogateStore()
+    return _surrogate_store
+
+
+def prerank(candidates: list, calculator, calculator_id: str, keep_fraction: float = 0.3, min_keep: int = 1,
+            store: SurrogateStore = None, fmax: float = None, optimizer: str = None) -> pd.DataFrame:
+    """Score placements without relaxing them and select the most promising ones.
+    Args:
+        candidates: list of ase.Atoms placements with info['n_slab']
+        calculator: ase calculator for the single-point energies
+        calculator_id: str, its `calculator_identity`; the model is trained on examples of the same calculator
+        keep_fraction: float, fraction of the candidates selected (at least `min_keep`)
+        store: SurrogateStore (default: the process-wide one, harvested from the result cache first)
+        fmax, optimizer: force criterion and optimizer the selected placements will be relaxed with; if given, the
+            model is only trained on examples relaxed the same way
+    returns:
+        pandas.DataFrame in candidate order with the descriptors, 'sp_energy', 'predicted_energy', 'prerank'
+        (1 = most promising) and 'selected'; `table.attrs['scorer']` is "model" or "single_point"
+    """
+    if store is None:
+        store = get_surrogate_store()
+        store.harvest()
+    table = describe(candidates, calculator)
+    model = store.model(calculator_id, fmax=fmax, optimizer=optimizer)
+    if model is not None and len(table):
+        table["predicted_energy"] = table["sp_energy"] + model.predict(table[FEATURES].to_numpy(float))
+    else:
+        table["predicted_energy"] = table["sp_energy"]
+    table["prerank"] = table["predicted_energy"].rank(method="first").astype(int)
+    n_keep = min(len(table), max(min_keep, int(np.ceil(keep_fraction * len(table)))))
+    table["selected"] = table["prerank"] <= n_keep
+    table.attrs["scorer"] = "model" if model is not None else "single_point"
+    return table
+
+def ranking_report(predicted, actual, top_k: int = 3) -> dict:
+    """How well `predicted` energies rank candidates whose `actual` (relaxed) energies are known.
+    returns:
+        dict with 'n', 'kendall_tau', 'spearman', 'top_k_recall' (share of the true top_k found in the predicted top_k)
+        and 'regret' (actual energy of the predicted best minus the true best, eV)
+    """
+    from scipy import stats
+
+    predicted, actual = np.asarray(predicted, float), np.asarray(actual, float)
+    known = np.isfinite(predicted) & np.isfinite(actual)
+    predicted, actual = predicted[known], actual[known]
+    if len(actual) < 2:
+        return {"n": int(len(actual)), "kendall_tau": np.nan, "spearman": np.nan, "top_k_recall": np.nan, "regret": np.nan}
+    k = min(top_k, len(actual))
+    true_top, predicted_top = set(np.argsort(actual)[:k]), set(np.argsort(predicted)[:k])
+    return {
+        "n": int(len(actual)),
+        "kendall_tau": float(stats.kendalltau(predicted, actual).statistic),
+        "spearman": float(stats.spearmanr(predicted, actual).statistic),
+        "top_k_recall": len(true_top & predicted_top) / k,
+        "regret": float(actual[np.argmin(predicted)] - actual.min()),
+    }
+
+
+def evaluate(slab_paths: list, smiles: str, calculator, calculator_id: str, rotations=(0., 60., 120.), heights=(1.5, 2.5),
+             top_k: int = 3, fmax: float = 0.05, steps: int = 300) -> pd.DataFrame:
+    """Relax every placement on every slab and compare single-point and surrogate rankings with the relaxed energies.
+    The surrogate of each slab is trained only on the placements of the other slabs (leave-one-slab-out).
+    returns: pandas.DataFrame, one row per (slab, scorer) with the `ranking_report` columns"""
+    from src.tools.batch import batch_relax
+    from src.tools.cache import atoms_hash
+    from src.tools.layers import fix_bottom
+    from src.tools.screening import enumerate_placements
+
+    results = {}
+    for path in slab_paths:
+        slab = ase.io.read(path)
+        placements = list(enumerate_placements(slab, smiles, rotations=rotations, heights=heights)["atoms"])
+        for atoms in placements:
+            atoms.constraints = fix_bottom(atoms)
+        relaxed = batch_relax(placements, calculator, fmax=fmax, steps=steps)
+        results[path] = (placements, describe(placements, calculator), np.array([a.get_potential_energy() for a in relaxed]))
+
+    rows = []
+    for path, (placements, table, actual) in results.items():
+        tmp = tempfile.TemporaryDirectory()
+        store = SurrogateStore(tmp.name)
+        for other, (other_placements, other_table, other_actual) in results.items():
+            if other == path:
+                continue
+            for atoms, (_, features), energy in zip(other_placements, other_table.iterrows(), other_actual):
+                store.add(atoms_hash(atoms, calculator_id, kind="surrogate"), calculator_id, features, features["sp_energy"], energy,
+                          fmax=fmax, optimizer="FIRE")
+        model = store.model(calculator_id, fmax=fmax, optimizer="FIRE")
+        name = os.path.splitext(os.path.basename(path))[0]
+        rows.append({"slab": name, "scorer": "single_point", "n_train": 0, **ranking_report(table["sp_energy"], actual, top_k)})
+        if model is not None:
+            predicted = table["sp_energy"] + model.predict(table[FEATURES].to_numpy(float))
+            rows.append({"slab": name, "scorer": "model", "n_train": len(store.examples(calculator_id)),
+                         **ranking_report(predicted, actual, top_k)})
+        tmp.cleanup()
+    return pd.DataFrame(rows)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect the surrogate training data or evaluate the pre-ranking.")
+    parser.add_argument("--path", type=str, default=None, help="Store directory (default: $ADSKRK_SURROGATE_DIR or ~/.cache/adskrk/surrogate).")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Number of training examples per calculator and source.")
+    sub.add_parser("harvest", help="Add the relaxations in the result cache as training examples.")
+    sub.add_parser("clear", help="Remove every training example.")
+    evaluation = sub.add_parser("evaluate", help="Rank placements on the bundled slabs against fully relaxed energies.")
+    evaluation.add_argument("--model", type=str, default="emt", help="Calculator, 'emt' or a MACE-MP model.")
+    evaluation.add_argument("--smiles", type=str, default="Cl[C-]=O")
+    evaluation.add_argument("--slabs", nargs="+", default=None, help="Slab files (default: notebooks/*.xyz the calculator supports).")
+    evaluation.add_argument("--top_k", type=int, default=3)
+    return parser.parse_args()
+
+def main_cli():
+    args = parse_args()
+    if args.command == "evaluate":
+        import glob
+        from src.tools.calculators import calculator_identity, get_calculator
+
+        slabs = args.slabs
+        if slabs is None:
+            root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            slabs = sorted(glob.glob(os.path.join(root, "notebooks", "*.xyz")))
+            if args.model == "emt":
+                slabs = [p for p in slabs if "Fe" not in ase.io.read(p).get_chemical_symbols()]
+        table = evaluate(slabs, args.smiles, get_calculator(model=args.model), calculator_identity(model=args.model), top_k=args.top_k)
+        with pd.option_context("display.width", 200, "display.max_columns", 20):
+            print(table.round(3).to_string(index=False))
+        return
+    store = SurrogateStore(path=args.path)
+    if args.command == "stats":
+        print(json.dumps(store.stats(), indent=2))
+    elif args.command == "harvest":
+        print(f"added {store.harvest()} examples")
+    elif args.command == "clear":
+        store.clear()
+        print("training examples cleared")
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,130 @@
+"""Symmetry-aware deduplication of surface sites and placed configurations.
+
+`Surface(atoms).site_df` lists every site of the slab, including all the
+copies that are equivalent under the translational and point symmetry of the
+surface. Equivalent sites have the same local environment, so sites are
+grouped by connectivity, site formula and the sorted distances/elements of
+their nearest slab atoms (periodic images included). Placed configurations
+are compared the same way: per adsorbate atom distances to the nearest slab
+atoms plus the internal distances of the adsorbate.
+"""
+import numpy as np
+import pandas as pd
+import ase
+from ase.neighborlist import primitive_neighbor_list
+
+
+def _nearest_neighbors(slab: ase.Atoms, points: np.ndarray, n_neighbors: int, cutoff: float = 5.):
+    """Distances and atomic numbers of the `n_neighbors` slab atoms closest to each point, periodic images included.
+    returns:
+        distances: np.ndarray (n_points, n_neighbors), sorted ascending
+        numbers: np.ndarray (n_points, n_neighbors), atomic numbers in the same order
+    """
+    points = np.atleast_2d(points)
+    n_slab = len(slab)
+    n_neighbors = min(n_neighbors, n_slab)
+    positions = np.vstack([slab.positions, points])
+    numbers = np.concatenate([slab.numbers, np.zeros(len(points), dtype=int)])
+
+    while True:
+        i, j, d = primitive_neighbor_list("ijd", slab.pbc, slab.cell, positions, cutoff, self_interaction=False)
+        keep = (i >= n_slab) & (j < n_slab)
+        i, j, d = i[keep] - n_slab, j[keep], d[keep]
+        counts = np.bincount(i, minlength=len(points))
+        if counts.min(initial=n_neighbors) >= n_neighbors or cutoff > 4 * np.abs(slab.cell.lengths()).max():
+            break
+        cutoff *= 1.5
+
+    distances = np.full((len(points), n_neighbors), np.inf)
+    neighbor_numbers = np.zeros((len(points), n_neighbors), dtype=int)
+    order = np.lexsort((numbers[j], np.round(d, 2), i))
+    i, j, d = i[order], j[order], d[order]
+    starts = np.searchsorted(i, np.arange(len(points)))
+    for p, start in enumerate(starts):
+        stop = min(start + min(counts[p], n_neighbors), len(i))
+        distances[p, :stop - start] = d[start:stop]
+        neighbor_numbers[p, :stop - start] = numbers[j[start:stop]]
+    return distances, neighbor_numbers
+
+
+def site_equivalence_index(slab: ase.Atoms, site_df: pd.DataFrame, n_neighbors: int = 12, tol: float = 0.05) -> pd.DataFrame:
+    """Group the sites of a slab into symmetry-equivalence classes.
+    Args:
+        slab: ase.Atoms of the slab the sites were computed on
+        site_df: pandas.DataFrame as returned by `get_sites_from_atoms(slab)`
+        n_neighbors: int, number of nearest slab atoms describing the site environment
+        tol: float, maximum distance difference in angstrom for two environments to match
+    returns:
+        copy of site_df with the extra columns 'equivalence_class' (int, first class is 0)
+        and 'n_equivalent' (number of sites in the same class)
+    """
+    coordinates = np.array([np.asarray(c, dtype=float) for c in site_df["coordinates"]]).reshape(-1, 3)
+    distances, numbers = _nearest_neighbors(slab, coordinates, n_neighbors)
+
+    labels = np.full(len(site_df), -1)
+    representatives = {}
+    for row, (connectivity, formula) in enumerate(zip(site_df["connectivity"], site_df["site_formula"])):
+        group = (int(connectivity), tuple(sorted(dict(formula).items())))
+        for label, rep in representatives.get(group, []):
+            if np.array_equal(numbers[row], numbers[rep]) and np.abs(distances[row] - distances[rep]).max() <= tol:
+                labels[row] = label
+                break
+        else:
+            labels[row] = labels.max() + 1
+            representatives.setdefault(group, []).append((labels[row], row))
+
+    index = site_df.copy()
+    index["equivalence_class"] = labels
+    index["n_equivalent"] = index.groupby("equivalence_class")["equivalence_class"].transform("size")
+    return index
+
+def unique_sites(slab: ase.Atoms, site_df: pd.DataFrame, n_neighbors: int = 12, tol: float = 0.05) -> pd.DataFrame:
+    """One representative site per symmetry-equivalence class, see `site_equivalence_index`."""
+    index = site_equivalence_index(slab, site_df, n_neighbors=n_neighbors, tol=tol)
+    return index.drop_duplicates("equivalence_class")
+
+
+class ConfigurationIndex:
+    """Fingerprint index of placed adsorbate configurations on one slab.
+
+    Two configurations of the same adsorbate are duplicates when every adsorbate
+    atom sees the same nearest slab environment and the adsorbate internal
+    distances match, i.e. they are related by a symmetry of the slab.
+    """
+
+    def __init__(self, n_slab: int, n_neighbors: int = 6, tol: float = 0.1):
+        self.n_slab = n_slab
+        self.n_neighbors = n_neighbors
+        self.tol = tol
+        self._fingerprints = []
+
+    def fingerprint(self, ads_slab: ase.Atoms) -> tuple:
+        """(numbers, distance vector) fingerprint of the adsorbate in `ads_slab`."""
+        slab, adsorbate = ads_slab[:self.n_slab], ads_slab[self.n_slab:]
+        distances, numbers = _nearest_neighbors(slab, adsorbate.positions, self.n_neighbors)
+        internal = adsorbate.get_all_distances(mic=True)[np.triu_indices(len(adsorbate), k=1)]
+        return (
+            np.concatenate([adsorbate.numbers, numbers.ravel()]),
+            np.concatenate([distances.ravel(), internal]),
+        )
+
+    def add(self, ads_slab: ase.Atoms) -> bool:
+        """Register a configuration.
+        returns:
+            bool, True if the configuration is new, False if an equivalent one was already added
+        """
+        numbers, distances = self.fingerprint(ads_slab)
+        for known_numbers, known_distances in self._fingerprints:
+            if np.array_equal(known_numbers, numbers) and np.abs(known_distances - distances).max(initial=0.) <= self.tol:
+                return False
+        self._fingerprints.append((numbers, distances))
+        return True
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+
+def deduplicate_configurations(atoms_list: list, n_slab: int, n_neighbors: int = 6, tol: float = 0.1) -> list:
+    """Indices of the symmetry-unique configurations in `atoms_list`, in input order."""
+    index = ConfigurationIndex(n_slab, n_neighbors=n_neighbors, tol=tol)
+    return [i for i, atoms in enumerate(atoms_list) if index.add(atoms)]
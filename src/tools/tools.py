@@ -1,19 +1,30 @@
 import ase
-from ase.io import read, write
-from autoadsorbate import Surface, Fragment
 from ase.constraints import FixAtoms
-from autoadsorbate.Surf import attach_fragment
-from ase.optimize import BFGS
-from ase.io.trajectory import Trajectory
-import torch
-from mace.calculators import mace_mp
-from ase.md.langevin import Langevin
-from ase import units
+from ase.io import write
 import os
-from ase.md.velocitydistribution import MaxwellBoltzmannDistribution
+import numpy as np
+import shutil
 
-# mace calculator harcoded for the time being
+from src.tools.calculators import TOOLS_MODEL, get_calculator, calculator_identity
+from src.tools.cache import atoms_hash, get_result_cache
+from src.tools.conformers import get_conformer_library
+from src.tools.site_index import get_site_index_store
+from src.tools.layers import fix_bottom
+from src.tools.optimizers import make_optimizer
+from src.tools.batch import batch_relax
+from src.tools.symmetry import unique_sites
+from src.tools.md import MDStream, langevin_frames
+from src.tools.neighbors import with_neighbor_skin
+from src.tools.embedding import Embedding, receptive_field
+from src.tools.ensemble import ensemble_langevin, summarize_replicas
+from src.tools.observers import ObserverSet, default_observers, run_observed
+from src.tools.tracing import annotate, traced
+from src.tools.trajstore import TrajectoryStore, TrajectoryWriter, run_dir
+from src.tools.references import gas_phase_molecule, get_reference_table, relax_reference
 
+# MACE-MP medium unless ADSKRK_MODEL says otherwise, loaded once per process through the calculator pool
+
+@traced
 def read_atoms_object(path: str):
     """Reads a atomistic structure file 
     Args:
@@ -23,6 +34,7 @@ def read_atoms_object(path: str):
     """
     return ase.io.read(path)
 
+@traced
 def get_sites_from_atoms(atoms: ase.Atoms): 
     """Get all possible binding sites from atoms of a slab.
     Args:
@@ -38,8 +50,40 @@ def get_sites_from_atoms(atoms: ase.Atoms):
         - 'h_vector': Unit vector describing the rotation around n_vector;
         - 'site_formula': dictionary indicating the composition of the site.
     """
-    return Surface(atoms).site_df
+    # site detection runs once per slab, later calls read the persisted site index
+    return get_site_index_store().get(atoms).to_dataframe()
+
+@traced
+def get_site_index(atoms: ase.Atoms):
+    """Get a fast, queryable index of all binding sites of a slab (same sites as `get_sites_from_atoms`).
+    Args:
+        atoms: ase.Atoms object of the slab.
+    Returns:
+        SiteIndex with numpy columns 'coordinates', 'n_vector', 'h_vector' (n_sites, 3), 'connectivity' (n_sites,),
+        'topology' (n_sites, max_connectivity, padded with -1), 'composition' (n_sites, n_elements, counts of `elements`).
+        Queries return numpy arrays of site rows:
+        - index.query(connectivity=3, formula={'Ni': 2, 'Fe': 1}, contains='O', near=[x, y, z], radius=3.0);
+        - index.by_connectivity(c), index.by_formula(dict), index.containing(element),
+          index.within(point, radius), index.nearest(point, k);
+        - index.distance_to(point) and index.distance_to_center() give distances of all sites (A).
+        index.site_dict(row) returns the site_dict for `get_ads_slab`; index.to_dataframe(rows) the DataFrame rows.
+    """
+    return get_site_index_store().get(atoms)
 
+@traced
+def get_unique_sites_from_atoms(atoms: ase.Atoms):
+    """Get one binding site per group of symmetry-equivalent sites of a slab.
+    Args:
+        atoms: ase.Atoms object. Determines all surface sites.
+    Returns:
+        pandas.DataFrame with the same columns as `get_sites_from_atoms` plus
+        - 'equivalence_class': int label shared by all sites with the same local environment;
+        - 'n_equivalent': number of sites of the slab equivalent to this one.
+        Relaxing one site of each class is enough, the other sites give the same result.
+    """
+    return unique_sites(atoms, get_sites_from_atoms(atoms))
+
+@traced
 def get_fragment(SMILES: str, to_initialize=1, conformer_i=0):
     """Generate a molecular fragment with conformations from a SMILES string.
     Args:
@@ -49,8 +93,10 @@ def get_fragment(SMILES: str, to_initialize=1, conformer_i=0):
     returns:
         ase.Atoms of molecule or molecular fragment, alligned relative to the site in [0,0,0]
     """
-    return Fragment(SMILES, to_initialize=to_initialize).get_conformer(conformer_i)
+    # conformers of a (SMILES, to_initialize) pair are generated once and reused across calls and sessions
+    return get_conformer_library().get_conformer(SMILES, conformer_i, to_initialize=to_initialize)
 
+@traced
 def get_ads_slab(slab_atoms: ase.Atoms, fragment_atoms: ase.Atoms, site_dict: dict, height: float = 1.5, n_rotation: float = 0.):
     """Placing a fragment on a slab at a selected site defined by `site_dict`
     Args:
@@ -62,74 +108,322 @@ def get_ads_slab(slab_atoms: ase.Atoms, fragment_atoms: ase.Atoms, site_dict: di
     returns:
         ase.Atoms of molecule placed on slab
     """
+    from autoadsorbate.Surf import attach_fragment
 
+    n_slab = len(slab_atoms)
     ads_slab_atoms = attach_fragment(
-        atoms = slab_atoms,
+        atoms = slab_atoms.copy(),  # attach_fragment adds the fragment to the atoms it is given
         site_dict = site_dict,
         fragment = fragment_atoms,
         n_rotation = n_rotation,
         height = height   
     )
+    # remembered so that MD/analysis tools can tell slab and adsorbate atoms apart
+    ads_slab_atoms.info['n_slab'] = n_slab
 
     return ads_slab_atoms
 
-def relax_atoms(atoms: ase.Atoms, output_dir='./'):
+@traced
+def relax_atoms(atoms: ase.Atoms, output_dir='./', use_cache: bool = True, early_stop: bool = True,
+                fixed_layers: int = None, fixed_depth: float = None, optimizer: str = "BFGS", steps: int = None,
+                embed_radius: float = None):
     """Atomic energy miniization.
     Args:
         atoms: ase.Atoms, atoms that need to be relaxed
-        output_dir: str, where to write relax trajectory file
+        output_dir: str, directory in which the run gets its own folder with the trajectory and optimizer log
+        use_cache: bool, reuse the result of an identical earlier relaxation instead of recomputing it
+        early_stop: bool, stop as soon as the relaxation is hopeless (adsorbate desorbed or dissociated, forces exploded, energy stalled)
+        fixed_layers: int or None, number of bottom slab layers kept fixed
+        fixed_depth: float or None, fix slab layers more than this many angstrom below the top layer
+            (needs atoms.info['n_slab'], as set by `get_ads_slab`; default when both are None: the bottom half
+            of the slab is fixed)
+        optimizer: str, "BFGS", "LBFGS", "FIRE", "BFGSLineSearch" or "PreconLBFGS"; only the free atoms are optimized
+        steps: int or None, maximum number of optimizer steps (None: until converged)
+        embed_radius: float or None, for large slabs: also freeze slab atoms farther than this (angstrom) from the
+            adsorbate and evaluate only the free atoms plus the fixed atoms within the model's reach of them
+            (much faster on big supercells; None: the whole structure is evaluated)
     returns:
-        relaxed_atoms: ase.Atoms, atoms of relaxed structure
+        relaxed_atoms: ase.Atoms, atoms of relaxed structure; relaxed_atoms.info['trajectory'] is the run folder
+        (read it with `src.tools.trajstore.TrajectoryStore`).
+        relaxed_atoms.info['stop_reason'] tells how the relaxation ended: 'converged', 'max_steps',
+        'desorbed', 'dissociated', 'diverged' or 'stalled'; relaxed_atoms.info['stop_details'] gives the numbers behind it.
     """
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    mace_calculator = mace_mp(model="medium", device=str(device), dispersion=False)
-
     relaxed_atoms = atoms.copy()
-    relaxed_atoms.calc = mace_calculator
+    relaxed_atoms.constraints = fix_bottom(relaxed_atoms, n_layers=fixed_layers, depth=fixed_depth)
 
-    relaxed_atoms.constraints = FixAtoms(indices=[atom.index for atom in relaxed_atoms if atom.position[2] < relaxed_atoms.cell[2][2] * .5])
-    
-    dyn = BFGS(relaxed_atoms, trajectory=os.path.join(output_dir, "relax.traj"), logfile="relax.log")
-    dyn.run(fmax=0.01)
+    run_path = run_dir(output_dir, "relax")
+    calculator = calculator_identity(model=TOOLS_MODEL, dispersion=False)
+    key = atoms_hash(relaxed_atoms, calculator, kind="relax", optimizer=optimizer, fmax=0.01,
+                     early_stop=early_stop, **({"steps": steps} if steps is not None else {}),
+                     **({"embed_radius": embed_radius} if embed_radius is not None else {}))
+    cached = get_result_cache().get(key) if use_cache else None
+    if cached is not None:
+        shutil.copytree(cached, run_path, dirs_exist_ok=True)
+        relaxed_atoms = TrajectoryStore(run_path)[-1]
+        stop = get_result_cache().get_meta(key).get("stop", {})
+        if "reason" not in stop:
+            # entry stored without its outcome: judge it from the final forces
+            fmax = np.sqrt((relaxed_atoms.get_forces() ** 2).sum(axis=1).max())
+            stop = {"reason": "converged" if fmax < 0.01 else "max_steps", "details": {}}
+        relaxed_atoms.info["stop_reason"] = stop["reason"]
+        relaxed_atoms.info["stop_details"] = stop.get("details", {})
+        relaxed_atoms.info["trajectory"] = run_path
+        annotate(cached=True)
+        return relaxed_atoms
 
+    mace_calculator = get_calculator(model=TOOLS_MODEL, dispersion=False)
+    embedding, work = None, relaxed_atoms
+    if embed_radius is not None:
+        embedding = Embedding(relaxed_atoms, receptive_field(mace_calculator, relaxed_atoms), free_radius=embed_radius)
+        embedding.calibrate(mace_calculator)
+        relaxed_atoms.constraints = [embedding.constraint]
+        work = embedding.subsystem
+    work.calc = with_neighbor_skin(mace_calculator)
+
+    observers = default_observers(work, kind="relax") if early_stop else ObserverSet()
+    dyn = make_optimizer(optimizer, work, logfile=os.path.join(run_path, "relax.log"))
+    with TrajectoryWriter(run_path, relaxed_atoms) as traj:
+        if embedding is None:
+            dyn.attach(traj.write, atoms=relaxed_atoms)
+        else:
+            dyn.attach(lambda: traj.write(embedding.expand(work)))
+        stop = run_observed(dyn, work, observers, fmax=0.01, **({"steps": steps} if steps is not None else {}))
+        if embedding is not None:
+            # the last frame is the relaxed structure evaluated as a whole
+            embedding.write_back(relaxed_atoms, work)
+            relaxed_atoms.calc = mace_calculator
+            traj.write(relaxed_atoms)
+    dyn.close()
+    annotate(cached=False, optimizer=optimizer, steps=dyn.nsteps, stop_reason=stop["reason"], n_atoms=len(relaxed_atoms),
+             n_evaluated=len(work))
+    relaxed_atoms.info["stop_reason"] = stop["reason"]
+    relaxed_atoms.info["stop_details"] = stop["details"]
+    relaxed_atoms.info["trajectory"] = run_path
+
+    # runs cut short by an observer are not stored: a cache hit is always a relaxation that ran to its end
+    if use_cache and stop["reason"] in ("converged", "max_steps"):
+        get_result_cache().put(key, run_path, kind="relax", formula=relaxed_atoms.get_chemical_formula(),
+                               energy=relaxed_atoms.get_potential_energy(), steps=dyn.nsteps, stop=stop, calculator=calculator,
+                               fmax=0.01, optimizer=optimizer)
     return relaxed_atoms
 
-def md_run_atoms(atoms: ase.Atoms, steps: int = 100, temperature_K: float = 300, output_dir='./'):
+@traced
+def relax_many(atoms_list: list, fmax: float = 0.01, steps: int = 1000, fixed_layers: int = None, fixed_depth: float = None,
+               model: str = None):
+    """Relax many candidate structures at once; much faster per structure than calling `relax_atoms` in a loop.
+    Args:
+        atoms_list: list of ase.Atoms, e.g. the same fragment placed on different sites
+        fmax: float, force convergence criterion in eV/A
+        steps: int, maximum number of optimizer steps per structure
+        fixed_layers, fixed_depth: bottom-layer constraint for structures without constraints, as in `relax_atoms`
+        model: str or None, MACE-MP model ("small" is faster and less accurate than the default "medium")
+    returns:
+        list of relaxed ase.Atoms in the same order; `atoms.get_potential_energy()` gives the final energy,
+        atoms.info['relax_converged'] tells if the structure reached fmax
+    """
+    mace_calculator = get_calculator(model=model or TOOLS_MODEL, dispersion=False)
+
+    candidates = []
+    for atoms in atoms_list:
+        atoms = atoms.copy()
+        if not atoms.constraints:
+            atoms.constraints = fix_bottom(atoms, n_layers=fixed_layers, depth=fixed_depth)
+        candidates.append(atoms)
+
+    return batch_relax(candidates, mace_calculator, fmax=fmax, steps=steps)
+
+@traced
+def md_run_atoms(atoms: ase.Atoms, steps: int = 100, temperature_K: float = 300, output_dir='./', use_cache: bool = True,
+                 stride: int = 1, stream: bool = False, desorption_distance: float = 3.0, early_stop: bool = True,
+                 fixed_layers: int = None, fixed_depth: float = None, embed_radius: float = None):
     """
     THis function runs molecular dynamics at selected temperature for selected number of steps and returns list of frames as ase atoms.
     Args:
         atoms: ase.Atoms, atoms that need to run MD
         steps: int, number of inonic steps in MD
         temperature_K: float, Temperature in K
+        output_dir: str, directory in which the run gets its own folder with the trajectory
+        use_cache: bool, reuse the trajectory of an identical earlier run instead of recomputing it
+        stride: int, keep only every `stride`-th frame (the first frame is always kept)
+        stream: bool, if True return an iterator over frames instead of a list; use it for long runs.
+            Loop over it (`for frame in md: ...`); afterwards `md.observables` is a DataFrame with per-frame
+            'adsorbate_height', 'binding_distance', 'desorbed' and `md.summary()` tells if and when the adsorbate desorbed.
+        desorption_distance: float, binding-atom to surface distance in angstrom above which the adsorbate counts as desorbed
+        early_stop: bool, end the run as soon as the adsorbate desorbs or dissociates or the forces explode
+        fixed_layers, fixed_depth: bottom-layer constraint, as in `relax_atoms`
+        embed_radius: float or None, evaluate only the atoms near the adsorbate, as in `relax_atoms`
         
     returns:
-        MD_traj: list of ase.Atoms, frames of MD simulation.
+        MD_traj: list of ase.Atoms, frames of MD simulation (or the frame iterator if stream=True).
+        The last frame's info['stop_reason'] is 'completed', 'desorbed', 'dissociated' or 'diverged'
+        (with stream=True: `md.stop`), and info['trajectory'] the run folder (`md.trajectory`); read it with
+        `src.tools.trajstore.TrajectoryStore`, e.g. `TrajectoryStore(path).to_xyz("md.xyz")`.
     """
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    mace_calculator = mace_mp(model="medium", device=str(device), dispersion=False)
-
-    atoms.calc = mace_calculator
-    atoms.constraints = FixAtoms(indices=[atom.index for atom in atoms if atom.position[2] < atoms.cell[2][2] * .5])
-
-    MaxwellBoltzmannDistribution(atoms, temperature_K=300)
-    
-    dyn = Langevin(
-        atoms,
-        timestep=1.0 * units.fs,         
-        temperature_K = temperature_K,   
-        friction = 0.002,                
-    )
+    atoms.constraints = fix_bottom(atoms, n_layers=fixed_layers, depth=fixed_depth)
 
-    traj = Trajectory(os.path.join(output_dir, "md.traj"), 'w', atoms)
-    dyn.attach(traj.write, interval=1)
+    run_path = run_dir(output_dir, "md")
+    key = atoms_hash(atoms, calculator_identity(model=TOOLS_MODEL, dispersion=False), kind="md", steps=steps,
+                     temperature_K=temperature_K, timestep_fs=1.0, friction=0.002, stride=stride,
+                     early_stop=early_stop, desorption_distance=desorption_distance,
+                     **({"embed_radius": embed_radius} if embed_radius is not None else {}))
+    observers = default_observers(atoms, kind="md", max_distance=desorption_distance) if early_stop else ObserverSet()
+    cached = get_result_cache().get(key) if use_cache else None
+    if cached is not None:
+        shutil.copytree(cached, run_path, dirs_exist_ok=True)
+        store = TrajectoryStore(run_path)
+        frames = iter(store)
+        stop = get_result_cache().get_meta(key).get("stop", {})
+        observers.reason, observers.step, observers.details = stop.get("reason"), stop.get("step"), stop.get("details", {})
 
-    dyn.run(steps)
+        def on_finish():
+            # leave `atoms` in its final MD state, as a fresh run would
+            final = store[-1]
+            atoms.set_positions(final.positions, apply_constraint=False)
+            atoms.set_momenta(final.get_momenta(), apply_constraint=False)
+    else:
+        mace_calculator = get_calculator(model=TOOLS_MODEL, dispersion=False)
+        embedding, work = None, atoms
+        if embed_radius is not None:
+            embedding = Embedding(atoms, receptive_field(mace_calculator, atoms), free_radius=embed_radius)
+            embedding.calibrate(mace_calculator)
+            atoms.constraints = [embedding.constraint]
+            work = embedding.subsystem
+            observers = default_observers(work, kind="md", max_distance=desorption_distance) if early_stop else ObserverSet()
+        work.calc = with_neighbor_skin(mace_calculator)
 
-    MD_traj = read(os.path.join(output_dir, "md.traj"), index=':')
-    write(os.path.join(output_dir, "md_traj.xyz"), MD_traj)
+        from ase.md.velocitydistribution import MaxwellBoltzmannDistribution
+        MaxwellBoltzmannDistribution(work, temperature_K=300)
+        frames = langevin_frames(work, steps, temperature_K, stride=stride, store_path=run_path, timestep_fs=1.0, friction=0.002,
+                                 observers=observers, embedding=embedding)
+
+        def on_finish():
+            if embedding is not None:
+                embedding.write_back(atoms, work)
+            if use_cache:
+                get_result_cache().put(key, run_path, kind="md", formula=atoms.get_chemical_formula(),
+                                       steps=steps, temperature_K=temperature_K, stride=stride, stop=observers.report("completed"))
+
+    annotate(cached=cached is not None, steps=steps, stream=stream, n_atoms=len(atoms))
+    md_stream = MDStream(frames, n_slab=atoms.info.get("n_slab"), desorption_distance=desorption_distance,
+                         stride=stride, on_finish=on_finish, observers=observers, trajectory=run_path)
+    if stream:
+        return md_stream
+
+    MD_traj = list(md_stream)
+    MD_traj[-1].info["stop_reason"] = md_stream.stop["reason"]
+    MD_traj[-1].info["stop_details"] = md_stream.stop["details"]
+    MD_traj[-1].info["trajectory"] = run_path
 
     return MD_traj
 
+@traced
+def md_ensemble(atoms, n_replicas: int = 8, steps: int = 100, temperature_K=300, seed: int = 0, stride: int = 1,
+                desorption_distance: float = 3.0, early_stop: bool = True, fixed_layers: int = None, fixed_depth: float = None,
+                model: str = None):
+    """Run several MD replicas of an adsorption structure at once to judge its binding stability statistically;
+    much faster than calling `md_run_atoms` once per replica. No frames are returned, only statistics.
+    Args:
+        atoms: ase.Atoms, or a list of ase.Atoms used as starting structures in turn (e.g. several relaxed placements)
+        n_replicas: int, number of replicas
+        steps: int, MD steps per replica
+        temperature_K: float, or a list of temperatures in K used in turn
+        seed: int, replica i draws its initial velocities and thermostat noise with seed + i
+        stride: int, sample the observables every `stride` steps
+        desorption_distance: float, binding-atom to surface distance in angstrom above which the adsorbate counts as desorbed
+        early_stop: bool, a replica stops as soon as its adsorbate desorbs or dissociates or the forces explode
+        fixed_layers, fixed_depth: bottom-layer constraint for structures without constraints, as in `relax_atoms`
+        model: str or None, MACE-MP model ("small" is faster and less accurate than the default "medium")
+    returns:
+        summary: dict with 'n_replicas', 'stop_reasons', 'n_censored' (replicas stopped as dissociated or diverged,
+            left out of the next two), 'desorption_probability' (+ '_stderr'), 'mean_residence_time_fs'
+            (time until desorption; replicas that stayed bound count with the full run), 'mean_binding_distance',
+            'std_binding_distance' (spread over replicas), 'mean_energy' and, for several temperatures, 'by_temperature'
+        replicas: pandas.DataFrame, one row per replica with its seed, temperature, steps, stop_reason, desorbed,
+            first_desorbed_step, residence_time_fs, censored and mean/std/final binding distance and adsorbate height
+    """
+    starts = list(atoms) if isinstance(atoms, (list, tuple)) else [atoms]
+    temperatures = list(temperature_K) if isinstance(temperature_K, (list, tuple, np.ndarray)) else [temperature_K]
+    replicas = []
+    for i in range(n_replicas):
+        replica = starts[i % len(starts)].copy()
+        if not replica.constraints:
+            replica.constraints = fix_bottom(replica, n_layers=fixed_layers, depth=fixed_depth)
+        replicas.append(replica)
+
+    mace_calculator = get_calculator(model=model or TOOLS_MODEL, dispersion=False)
+    table = ensemble_langevin(replicas, mace_calculator, steps, [temperatures[i % len(temperatures)] for i in range(n_replicas)],
+                              [seed + i for i in range(n_replicas)], stride=stride, desorption_distance=desorption_distance,
+                              early_stop=early_stop)
+    annotate(n_replicas=n_replicas, steps=steps, n_atoms=len(replicas[0]))
+    return summarize_replicas(table), table
+
+@traced
+def adsorption_energy(ads_slab: ase.Atoms, slab: ase.Atoms, smiles: str, output_dir='./', relax: bool = True,
+                      fixed_layers: int = None, fixed_depth: float = None, optimizer: str = "BFGS", to_initialize: int = 1,
+                      early_stop: bool = True, steps: int = None):
+    """Adsorption energy E(adsorbate on slab) - E(bare slab) - E(gas-phase molecule), all relaxed with the same calculator.
+    The bare slab and molecule energies come from a persistent reference table: they are relaxed once and reused
+    in every later call and session, so each candidate only costs its own relaxation.
+    Args:
+        ads_slab: ase.Atoms, adsorbate placed on the slab, e.g. from `get_ads_slab`
+        slab: ase.Atoms, the bare slab the adsorbate was placed on, e.g. from `read_atoms_object`
+        smiles: str, the SMILES given to `get_fragment`; the marker atom ('Cl' or 'S1S') is not part of the molecule
+        output_dir: str, where `relax_atoms` writes its run folder
+        relax: bool, relax `ads_slab` with `relax_atoms` first; False uses its energy as it is (single point)
+        fixed_layers, fixed_depth: bottom-layer constraint, as in `relax_atoms`; the bare slab gets the same fixed atoms
+        optimizer: str, optimizer of the adsorbate and slab relaxations, as in `relax_atoms`
+        to_initialize: int, molecule conformers to relax; the lowest energy one is the reference
+        early_stop, steps: as in `relax_atoms`; the slab and molecule references are relaxed with the same settings
+    returns:
+        dict with 'adsorption_energy', 'energy_ads_slab', 'energy_slab', 'energy_molecule' (eV), 'stop_reason'
+        of the relaxation (None without), 'reference_stop_reasons' ({'slab', 'molecule'}) and 'atoms', the relaxed
+        adsorption structure. Negative means binding.
+    """
+    calculator = calculator_identity(model=TOOLS_MODEL, dispersion=False)
+    n_slab = ads_slab.info.get("n_slab", len(slab))
+    # the same fixed atoms as `relax_atoms` gives the adsorption structure
+    fixed = fix_bottom(ads_slab, n_layers=fixed_layers, depth=fixed_depth).index
+    bare = ase.Atoms(numbers=slab.numbers[:n_slab], positions=slab.positions[:n_slab], cell=slab.cell, pbc=slab.pbc)
+    bare.constraints = FixAtoms(indices=fixed[fixed < n_slab])
+
+    # references are relaxed like the adsorption structure, so that their energies are comparable
+    settings = {"fmax": 0.01, "early_stop": early_stop, **({"steps": steps} if steps is not None else {})}
+    table = get_reference_table()
+    slab_ref = table.get_or_compute(
+        table.slab_key(bare, calculator, optimizer=optimizer, **settings),
+        lambda: relax_reference(bare, get_calculator(model=TOOLS_MODEL, dispersion=False), optimizer=optimizer, **settings),
+        kind="slab", label=bare.get_chemical_formula(), calculator=calculator,
+    )
+
+    def relax_molecule():
+        n_conformers = len(get_conformer_library().conformer_set(smiles, to_initialize)[1])
+        mace_calculator = get_calculator(model=TOOLS_MODEL, dispersion=False)
+        results = [relax_reference(gas_phase_molecule(smiles, i, to_initialize), mace_calculator, optimizer=optimizer, **settings)
+                   for i in range(n_conformers)]
+        return {**min(results, key=lambda r: r["energy"]), "n_conformers": n_conformers}
+
+    molecule_ref = table.get_or_compute(
+        table.molecule_key(smiles, calculator, optimizer=optimizer, to_initialize=to_initialize, **settings),
+        relax_molecule, kind="molecule", label=smiles, calculator=calculator,
+    )
+
+    if relax:
+        atoms = relax_atoms(ads_slab, output_dir=output_dir, early_stop=early_stop, fixed_layers=fixed_layers,
+                            fixed_depth=fixed_depth, optimizer=optimizer, steps=steps)
+        stop_reason = atoms.info["stop_reason"]
+    else:
+        atoms = ads_slab.copy()
+        atoms.calc = get_calculator(model=TOOLS_MODEL, dispersion=False)
+        stop_reason = None
+    energy = float(atoms.get_potential_energy())
+    return {
+        "adsorption_energy": energy - slab_ref["energy"] - molecule_ref["energy"],
+        "energy_ads_slab": energy, "energy_slab": slab_ref["energy"], "energy_molecule": molecule_ref["energy"],
+        "stop_reason": stop_reason,
+        "reference_stop_reasons": {"slab": slab_ref.get("stop_reason"), "molecule": molecule_ref.get("stop_reason")},
+        "atoms": atoms,
+    }
+
 def save_ase_atoms(atoms: ase.Atoms, filename):
     """ this functions writes ase.atoms to xyz file
     Args:
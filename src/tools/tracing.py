@@ -0,0 +1,298 @@
+"""Timing spans for agent sessions.
+
+A 40 minute agent run used to give no hint of where the time went. Every
+LangGraph node, LLM call, code cell and tool call now records a span. Model
+loading, site detection and optimizer runs inside the tools record spans too.
+A span holds:
+
+- its name and category ("node", "llm", "cell", "tool", "model", ...);
+- the trace (one agent session) it belongs to, and its parent span;
+- start time and duration;
+- process RSS at the end and its growth during the span;
+- force calls made while it ran (process-wide, so concurrent spans share them);
+- extra attributes, e.g. token counts of LLM calls or optimizer steps.
+
+Spans are kept in memory (bounded) by the process-wide `tracer`. With
+ADSKRK_TRACE_FILE set they are also appended to that JSONL file. Spans
+recorded in kernel or worker processes are sent back to the parent (see
+`run_with_trace`). Summarize a trace file or convert it for chrome://tracing
+and https://ui.perfetto.dev with
+
+    python -m src.tools.tracing trace.jsonl --chrome trace.json
+"""
+import argparse
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import resource
+import threading
+import time
+import uuid
+from collections import deque
+
+_current_trace = contextvars.ContextVar("adskrk_trace", default=None)
+_current_span = contextvars.ContextVar("adskrk_span", default=None)
+
+# name -> callable returning a running process-wide count; every span records how much each grew
+COUNTERS = {}
+_RECORD_KEYS = {"name", "cat", "trace", "id", "parent", "pid", "tid", "ts", "dur", "rss_mb", "rss_delta_mb", "error", "attrs"}
+
+
+def rss_mb() -> float:
+    """Resident memory of this process in MB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def register_counter(name: str, read):
+    """Record the growth of `read()` in every span under `name`."""
+    COUNTERS[name] = read
+
+
+class Span:
+    """An open span; `annotate` adds attributes before it is finished."""
+
+    def __init__(self, name: str, category: str, trace: str, parent: str, attrs: dict):
+        self.name = name
+        self.category = category
+        self.trace = trace
+        self.parent = parent
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attrs = attrs
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self._rss0 = rss_mb()
+        self._counts0 = {k: read() for k, read in COUNTERS.items()}
+
+    def annotate(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """Collects finished spans in memory and, if `path` is set, appends them to a JSONL file."""
+
+    def __init__(self, path: str = None, max_spans: int = 20000, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self.spans = deque(maxlen=max_spans)
+        self.forward = False
+        self._pending = []
+        self._lock = threading.Lock()
+
+    # --- recording ---------------------------------------------------------------------------------
+
+    def start(self, name: str, category: str = "tool", trace: str = None, parent: str = None, **attrs) -> Span:
+        """Open a span; the trace and parent default to the ones of the current context."""
+        current = _current_span.get()
+        return Span(name, category, trace or _current_trace.get(),
+                    parent or (current.span_id if current is not None else None), attrs)
+
+    def finish(self, span: Span, error: str = None, **attrs) -> dict:
+        """Close `span` and record it. returns: dict, the span record"""
+        duration = time.perf_counter() - span._t0
+        rss = rss_mb()
+        span.attrs.update(attrs)
+        record = {
+            "name": span.name, "cat": span.category, "trace": span.trace, "id": span.span_id, "parent": span.parent,
+            "pid": os.getpid(), "tid": threading.get_ident(), "ts": span.start, "dur": duration,
+            "rss_mb": round(rss, 1), "rss_delta_mb": round(rss - span._rss0, 1),
+            **{k: read() - span._counts0.get(k, 0) for k, read in COUNTERS.items()},
+            "error": error, "attrs": span.attrs,
+        }
+        self.record(record)
+        return record
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "tool", **attrs):
+        """Context manager timing its body; spans opened inside become its children."""
+        if not self.enabled:
+            yield Span(name, category, None, None, attrs)
+            return
+        span = self.start(name, category, **attrs)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            _current_span.reset(token)
+            self.finish(span, error=f"{type(e).__name__}: {e}")
+            raise
+        _current_span.reset(token)
+        self.finish(span)
+
+    def record(self, record: dict):
+        """Store a finished span record (also used for records coming from other processes)."""
+        with self._lock:
+            self.spans.append(record)
+            if self.forward:
+                self._pending.append(record)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+
+    def extend(self, records: list):
+        for record in records or []:
+            self.record(record)
+
+    def forward_to_parent(self):
+        """In a kernel or worker process: keep spans for `drain` instead of writing the trace file,
+        the parent process records them."""
+        self.forward = True
+        self.path = None
+
+    def drain(self) -> list:
+        """Spans finished since the last call (only kept after `forward_to_parent`)."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    # --- context -----------------------------------------------------------------------------------
+
+    @contextlib.contextmanager
+    def trace(self, trace_id: str = None):
+        """Group every span opened inside (in this thread and the tasks/threads it starts) under one trace.
+        Yields the trace id."""
+        trace_id = trace_id or uuid.uuid4().hex[:12]
+        token = _current_trace.set(trace_id)
+        try:
+            yield trace_id
+        finally:
+            _current_trace.reset(token)
+
+    def context(self) -> tuple:
+        """(trace id, current span id), to continue the trace in another process with `use_context`."""
+        current = _current_span.get()
+        return _current_trace.get(), current.span_id if current is not None else None
+
+    @contextlib.contextmanager
+    def use_context(self, context: tuple):
+        """Continue a trace from `context()`: new spans get its trace id and, at top level, its span as parent."""
+        trace_id, parent = context or (None, None)
+        trace_token = _current_trace.set(trace_id)
+        span_token = _current_span.set(_RemoteParent(parent) if parent else None)
+        try:
+            yield
+        finally:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+
+    # --- reading -----------------------------------------------------------------------------------
+
+    def get_spans(self, trace: str = None) -> list:
+        """Recorded span records, oldest first, optionally of one trace only."""
+        with self._lock:
+            return [r for r in self.spans if trace is None or r["trace"] == trace]
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+            self._pending = []
+
+
+class _RemoteParent:
+    """Stand-in for a span that is open in another process."""
+
+    def __init__(self, span_id: str):
+        self.span_id = span_id
+
+    def annotate(self, **attrs):
+        pass
+
+
+tracer = Tracer(path=os.environ.get("ADSKRK_TRACE_FILE") or None, enabled=os.environ.get("ADSKRK_TRACE", "1") != "0")
+
+def annotate(**attrs):
+    """Add attributes to the innermost open span of the current context, if any."""
+    span = _current_span.get()
+    if span is not None:
+        span.annotate(**attrs)
+
+def traced(fn=None, *, name: str = None, category: str = "tool"):
+    """Decorator recording a span around every call of `fn`; keeps its name, signature and docstring."""
+    if fn is None:
+        return functools.partial(traced, name=name, category=category)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with tracer.span(name or fn.__name__, category):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def run_with_trace(fn, context: tuple, args: tuple = (), kwargs: dict = None) -> tuple:
+    """Call `fn` in a worker process as part of the trace `context` (from `tracer.context()`).
+    returns: (return value, span records to hand to `tracer.extend` in the parent)"""
+    tracer.forward_to_parent()
+    tracer.drain()
+    with tracer.use_context(context):
+        result = fn(*args, **(kwargs or {}))
+    return result, tracer.drain()
+
+
+# --- export --------------------------------------------------------------------------------------
+
+def load_spans(path: str, trace: str = None) -> list:
+    """Span records of a JSONL trace file."""
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [r for r in records if trace is None or r["trace"] == trace]
+
+def to_chrome_trace(records: list) -> dict:
+    """Span records in the Chrome trace event format (complete "X" events, times in microseconds)."""
+    events = []
+    for r in records:
+        args = {k: v for k, v in r.items() if k not in ("name", "cat", "ts", "dur", "pid", "tid", "attrs")}
+        args.update(r.get("attrs") or {})
+        events.append({"name": r["name"], "cat": r["cat"], "ph": "X", "ts": r["ts"] * 1e6, "dur": r["dur"] * 1e6,
+                       "pid": r["pid"], "tid": r["tid"], "args": args})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+def write_chrome_trace(path: str, records: list):
+    with open(path, "w") as f:
+        json.dump(to_chrome_trace(records), f, default=str)
+
+def summary(records: list):
+    """Time per category and span name.
+    returns:
+        pandas.DataFrame with 'cat', 'name', 'calls', 'total_s', 'mean_s', 'max_s', 'errors' and the summed
+        counters and token counts, longest total first
+    """
+    import pandas as pd
+
+    if not records:
+        return pd.DataFrame(columns=["cat", "name", "calls", "total_s", "mean_s", "max_s", "errors"])
+    counters = sorted({k for r in records for k in r} - _RECORD_KEYS)
+    table = pd.DataFrame([{
+        "cat": r["cat"], "name": r["name"], "dur": r["dur"], "error": r.get("error") is not None,
+        **{k: r.get(k, 0) for k in counters}, "total_tokens": (r.get("attrs") or {}).get("total_tokens", 0),
+    } for r in records])
+    sums = {k: (k, "sum") for k in counters + ["total_tokens"]}
+    grouped = table.groupby(["cat", "name"]).agg(calls=("dur", "size"), total_s=("dur", "sum"), mean_s=("dur", "mean"),
+                                                 max_s=("dur", "max"), errors=("error", "sum"), **sums)
+    return grouped.reset_index().sort_values("total_s", ascending=False, ignore_index=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Summarize a JSONL trace file.")
+    parser.add_argument("path", type=str, help="Trace file written with ADSKRK_TRACE_FILE.")
+    parser.add_argument("--trace", type=str, default=None, help="Only this trace (agent session) id.")
+    parser.add_argument("--chrome", type=str, default=None, help="Also write a Chrome/Perfetto trace .json file.")
+    return parser.parse_args()
+
+def main_cli():
+    import pandas as pd
+
+    args = parse_args()
+    records = load_spans(args.path, trace=args.trace)
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(summary(records).round(3).to_string(index=False))
+    if args.chrome:
+        write_chrome_trace(args.chrome, records)
+
+if __name__ == '__main__':
+    main_cli()
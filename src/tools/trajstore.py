@@ -0,0 +1,309 @@
+"""Compact per-run trajectory store.
+
+`relax_atoms` and `md_run_atoms` used to write relax.traj, md.traj and
+md_traj.xyz into a shared output directory (and relax.log into the cwd), so
+concurrent runs overwrote each other's files, and reading a long extended XYZ
+back was slow. Every run now gets its own directory (`run_dir`) holding:
+
+- meta.json: numbers, cell, pbc, constraints and info, stored once, plus the
+  frame count of every chunk;
+- the frames, in chunks of `chunk_size`: forces as float32 arrays and
+  positions, momenta and energies (and per-frame scalars such as the MD step)
+  as float64, so the last frame of a cached run is exactly the structure the
+  run ended in. Uncompressed chunks are one .npy file per field and are
+  memory-mapped on read; with `compress=True` a chunk is one .npz file;
+- the optimizer log of a relaxation.
+
+`TrajectoryStore` reads a store lazily: `len(store)`, `store[i]` and
+`store[a:b:c]` give ase.Atoms with their energy and forces, and
+`store.array("energy")` a column without building Atoms. .traj and .xyz files
+are only written on demand:
+
+    python -m src.tools.trajstore info outputs/md-20250101-120000-1a2b3c
+    python -m src.tools.trajstore export outputs/md-20250101-120000-1a2b3c md.xyz --index ::10
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+import ase
+from ase.calculators.singlepoint import SinglePointCalculator
+from ase.constraints import dict2constraint
+
+# field -> (dtype, per-atom); per-atom fields have shape (n_atoms, 3) per frame
+FIELDS = {
+    "positions": ("float64", True),
+    "forces": ("float32", True),
+    "momenta": ("float64", True),
+    "energy": ("float64", False),
+}
+META_FILE = "meta.json"
+
+
+def _jsonable(info: dict) -> dict:
+    kept = {}
+    for k, v in info.items():
+        try:
+            json.dumps(v)
+        except TypeError:
+            continue
+        kept[k] = v
+    return kept
+
+def run_dir(output_dir: str, kind: str) -> str:
+    """Create and return a new directory `<output_dir>/<kind>-<date>-<time>-<random>` for one run."""
+    path = os.path.join(output_dir, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}")
+    os.makedirs(path)
+    return path
+
+
+class TrajectoryWriter:
+    """Appends frames of one structure to a store directory.
+
+    Usable as an optimizer or MD observer: `dyn.attach(writer.write, atoms=atoms)`.
+    Frames need a calculator if "energy" or "forces" is among `fields`.
+    Extra keyword arguments of `write` (e.g. md_step=10) are stored as per-frame
+    scalars and come back in `frame.info`.
+    """
+
+    def __init__(self, path: str, atoms: ase.Atoms, fields: tuple = ("positions", "forces", "energy"),
+                 chunk_size: int = 256, compress: bool = False):
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields {sorted(unknown)}, expected some of {list(FIELDS)}.")
+        self.path = path
+        self.fields = tuple(fields)
+        self.chunk_size = chunk_size
+        os.makedirs(path, exist_ok=True)
+        self.meta = {
+            "version": 1, "n_atoms": len(atoms), "numbers": atoms.numbers.tolist(), "cell": np.asarray(atoms.cell).tolist(),
+            "pbc": atoms.pbc.tolist(), "constraints": [c.todict() for c in atoms.constraints], "info": _jsonable(atoms.info),
+            "fields": list(self.fields), "extras": [], "compress": compress, "chunks": [],
+        }
+        self._buffer = []
+        self._write_meta()
+
+    def write(self, atoms: ase.Atoms, **extras):
+        """Append the current state of `atoms`."""
+        frame = {}
+        for field in self.fields:
+            if field == "positions":
+                frame[field] = atoms.get_positions()
+            elif field == "forces":
+                frame[field] = atoms.get_forces(apply_constraint=False)
+            elif field == "momenta":
+                frame[field] = atoms.get_momenta()
+            elif field == "energy":
+                frame[field] = atoms.get_potential_energy()
+        for k, v in extras.items():
+            if k not in self.meta["extras"]:
+                if self.meta["chunks"] or self._buffer:
+                    raise ValueError(f"Per-frame value {k!r} must be given from the first frame on.")
+                self.meta["extras"].append(k)
+            frame[k] = v
+        self._buffer.append(frame)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    __call__ = write
+
+    def flush(self):
+        """Write the buffered frames as a new chunk and update meta.json, so readers see them."""
+        if not self._buffer:
+            return
+        i = len(self.meta["chunks"])
+        arrays = {}
+        for field in self.fields:
+            arrays[field] = np.asarray([f[field] for f in self._buffer], dtype=FIELDS[field][0])
+        for k in self.meta["extras"]:
+            arrays[k] = np.asarray([f[k] for f in self._buffer], dtype="float64")
+        if self.meta["compress"]:
+            np.savez_compressed(os.path.join(self.path, f"chunk.{i:05d}.npz"), **arrays)
+        else:
+            for name, array in arrays.items():
+                np.save(os.path.join(self.path, f"{name}.{i:05d}.npy"), array)
+        self.meta["chunks"].append(len(self._buffer))
+        self._buffer = []
+        self._write_meta()
+
+    def _write_meta(self):
+        tmp = os.path.join(self.path, f"{META_FILE}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryStore:
+    """Read access to a store written by `TrajectoryWriter`; chunks are opened (memory-mapped) on first use."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._chunks = {}
+        self.reload()
+
+    def reload(self):
+        """Re-read meta.json, e.g. to see frames added by a run that is still writing."""
+        with open(os.path.join(self.path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self._offsets = np.concatenate([[0], np.cumsum(self.meta["chunks"], dtype=int)])
+
+    def __len__(self) -> int:
+        return int(self._offsets[-1])
+
+    @property
+    def fields(self) -> list:
+        """Stored arrays: some of `FIELDS` plus the per-frame scalars."""
+        return self.meta["fields"] + self.meta["extras"]
+
+    def _chunk(self, i: int, name: str) -> np.ndarray:
+        if self.meta["compress"]:
+            if i not in self._chunks:
+                # keep one decompressed chunk, enough for sequential reads
+                with np.load(os.path.join(self.path, f"chunk.{i:05d}.npz")) as data:
+                    self._chunks = {i: {k: data[k] for k in data.files}}
+            return self._chunks[i][name]
+        key = (i, name)
+        if key not in self._chunks:
+            self._chunks[key] = np.load(os.path.join(self.path, f"{name}.{i:05d}.npy"), mmap_mode="r")
+        return self._chunks[key]
+
+    def _indices(self, index) -> np.ndarray:
+        if isinstance(index, str):
+            index = slice(*[int(p) if p else None for p in index.split(":")]) if ":" in index else int(index)
+        if isinstance(index, slice):
+            return np.arange(len(self))[index]
+        indices = np.atleast_1d(np.asarray(index, dtype=int))
+        indices = np.where(indices < 0, indices + len(self), indices)
+        if indices.size and (indices.min() < 0 or indices.max() >= len(self)):
+            raise IndexError(f"frame index out of range for a store of {len(self)} frames")
+        return indices
+
+    def array(self, name: str, index=slice(None)) -> np.ndarray:
+        """Values of one field for the selected frames, reading only the chunks they are in.
+        Args:
+            name: str, one of `fields`, e.g. "energy" or "positions"
+            index: int, slice, list of ints or ASE-style string such as "::10"
+        returns:
+            np.ndarray of shape (n_frames, ...) (no leading axis for an int index)
+        """
+        if name not in self.fields:
+            raise KeyError(f"{name!r} is not stored, available: {self.fields}")
+        indices = self._indices(index)
+        chunk_of = np.searchsorted(self._offsets, indices, side="right") - 1
+        chunks = np.unique(chunk_of)
+        if len(chunks) == 1:
+            values = np.asarray(self._chunk(chunks[0], name)[indices - self._offsets[chunks[0]]])
+        elif len(chunks) > 1:
+            order = np.concatenate([np.flatnonzero(chunk_of == c) for c in chunks])
+            parts = np.concatenate([self._chunk(c, name)[indices[chunk_of == c] - self._offsets[c]] for c in chunks])
+            values = np.empty_like(parts)
+            values[order] = parts
+        else:
+            values = np.empty((0,), dtype=FIELDS.get(name, ("float64",))[0])
+        return values[0] if isinstance(index, (int, np.integer)) else values
+
+    def _atoms(self, values: dict) -> ase.Atoms:
+        meta = self.meta
+        atoms = ase.Atoms(numbers=meta["numbers"], positions=values["positions"], cell=meta["cell"], pbc=meta["pbc"])
+        atoms.constraints = [dict2constraint(c) for c in meta["constraints"]]
+        atoms.info.update(meta["info"])
+        if "momenta" in values:
+            atoms.set_momenta(values["momenta"], apply_constraint=False)
+        for k in meta["extras"]:
+            atoms.info[k] = int(values[k]) if float(values[k]).is_integer() else float(values[k])
+        if "energy" in values or "forces" in values:
+            results = {k: v for k, v in values.items() if k in ("energy", "forces")}
+            atoms.calc = SinglePointCalculator(atoms, **results)
+        return atoms
+
+    def __getitem__(self, index):
+        """One frame (ase.Atoms) for an int, a list of frames otherwise."""
+        indices = self._indices(index)
+        columns = {name: self.array(name, indices) for name in self.fields}
+        frames = [self._atoms({name: columns[name][j] for name in self.fields}) for j in range(len(indices))]
+        return frames[0] if isinstance(index, (int, np.integer)) else frames
+
+    def __iter__(self):
+        for c, n in enumerate(self.meta["chunks"]):
+            yield from self[int(self._offsets[c]):int(self._offsets[c]) + n]
+
+    def export(self, filename: str, index=slice(None), **kwargs):
+        """Write the selected frames with `ase.io.write`; the format follows from the extension (.traj, .xyz, ...)."""
+        from ase.io import write
+        write(filename, self[index] if not isinstance(index, (int, np.integer)) else [self[index]], **kwargs)
+
+    def to_traj(self, filename: str, index=slice(None)):
+        self.export(filename, index)
+
+    def to_xyz(self, filename: str, index=slice(None)):
+        self.export(filename, index, format="extxyz")
+
+    def nbytes(self) -> int:
+        """Size of the store on disk."""
+        return sum(os.path.getsize(p) for p in glob.glob(os.path.join(self.path, "*")) if os.path.isfile(p))
+
+
+def from_frames(path: str, frames, fields: tuple = None, chunk_size: int = 256, compress: bool = False) -> TrajectoryStore:
+    """Store a list or iterator of ase.Atoms, e.g. `ase.io.iread("md.traj")`.
+    By default positions are stored, plus energy and forces if the first frame has them and momenta if it has any."""
+    writer = None
+    for frame in frames:
+        if writer is None:
+            if fields is None:
+                results = frame.calc.results if frame.calc is not None else {}
+                fields = ("positions",) + tuple(k for k in ("forces", "energy") if k in results)
+                fields += ("momenta",) if frame.has("momenta") else ()
+            writer = TrajectoryWriter(path, frame, fields=fields, chunk_size=chunk_size, compress=compress)
+        writer.write(frame)
+    if writer is None:
+        raise ValueError("No frames to store.")
+    writer.close()
+    return TrajectoryStore(path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect, export or create trajectory stores.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="Frame count, fields and size of a store.")
+    info.add_argument("path", type=str)
+    export = sub.add_parser("export", help="Write frames to a .traj, .xyz or any other ASE format.")
+    export.add_argument("path", type=str)
+    export.add_argument("output", type=str)
+    export.add_argument("--index", type=str, default=":", help="Frames to write, e.g. -1 or ::10.")
+    convert = sub.add_parser("convert", help="Store the frames of an ASE-readable trajectory file.")
+    convert.add_argument("input", type=str)
+    convert.add_argument("path", type=str)
+    convert.add_argument("--compress", action="store_true")
+    return parser.parse_args()
+
+def main_cli():
+    args = parse_args()
+    if args.command == "info":
+        store = TrajectoryStore(args.path)
+        print(json.dumps({"path": store.path, "frames": len(store), "atoms": store.meta["n_atoms"], "fields": store.fields,
+                          "chunks": len(store.meta["chunks"]), "compress": store.meta["compress"], "bytes": store.nbytes()}, indent=2))
+    elif args.command == "export":
+        store = TrajectoryStore(args.path)
+        index = store._indices(args.index)
+        store.export(args.output, index)
+        print(f"wrote {len(index)} frames to {args.output}")
+    elif args.command == "convert":
+        from ase.io import iread
+        store = from_frames(args.path, iread(args.input, index=":"), compress=args.compress)
+        print(f"stored {len(store)} frames in {args.path}")
+
+if __name__ == '__main__':
+    main_cli()
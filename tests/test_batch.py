@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for batched force evaluation and lock-step relaxation."""
+
+import unittest
+from unittest import mock
+
+import numpy as np
+from ase.build import add_adsorbate, fcc111
+from ase.calculators.emt import EMT
+from ase.constraints import FixAtoms
+from ase.optimize import FIRE
+
+from src.tools import batch
+from src.tools.batch import batch_relax, batched_energy_forces
+
+
+def _tiny_mace(r_max: float = 4.0):
+    """MACECalculator around a small randomly initialised MACE model."""
+    import torch
+    from mace import modules
+    from mace.calculators import MACECalculator
+    from e3nn import o3
+
+    torch.manual_seed(0)
+    model = modules.MACE(
+        r_max=r_max, num_bessel=4, num_polynomial_cutoff=5, max_ell=2,
+        interaction_cls=modules.interaction_classes["RealAgnosticResidualInteractionBlock"],
+        interaction_cls_first=modules.interaction_classes["RealAgnosticInteractionBlock"],
+        num_interactions=2, num_elements=3, hidden_irreps=o3.Irreps("8x0e+8x1o"), MLP_irreps=o3.Irreps("8x0e"),
+        atomic_energies=np.zeros(3), avg_num_neighbors=8., atomic_numbers=[6, 8, 29], correlation=2,
+        gate=torch.nn.functional.silu,
+    )
+    return MACECalculator(models=model, device="cpu", default_dtype="float64")
+
+
+class TestBatch(unittest.TestCase):
+    """Compare batched evaluation and relaxation with per-structure ASE runs."""
+
+    def setUp(self):
+        """CO at three heights on Cu(111), bottom layer fixed; the last structure has every atom fixed."""
+        self.structures = []
+        for height in (1.6, 1.9, 2.2):
+            atoms = fcc111("Cu", (2, 2, 3), vacuum=6.)
+            add_adsorbate(atoms, "C", height, "ontop")
+            add_adsorbate(atoms, "O", height + 1.15, "ontop")
+            atoms.constraints = [FixAtoms(indices=[a.index for a in atoms if a.tag == 3])]
+            self.structures.append(atoms)
+        self.structures[-1].constraints = [FixAtoms(indices=range(len(self.structures[-1])))]
+
+    def test_mace_batch(self):
+        """One batched MACE pass gives the energies and forces of per-structure single points."""
+        calculator = _tiny_mace()
+        energies, forces = batched_energy_forces(calculator, self.structures)
+        for atoms, energy, f in zip(self.structures, energies, forces):
+            single = atoms.copy()
+            single.calc = calculator
+            self.assertAlmostEqual(energy, single.get_potential_energy(), places=8)
+            np.testing.assert_allclose(f, single.get_forces(apply_constraint=False), atol=1e-8)
+
+    def test_relax_matches_fire(self):
+        """Lock-step relaxation follows ase FIRE per structure, keeps fixed atoms and drops converged structures."""
+        sizes = []
+
+        def recording(calculator, atoms_list):
+            sizes.append(len(atoms_list))
+            return batched_energy_forces(calculator, atoms_list)
+
+        with mock.patch.object(batch, "batched_energy_forces", recording):
+            relaxed = batch_relax(self.structures, EMT(), fmax=0.05, steps=200)
+
+        for atoms, result in zip(self.structures[:-1], relaxed):
+            reference = atoms.copy()
+            reference.calc = EMT()
+            FIRE(reference, logfile=None).run(fmax=0.05, steps=200)
+            np.testing.assert_allclose(result.positions, reference.positions, atol=1e-8)
+            self.assertAlmostEqual(result.get_potential_energy(), reference.get_potential_energy(), places=8)
+            self.assertTrue(result.info["relax_converged"])
+            fixed = atoms.constraints[0].index
+            np.testing.assert_array_equal(result.positions[fixed], atoms.positions[fixed])
+
+        self.assertEqual(relaxed[-1].info["relax_steps"], 0)
+        np.testing.assert_array_equal(relaxed[-1].positions, self.structures[-1].positions)
+        self.assertEqual(sizes[0], 3)
+        self.assertEqual(sizes[1], 2)
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
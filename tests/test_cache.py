@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the content-addressed result cache."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from ase.build import add_adsorbate, fcc111
+
+from src.tools import cache as cache_module
+from src.tools import tools
+from src.tools.cache import ResultCache, atoms_hash
+
+
+class TestResultCache(unittest.TestCase):
+    """Test hashing and LRU eviction of cached trajectories."""
+
+    def setUp(self):
+        """Create a temporary cache directory and a small slab."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.atoms = fcc111("Cu", (2, 2, 2), vacuum=5.)
+
+    def tearDown(self):
+        """Remove the temporary cache directory."""
+        self.tmp.cleanup()
+
+    def _traj(self, name: str, size: int) -> str:
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(b"0" * size)
+        return path
+
+    def test_hash(self):
+        """The key depends on positions, calculator and run parameters only."""
+        key = atoms_hash(self.atoms, "emt", fmax=0.01)
+        self.assertEqual(key, atoms_hash(self.atoms.copy(), "emt", fmax=0.01))
+        self.assertNotEqual(key, atoms_hash(self.atoms, "emt", fmax=0.05))
+        self.assertNotEqual(key, atoms_hash(self.atoms, "mace_mp/medium/float32/dispersion=False", fmax=0.01))
+        moved = self.atoms.copy()
+        moved.positions[0, 2] += 0.01
+        self.assertNotEqual(key, atoms_hash(moved, "emt", fmax=0.01))
+
+    def test_lru_eviction(self):
+        """The least recently used entry is evicted first once over budget."""
+        cache = ResultCache(path=os.path.join(self.tmp.name, "cache"), max_bytes=250)
+        cache.put("a", self._traj("a.traj", 100), kind="relax")
+        cache.put("b", self._traj("b.traj", 100), kind="relax")
+        self.assertIsNotNone(cache.get("a"))
+        cache.put("c", self._traj("c.traj", 100), kind="relax")
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertEqual(cache.stats()["entries"], 2)
+
+    def test_store_directory(self):
+        """Run directories are stored whole, counted by their total size and removed on eviction."""
+        run = os.path.join(self.tmp.name, "run")
+        os.makedirs(run)
+        for name in ("meta.json", "positions.00000.npy"):
+            with open(os.path.join(run, name), "wb") as f:
+                f.write(b"0" * 100)
+        cache = ResultCache(path=os.path.join(self.tmp.name, "cache"), max_bytes=1000)
+        cache.put("a", run, kind="md")
+        self.assertEqual(sorted(os.listdir(cache.get("a"))), ["meta.json", "positions.00000.npy"])
+        self.assertEqual(cache.stats()["size"], 200)
+        cache.clear()
+        self.assertFalse(os.path.exists(os.path.join(cache.path, "a")))
+
+    def test_replace_existing(self):
+        """Storing a key again replaces the entry, also a run directory left on disk without an index row."""
+        run = os.path.join(self.tmp.name, "run")
+        os.makedirs(run)
+        with open(os.path.join(run, "meta.json"), "wb") as f:
+            f.write(b"0" * 100)
+        cache = ResultCache(path=os.path.join(self.tmp.name, "cache"), max_bytes=1000)
+        os.makedirs(os.path.join(cache.path, "a", "stale"))
+        cache.put("a", run, kind="md", n=1)
+        self.assertEqual(os.listdir(cache.get("a")), ["meta.json"])
+        cache.put("a", self._traj("a.traj", 50), kind="relax", n=2)
+        self.assertTrue(os.path.isfile(cache.get("a")))
+        self.assertEqual(cache.get_meta("a"), {"n": 2})
+        self.assertEqual(cache.stats()["size"], 50)
+        self.assertEqual(sorted(os.listdir(cache.path)), ["a", "index.sqlite"])
+
+    def test_relax_hit_exact(self):
+        """A cached relaxation returns exactly the structure and energy of the run that stored it."""
+        add_adsorbate(self.atoms, "O", 1.5, "fcc")
+        cache = ResultCache(path=os.path.join(self.tmp.name, "cache"))
+        with mock.patch.object(tools, "TOOLS_MODEL", "emt"), mock.patch.object(cache_module, "_result_cache", cache):
+            first = tools.relax_atoms(self.atoms, output_dir=self.tmp.name)
+            second = tools.relax_atoms(self.atoms, output_dir=self.tmp.name)
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertNotEqual(first.info["trajectory"], second.info["trajectory"])
+        np.testing.assert_array_equal(second.positions, first.positions)
+        self.assertEqual(second.get_potential_energy(), first.get_potential_energy())
+        self.assertEqual(second.info["stop_reason"], first.info["stop_reason"])
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the process-wide calculator pool."""
+
+import unittest
+
+from src.tools.calculators import CalculatorPool
+
+
+class TestCalculatorPool(unittest.TestCase):
+    """Test loading, reuse and eviction of pooled calculators."""
+
+    def test_reuse(self):
+        """A second request for the same key returns the same calculator."""
+        pool = CalculatorPool(max_size=2)
+        first = pool.get(model="emt")
+        second = pool.get(model="emt")
+        self.assertIs(first, second)
+        stats = pool.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["size"], 1)
+
+    def test_eviction(self):
+        """The least recently used calculator is dropped once the pool is full."""
+        pool = CalculatorPool(max_size=1)
+        pool.get(model="emt", default_dtype="float32")
+        pool.get(model="emt", default_dtype="float64")
+        self.assertEqual(len(pool), 1)
+        self.assertEqual(pool.stats()["evictions"], 1)
+        self.assertNotIn(pool.make_key("emt", default_dtype="float32"), pool)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the persistent fragment conformer library."""
+
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.tools.conformers import ConformerLibrary, canonical_surrogate_smiles
+
+
+class TestConformerLibrary(unittest.TestCase):
+    """Compare cached conformers with autoadsorbate fragments and count cache hits."""
+
+    def setUp(self):
+        """Create a temporary library directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove the library directory."""
+        self.tmp.cleanup()
+
+    def test_matches_fragment(self):
+        """Every conformer equals `Fragment.get_conformer`, also for a SMILES that is not canonical."""
+        from autoadsorbate import Fragment
+
+        library = ConformerLibrary(self.tmp.name)
+        for smiles in ("Cl[C-]=O", "ClC(O)C"):
+            fragment = Fragment(smiles, to_initialize=3)
+            for i in range(len(fragment.conformers)):
+                expected = fragment.get_conformer(i)
+                atoms = library.get_conformer(smiles, i, to_initialize=3)
+                np.testing.assert_array_equal(atoms.numbers, expected.numbers)
+                np.testing.assert_allclose(atoms.positions, expected.positions, atol=1e-10)
+        self.assertNotEqual(canonical_surrogate_smiles("ClC(O)C"), "ClC(O)C")
+
+    def test_cache_hits(self):
+        """A set is generated once; the same instance reuses it from memory, another instance from disk."""
+        first = ConformerLibrary(self.tmp.name)
+        positions = first.conformer_set("ClC(O)C", to_initialize=2)[1]
+        first.get_conformer("ClC(O)C", 0, to_initialize=2)
+        self.assertEqual(first.stats(), {"in_memory": 1, "hits": 1, "disk_hits": 0, "generated": 1})
+
+        second = ConformerLibrary(self.tmp.name)
+        np.testing.assert_array_equal(second.conformer_set("ClC(O)C", to_initialize=2)[1], positions)
+        self.assertEqual(second.stats(), {"in_memory": 1, "hits": 0, "disk_hits": 1, "generated": 0})
+        second.conformer_set("ClC(C)O", to_initialize=2)
+        self.assertEqual(second.generated, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
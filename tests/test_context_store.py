@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the store keeping large CodeAct variables out of the graph state."""
+
+import pickle
+import unittest
+
+import numpy as np
+from ase.build import fcc111
+
+from src.agent.agent import SESSION_KEY, eval_code
+from src.agent.context_store import ContextRef, ContextStore, context_store
+from src.agent.instrument import traced_eval
+from src.tools.tracing import tracer
+
+
+class TestContextStore(unittest.TestCase):
+    """Test saving variables as refs and resolving them again."""
+
+    def setUp(self):
+        """Create an empty store and one session."""
+        self.store = ContextStore(max_sessions=2)
+        self.session = self.store.new_session()
+
+    def test_large_values_become_refs(self):
+        """Atoms and arrays are replaced by refs, small values are kept inline."""
+        slab = fcc111("Cu", (2, 2, 2), vacuum=5.)
+        state = self.store.save(self.session, {"slab": slab, "x": np.zeros(1000), "n": 3, "label": "top"})
+        self.assertIsInstance(state["slab"], ContextRef)
+        self.assertIsInstance(state["x"], ContextRef)
+        self.assertEqual(state["n"], 3)
+        self.assertEqual(state["label"], "top")
+        self.assertLess(len(pickle.dumps(state)), 1000)
+
+        scope, missing = self.store.resolve(state)
+        self.assertIs(scope["slab"], slab)
+        self.assertEqual(missing, [])
+
+    def test_evicted_session_reports_missing(self):
+        """Refs of a session dropped by the LRU bound are reported as missing."""
+        state = self.store.save(self.session, {"x": np.zeros(10)})
+        for _ in range(2):
+            self.store.save(self.store.new_session(), {"y": np.zeros(10)})
+        scope, missing = self.store.resolve(state)
+        self.assertEqual(missing, ["x"])
+        self.assertEqual(self.store.stats()["evictions"], 1)
+
+    def test_cell_span_reports_context(self):
+        """In-process cells annotate their span with the context overhead and the session's stored bytes."""
+        with tracer.trace("context-store-test") as trace_id:
+            _, context = traced_eval(eval_code)("x = np.zeros(1000)", {})
+        span = tracer.get_spans(trace_id)[-1]
+        self.assertEqual(span["name"], "cell")
+        self.assertGreater(span["attrs"]["context_overhead_ms"], 0.)
+        self.assertEqual(span["attrs"]["context_bytes"], 8000)
+        self.assertEqual(context_store.approx_bytes(context[SESSION_KEY]), 8000)
+        context_store.drop(context[SESSION_KEY])
+
+
+if __name__ == "__main__":
+    unittest.main()
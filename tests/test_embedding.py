@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the frozen-region embedding."""
+
+import unittest
+
+import numpy as np
+from ase.build import add_adsorbate, fcc111
+from ase.calculators.emt import EMT
+from ase.constraints import FixAtoms
+
+from src.tools.embedding import Embedding, receptive_field
+
+
+class TestEmbedding(unittest.TestCase):
+    """Test carving, energies and forces of the subsystem with EMT on CO/Cu(111)."""
+
+    def setUp(self):
+        """Build CO on a 6x6 Cu(111) slab with its two bottom layers fixed."""
+        self.atoms = fcc111("Cu", (6, 6, 4), vacuum=6.)
+        self.n_slab = len(self.atoms)
+        add_adsorbate(self.atoms, "C", 1.9, "ontop", offset=(3, 3))
+        add_adsorbate(self.atoms, "O", 3.05, "ontop", offset=(3, 3))
+        self.atoms.info["n_slab"] = self.n_slab
+        self.atoms.constraints = [FixAtoms(indices=[a.index for a in self.atoms if a.tag >= 3])]
+        self.buffer = receptive_field(EMT(), self.atoms)
+
+    def test_subsystem(self):
+        """Only atoms near the adsorbate are free; the subsystem keeps them, a fixed buffer and the adsorbate last."""
+        embedding = Embedding(self.atoms, self.buffer, free_radius=4.)
+        free = ~embedding.fixed
+        self.assertTrue(free[self.n_slab:].all())
+        self.assertLess(free.sum(), 72 // 4)
+        self.assertLess(len(embedding), len(self.atoms))
+        sub = embedding.subsystem
+        self.assertEqual(sub.info["n_slab"], len(sub) - 2)
+        self.assertEqual(sub.get_chemical_symbols()[-2:], ["C", "O"])
+        self.assertEqual(len(sub.constraints[0].index), len(sub) - free.sum())
+
+        without_radius = Embedding(self.atoms, self.buffer)
+        self.assertEqual(len(without_radius), len(self.atoms))
+
+    def test_expand(self):
+        """Expanded frames carry the subsystem positions, full-scale energies and close-to-exact forces on free atoms."""
+        embedding = Embedding(self.atoms, self.buffer, free_radius=4.)
+        sub = embedding.subsystem
+        sub.calc = EMT()
+        offset = embedding.calibrate(EMT())
+
+        sub.positions[-2:] += [0.05, -0.03, 0.1]
+        frame = embedding.expand(sub)
+        self.assertEqual(len(frame), len(self.atoms))
+        self.assertEqual(frame.info["n_slab"], self.n_slab)
+        np.testing.assert_allclose(frame.positions[embedding.indices], sub.positions)
+        self.assertAlmostEqual(frame.get_potential_energy(), sub.get_potential_energy() + offset)
+
+        reference = frame.copy()
+        reference.calc = EMT()
+        free = ~embedding.fixed
+        self.assertAlmostEqual(frame.get_potential_energy(), reference.get_potential_energy(), places=3)
+        np.testing.assert_allclose(frame.get_forces()[free], reference.get_forces()[free], atol=1e-2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for lock-step MD replicas."""
+
+import math
+import unittest
+
+import pandas as pd
+from ase.build import add_adsorbate, fcc111
+from ase.calculators.emt import EMT
+from ase.constraints import FixAtoms
+
+from src.tools.ensemble import ensemble_langevin, summarize_replicas
+
+
+class TestEnsembleLangevin(unittest.TestCase):
+    """Test replica statistics with EMT on a Cu adatom."""
+
+    def setUp(self):
+        """Build a small Cu slab with a Cu adatom and its bottom layer fixed."""
+        self.atoms = fcc111("Cu", (2, 2, 2), vacuum=6.)
+        add_adsorbate(self.atoms, "Cu", 2.0, "fcc")
+        self.atoms.info["n_slab"] = 8
+        self.atoms.constraints = [FixAtoms(indices=[0, 1, 2, 3])]
+
+    def test_replicas(self):
+        """Replicas with the same seed are identical, different seeds differ, and the summary covers all replicas."""
+        table = ensemble_langevin([self.atoms] * 3, EMT(), steps=20, temperatures_K=[300, 300, 600], seeds=[0, 0, 1])
+        self.assertEqual(table["steps"].tolist(), [20, 20, 20])
+        self.assertEqual(table.loc[0, "mean_binding_distance"], table.loc[1, "mean_binding_distance"])
+        self.assertNotEqual(table.loc[0, "mean_binding_distance"], table.loc[2, "mean_binding_distance"])
+        summary = summarize_replicas(table)
+        self.assertEqual(summary["n_replicas"], 3)
+        self.assertEqual(summary["desorption_probability"], 0.)
+        self.assertEqual(summary["mean_residence_time_fs"], 20.)
+        self.assertEqual(summary["n_censored"], 0)
+        self.assertEqual(sorted(summary["by_temperature"]), [300., 600.])
+
+    def test_desorption(self):
+        """A replica whose adsorbate leaves the surface stops early and counts as desorbed."""
+        far = self.atoms.copy()
+        far.positions[-1, 2] += 4.
+        table = ensemble_langevin([self.atoms, far], EMT(), steps=10, temperatures_K=[300, 300], seeds=[0, 1],
+                                  desorption_distance=4.)
+        self.assertEqual(table["desorbed"].tolist(), [False, True])
+        self.assertEqual(table.loc[1, "first_desorbed_step"], 0)
+        self.assertEqual(table.loc[1, "residence_time_fs"], 0.)
+        self.assertEqual(summarize_replicas(table)["desorption_probability"], 0.5)
+
+    def test_censored(self):
+        """Dissociated and diverged replicas are counted apart and left out of the desorption statistics."""
+        table = pd.DataFrame({
+            "temperature_K": [300.] * 4, "stop_reason": ["completed", "desorbed", "dissociated", "diverged"],
+            "desorbed": [False, True, False, False], "residence_time_fs": [100., 40., 10., 5.],
+            "censored": [False, False, True, True], "mean_binding_distance": [2., 3., 2., 9.], "mean_energy": [0.] * 4,
+        })
+        summary = summarize_replicas(table)
+        self.assertEqual(summary["n_censored"], 2)
+        self.assertEqual(summary["desorption_probability"], 0.5)
+        self.assertEqual(summary["mean_residence_time_fs"], 70.)
+        censored = summarize_replicas(table[table["censored"]])
+        self.assertTrue(math.isnan(censored["desorption_probability"]))
+        self.assertTrue(math.isnan(censored["mean_residence_time_fs"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
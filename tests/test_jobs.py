@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the campaign runner, with the scripted offline LLM."""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+from src.agent.jobs import STUB_SCRIPT, CampaignRunner, ScriptedChatModel, load_manifest, pooled
+from src.tools.tracing import traced, tracer
+
+SLAB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "notebooks", "cu_slab_211.xyz")
+
+
+@traced
+def _double(x, stream=False):
+    return 2 * x
+
+
+class TestJobs(unittest.TestCase):
+    """Run small campaigns of stub sessions on the bundled Cu(211) slab."""
+
+    def setUp(self):
+        """Create a temporary campaign directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.out_dir = os.path.join(self.tmp.name, "campaign")
+
+    def tearDown(self):
+        """Remove the campaign directory."""
+        self.tmp.cleanup()
+
+    def _manifest(self, smiles: list) -> list:
+        path = os.path.join(self.tmp.name, "manifest.jsonl")
+        with open(path, "w") as f:
+            for s in smiles:
+                f.write(json.dumps({"smiles": s, "slab_path": SLAB_PATH}) + "\n")
+        return load_manifest(path)
+
+    def _run(self, manifest: list, responses: list = STUB_SCRIPT, delay: float = 0., max_sessions: int = 4) -> list:
+        runner = CampaignRunner(manifest, self.out_dir, model=ScriptedChatModel(responses=responses, delay=delay),
+                                max_sessions=max_sessions, compute_workers=0)
+        return asyncio.run(runner.run())
+
+    def _results(self) -> list:
+        with open(os.path.join(self.out_dir, "results.jsonl")) as f:
+            return [json.loads(line) for line in f]
+
+    def test_manifest(self):
+        """CSV rows get a default request and a job id hashed from smiles, slab and request; given ids are kept."""
+        path = os.path.join(self.tmp.name, "manifest.csv")
+        with open(path, "w") as f:
+            f.write("smiles,slab_path,job_id\n")
+            f.write(f"Cl[C-]=O,{SLAB_PATH},\n")
+            f.write(f"Cl[C-]=O,{SLAB_PATH},mine\n")
+        rows = load_manifest(path)
+        self.assertEqual(rows[0]["user_request"], "Find a stable adsorption configuration.")
+        self.assertEqual(len(rows[0]["job_id"]), 12)
+        self.assertEqual(rows[1]["job_id"], "mine")
+        self.assertEqual(self._manifest(["Cl[C-]=O"])[0]["job_id"], rows[0]["job_id"])
+        self.assertNotEqual(self._manifest(["ClC"])[0]["job_id"], rows[0]["job_id"])
+
+    def test_max_sessions(self):
+        """No more than max_sessions sessions run at the same time."""
+        records = self._run(self._manifest(["Cl[C-]=O", "ClC", "ClO", "ClN"]), delay=0.3, max_sessions=2)
+        self.assertEqual([r["status"] for r in records], ["ok"] * 4)
+        events = sorted([(r["started"], 1) for r in records] + [(r["finished"], -1) for r in records])
+        running, peak = 0, 0
+        for _, change in events:
+            running += change
+            peak = max(peak, running)
+        self.assertEqual(peak, 2)
+        self.assertEqual(sum(r["queue_time_s"] > 0.3 for r in records), 2)
+
+    def test_rerun(self):
+        """A rerun skips succeeded jobs and retries failed ones; failures are stored with their traceback."""
+        manifest = self._manifest(["Cl[C-]=O", "ClC"])
+        self.assertEqual(len(self._run(manifest[:1])), 1)
+
+        failed = self._run(manifest, responses=["{missing_field}"])
+        self.assertEqual([(r["job_id"], r["status"]) for r in failed], [(manifest[1]["job_id"], "failed")])
+        self.assertIn("Traceback", failed[0]["error"])
+        self.assertIn("KeyError", failed[0]["error"])
+
+        retried = self._run(manifest)
+        self.assertEqual([(r["job_id"], r["status"]) for r in retried], [(manifest[1]["job_id"], "ok")])
+        self.assertEqual(self._run(manifest), [])
+        self.assertEqual([r["status"] for r in self._results()], ["ok", "failed", "ok"])
+        self.assertIn("finished", retried[0]["final_answer"])
+
+    def test_compute_workers(self):
+        """With compute_workers > 0 heavy tool calls of a session run in a worker process, their spans
+        land in the job's trace and returned atoms keep their energy."""
+        script = ["```python\nslab = read_atoms_object('{slab_path}')\n"
+                  "relaxed = relax_atoms(slab, output_dir='{output_dir}', use_cache=False, steps=2)\n"
+                  "print(relaxed.info['stop_reason'], relaxed.get_potential_energy())\n```", "Done.\n<traj_analysis>\nTwo steps.\n</traj_analysis>"]
+        manifest = self._manifest(["Cl[C-]=O"])
+        env = {"ADSKRK_MODEL": "emt", "ADSKRK_CACHE_DIR": os.path.join(self.tmp.name, "cache")}
+        with mock.patch.dict(os.environ, env):
+            runner = CampaignRunner(manifest, self.out_dir, model=ScriptedChatModel(responses=script), compute_workers=1)
+            records = asyncio.run(runner.run())
+        self.assertEqual([r["status"] for r in records], ["ok"])
+        spans = tracer.get_spans(manifest[0]["job_id"])
+        self.assertEqual([s["attrs"]["failed"] for s in spans if s["name"] == "cell"], [False])
+        spans = [s for s in spans if s["name"] == "relax_atoms"]
+        self.assertEqual(len(spans), 1)
+        self.assertNotEqual(spans[0]["pid"], os.getpid())
+        self.assertTrue(os.listdir(records[0]["output_dir"]))
+
+    def test_pooled(self):
+        """Pooled calls return the tool result and bring the worker's spans back into the calling trace;
+        streaming calls run locally."""
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            tool = pooled(_double, executor)
+            with tracer.trace("pooled-test") as trace_id:
+                self.assertEqual(tool(3), 6)
+                self.assertEqual(tool(4, stream=True), 8)
+        spans = tracer.get_spans(trace_id)
+        self.assertEqual([s["name"] for s in spans], ["_double", "_double"])
+        self.assertEqual(len({s["pid"] for s in spans}), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
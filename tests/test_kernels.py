@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the kernel execution backend."""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from src.agent.kernels import KernelPool
+
+
+class TestKernelPool(unittest.TestCase):
+    """Run code cells of one or two sessions in kernel processes."""
+
+    def setUp(self):
+        """Create a pool of one kernel with a short cell time limit and no tools."""
+        self.pool = KernelPool(tools=[], max_kernels=1, timeout=5.)
+
+    def tearDown(self):
+        """Shut down every kernel."""
+        self.pool.close()
+
+    def test_state_persists(self):
+        """Variables of a session survive between cells, errors are returned as output."""
+        self.assertEqual(self.pool.run("a", "x = 41"), "<code ran, no output printed to stdout>")
+        self.assertEqual(self.pool.run("a", "print(x + 1)"), "42\n")
+        self.assertIn("ZeroDivisionError", self.pool.run("a", "1 / 0"))
+        self.assertEqual(self.pool.stats()["cells"], {"a": 3})
+
+    def test_eval_code(self):
+        """As CodeAct eval_fn, a cell keeps only the kernel session in the graph context and later cells reuse it."""
+        output, context = self.pool.eval_code("x = 41", {})
+        self.assertEqual(list(context), [KernelPool.CONTEXT_KEY])
+        output, again = self.pool.eval_code("print(x + 1)", context)
+        self.assertEqual((output, again), ("42\n", context))
+
+    def test_waits_for_busy_kernel(self):
+        """With every kernel busy, a new session waits for one instead of starting another kernel."""
+        first = threading.Thread(target=self.pool.run, args=("a", "import time\ntime.sleep(1.)"))
+        first.start()
+        time.sleep(0.2)
+        start = time.time()
+        self.assertEqual(self.pool.run("b", "print(1)"), "1\n")
+        self.assertGreater(time.time() - start, 0.5)
+        first.join()
+        self.assertEqual(self.pool.stats()["kernels"], 1)
+
+    def test_stdout_streaming(self):
+        """Lines printed by a cell arrive while the cell is still running."""
+        received = []
+        start = time.time()
+        output = self.pool.run("a", "import time\nprint('first', flush=True)\ntime.sleep(1.)\nprint('second')",
+                               on_stdout=lambda text: received.append((text, time.time() - start)))
+        self.assertEqual(output, "first\nsecond\n")
+        self.assertEqual([text for text, _ in received], ["first\n", "second\n"])
+        self.assertGreater(received[1][1] - received[0][1], 0.8)
+
+    def test_timeout_restart(self):
+        """A cell over the time limit kills the kernel; the next cell runs in a new one without the old variables."""
+        self.pool.run("a", "x = 1\nimport os\npid = os.getpid()")
+        output = self.pool.run("a", "import time\ntime.sleep(30)")
+        self.assertIn("longer than 5 s", output)
+        self.assertEqual(self.pool.stats()["timeouts"], 1)
+        self.assertIn("NameError", self.pool.run("a", "print(x)"))
+
+    def test_background(self):
+        """Background jobs run while later cells execute and can be listed and awaited."""
+        self.pool.run("a", "import time\ndef slow(v):\n    time.sleep(1.)\n    return v\njob = background(slow, 7)")
+        self.assertEqual(self.pool.run("a", "print(job.done(), jobs()[0]['status'])"), "False running\n")
+        self.assertEqual(self.pool.run("a", "print(job.result(timeout=10), job.status)"), "7 done\n")
+
+        # a kernel still running background jobs is not handed to another session
+        self.pool.run("a", "job = background(slow, 8)")
+        self.assertEqual(self.pool.run("b", "print('jobs' in dir())"), "True\n")
+        self.assertEqual(self.pool.stats()["restarts"], 1)
+        self.assertEqual(self.pool.stats()["reuses"], 0)
+
+    def test_reuse(self):
+        """A new session takes over the idle kernel with a clean namespace, warm imports and calculator stats."""
+        pid = self.pool.run("a", "import os, sys\nx = 1\nprint(os.getpid())")
+        self.assertEqual(self.pool.run("b", "import os\nprint(os.getpid(), 'x' in dir())"), f"{pid.strip()} False\n")
+        self.assertEqual(self.pool.stats()["reuses"], 1)
+        self.assertIn("restarted", self.pool.run("a", "print(1)"))
+
+        self.pool.release("a")
+        self.assertEqual(self.pool.stats()["spare"], 1)
+        stats = self.pool.calculator_stats()
+        self.assertEqual(list(stats), ["spare 0"])
+        self.assertEqual(stats["spare 0"]["size"], 0)
+        self.assertEqual(self.pool.run("c", "import os\nprint(os.getpid(), 'x' in dir())"), f"{pid.strip()} False\n")
+        self.assertEqual(self.pool.stats()["restarts"], 0)
+
+    def test_slow_kernel_blocks_only_its_session(self):
+        """While one kernel is slow to answer a control request, other sessions still run and release."""
+        self.pool.close()
+        self.pool = KernelPool(tools=[], max_kernels=2, timeout=5.)
+        self.pool.run("a", "x = 1")
+        self.pool.run("b", "x = 2")
+        slow = self.pool._kernels["a"]
+        request = slow.request
+
+        def hung(command, timeout=30.):
+            time.sleep(2.)
+            return request(command, timeout)
+
+        with mock.patch.object(slow, "request", side_effect=hung):
+            stats = threading.Thread(target=self.pool.calculator_stats)
+            stats.start()
+            time.sleep(0.2)
+            start = time.time()
+            self.assertEqual(self.pool.run("b", "print(x)"), "2\n")
+            self.pool.release("b")
+            self.assertLess(time.time() - start, 1.5)
+            stats.join()
+        self.assertEqual(self.pool.stats()["spare"], 1)
+        self.assertEqual(self.pool.run("a", "print(x)"), "1\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
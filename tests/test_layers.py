@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for surface-layer detection and bottom-layer constraints."""
+
+import unittest
+
+from ase.build import add_adsorbate, fcc111
+
+from src.tools.layers import detect_layers, fix_bottom
+
+
+class TestLayers(unittest.TestCase):
+    """Test layer detection on centred, shifted and wrapped slabs."""
+
+    def setUp(self):
+        """Build a four-layer Cu(111) slab with 4 atoms per layer."""
+        self.slab = fcc111("Cu", (2, 2, 4), vacuum=8.)
+
+    def test_centred_slab(self):
+        """Four layers are found and the default fixes the bottom two."""
+        layers = detect_layers(self.slab)
+        self.assertEqual(layers.n_layers, 4)
+        self.assertEqual(len(fix_bottom(self.slab).index), 8)
+        self.assertEqual(len(fix_bottom(self.slab, n_layers=1).index), 4)
+        self.assertEqual(len(fix_bottom(self.slab, depth=3., n_slab=len(self.slab)).index), 8)
+
+    def test_wrapped_slab(self):
+        """A slab crossing the periodic z boundary fixes the same atoms as the unwrapped one, once n_slab is known."""
+        wrapped = self.slab.copy()
+        wrapped.pbc = True
+        wrapped.positions[:, 2] += 15.
+        wrapped.wrap()
+        self.assertEqual(sorted(fix_bottom(wrapped, n_slab=len(wrapped)).index), sorted(fix_bottom(self.slab).index))
+
+    def test_adsorbate_never_fixed(self):
+        """Atoms after n_slab are not part of any layer."""
+        slab = self.slab.copy()
+        slab.info["n_slab"] = len(slab) - 4
+        mask = detect_layers(slab).bottom(10)
+        self.assertFalse(mask[-4:].any())
+
+    def test_adsorbate_without_n_slab(self):
+        """Without n_slab the default falls back to the half-cell rule and a depth is refused, instead of counting the
+        adsorbate as the top layer."""
+        ads_slab = self.slab.copy()
+        add_adsorbate(ads_slab, "C", 1.9, "ontop")
+        add_adsorbate(ads_slab, "O", 3.05, "ontop")
+        expected = sorted(fix_bottom(self.slab).index)
+        self.assertEqual(sorted(fix_bottom(ads_slab).index), expected)
+        with self.assertRaises(ValueError):
+            fix_bottom(ads_slab, depth=3.)
+        ads_slab.info["n_slab"] = len(self.slab)
+        self.assertEqual(sorted(fix_bottom(ads_slab).index), expected)
+        self.assertEqual(sorted(fix_bottom(ads_slab, depth=3.).index), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for lazy module loading of the agent."""
+
+import json
+import subprocess
+import sys
+import unittest
+
+from src.agent.lazy import LazyModule
+
+
+class TestLazy(unittest.TestCase):
+    """Test lazy modules and the deferred imports of the agent module."""
+
+    def test_lazy_module(self):
+        """A lazy module imports the real one on first attribute access."""
+        module = LazyModule("colorsys")
+        self.assertIn("not loaded yet", repr(module))
+        self.assertEqual(module.rgb_to_hsv(1., 0., 0.), (0., 1., 1.))
+        self.assertIn("loaded", repr(module))
+        self.assertIn("hls_to_rgb", dir(module))
+
+    def test_agent_import_defers_heavy_modules(self):
+        """Importing the agent does not import torch, mace, sklearn, autoadsorbate or the LLM client."""
+        deferred = ["torch", "mace", "sklearn", "autoadsorbate", "langchain_openai"]
+        code = f"import sys, json; import src.agent.agent; print(json.dumps([m for m in {deferred!r} if m in sys.modules]))"
+        proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(json.loads(proc.stdout.strip().splitlines()[-1]), [])
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the LLM response cache and session record/replay."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from src.agent.llm_cache import ReplayMiss, cached_model, replay_context, substitutions
+
+RANDOM_CELL = "```python\nimport random\nprint(random.random())\n```"
+
+
+class TestLLMCache(unittest.TestCase):
+    """Test cache hits, placeholders and replay without a model."""
+
+    def setUp(self):
+        """Create a temporary cache directory and a scripted chat model."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fake = FakeListChatModel(responses=["first answer", "second answer"])
+
+    def tearDown(self):
+        """Remove the cache directory."""
+        self.tmp.cleanup()
+
+    def test_cache_hit(self):
+        """An identical history is answered from the cache without calling the model again."""
+        llm = cached_model(self.fake, "cache", cache_dir=self.tmp.name)
+        self.assertEqual(llm.invoke([("user", "relax CO on Cu")]).content, "first answer")
+        self.assertEqual(llm.invoke([("user", "relax CO on Cu  ")]).content, "first answer")
+        self.assertEqual(self.fake.i, 1)
+        self.assertEqual(llm.invoke([("user", "relax CO on Pt")]).content, "second answer")
+
+    def test_substitutions(self):
+        """Volatile paths are cached as placeholders and filled in with the current values."""
+        llm = cached_model(FakeListChatModel(responses=["read('/tmp/a.xyz')"]), "cache", cache_dir=self.tmp.name)
+        with substitutions({"/tmp/a.xyz": "<slab_path>"}):
+            llm.invoke([("user", "slab at /tmp/a.xyz")])
+        with substitutions({"/tmp/b.xyz": "<slab_path>"}):
+            self.assertEqual(llm.invoke([("user", "slab at /tmp/b.xyz")]).content, "read('/tmp/b.xyz')")
+
+    def test_record_replay(self):
+        """A recorded session replays step by step without a model, even if the cell outputs changed."""
+        recorder = cached_model(self.fake, "record", cache_dir=self.tmp.name)
+        first = recorder.invoke([("user", "task")])
+        recorder.invoke([("user", "task"), first, ("user", "output 1")])
+
+        replay = cached_model(None, "replay", cache_dir=self.tmp.name)
+        self.assertEqual(replay.invoke([("user", "task")]).content, "first answer")
+        self.assertEqual(replay.invoke([("user", "task"), first, ("user", "output 2")]).content, "second answer")
+        self.assertEqual(replay.recordings.diverged, 1)
+        with self.assertRaises(ReplayMiss):
+            replay.invoke([("user", "another task")])
+
+    def test_replay_cells_reuse(self):
+        """Replayed sessions get the recorded outputs of their own cells, even when another session ran the same code."""
+        from src.agent.agent import get_agent_executor
+
+        record_dir = os.path.join(self.tmp.name, "sessions")
+        recorded = {}
+        with mock.patch.dict(os.environ, {"ADSKRK_LLM_CACHE_DIR": self.tmp.name}):
+            for task in ("CO on Cu", "H on Pt"):
+                model = FakeListChatModel(responses=[RANDOM_CELL, "done"])
+                graph = get_agent_executor(model=model, tools=[], llm_cache="record", record_dir=record_dir)
+                recorded[task] = graph.invoke({"messages": [("user", task)]})["messages"][2].content
+            self.assertNotEqual(recorded["CO on Cu"], recorded["H on Pt"])
+
+            graph = get_agent_executor(tools=[], llm_cache="replay", record_dir=record_dir, replay_cells="reuse")
+            for task in ("H on Pt", "CO on Cu", "H on Pt"):
+                messages = [("user", task)]
+                state = graph.invoke({"messages": messages, "context": replay_context(messages)})
+                self.assertEqual(state["messages"][2].content, recorded[task])
+                self.assertEqual(state["messages"][-1].content, "done")
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for streaming MD frames and their adsorbate observables."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from ase.build import add_adsorbate, fcc111
+from ase.calculators.emt import EMT
+from ase.constraints import FixAtoms
+from ase.md.velocitydistribution import MaxwellBoltzmannDistribution
+
+from src.tools import cache, tools
+from src.tools.md import MDStream, adsorbate_observables, langevin_frames
+from src.tools.observers import ObserverSet
+from src.tools.trajstore import TrajectoryStore
+
+
+class _StopAt:
+    """Observer firing at a given MD step."""
+
+    reason = "desorbed"
+
+    def __init__(self, step: int):
+        self.step = step
+
+    def __call__(self, atoms, step):
+        if step == self.step:
+            return {"step": step}
+
+
+class TestMD(unittest.TestCase):
+    """Run short EMT Langevin trajectories of CO on Cu(111)."""
+
+    def setUp(self):
+        """Build CO on top of Cu(111) with thermal velocities and a temporary directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.atoms = fcc111("Cu", (2, 2, 3), vacuum=6.)
+        self.n_slab = len(self.atoms)
+        add_adsorbate(self.atoms, "C", 1.9, "ontop")
+        add_adsorbate(self.atoms, "O", 3.05, "ontop")
+        self.atoms.constraints = [FixAtoms(indices=[a.index for a in self.atoms if a.tag >= 2])]
+        self.atoms.calc = EMT()
+        MaxwellBoltzmannDistribution(self.atoms, temperature_K=300, rng=np.random.default_rng(0))
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmp.cleanup()
+
+    def test_langevin_frames(self):
+        """Every stride-th step is yielded with its energy and stored with its momenta."""
+        path = os.path.join(self.tmp.name, "md")
+        frames = list(langevin_frames(self.atoms, steps=20, temperature_K=300, stride=5, store_path=path))
+        self.assertEqual([f.info["md_step"] for f in frames], [0, 5, 10, 15, 20])
+        np.testing.assert_array_equal(frames[-1].positions, self.atoms.positions)
+        self.assertAlmostEqual(frames[-1].get_potential_energy(), self.atoms.get_potential_energy())
+
+        store = TrajectoryStore(path)
+        self.assertEqual(len(store), 5)
+        np.testing.assert_allclose(store[-1].positions, frames[-1].positions)
+        np.testing.assert_allclose(store[-1].get_momenta(), self.atoms.get_momenta())
+
+    def test_observer_stop(self):
+        """A firing observer ends the run on the triggering step, also between two strides."""
+        observers = ObserverSet([_StopAt(7)])
+        frames = list(langevin_frames(self.atoms, steps=20, temperature_K=300, stride=5, observers=observers))
+        self.assertEqual([f.info["md_step"] for f in frames], [0, 5, 7])
+        self.assertEqual(observers.report("completed"), {"reason": "desorbed", "step": 7, "details": {"step": 7}})
+
+    def test_stream(self):
+        """The stream records one observable row per frame, calls on_finish once and summarises the run."""
+        finished = []
+        frames = langevin_frames(self.atoms, steps=10, temperature_K=300, stride=2)
+        stream = MDStream(frames, n_slab=self.n_slab, stride=2, on_finish=lambda: finished.append(True))
+        self.assertIsNone(stream.stop["reason"])
+        for frame in stream:
+            row = stream.observables.iloc[-1]
+            self.assertEqual(row["md_step"], frame.info["md_step"])
+            self.assertAlmostEqual(row["binding_distance"], adsorbate_observables(frame, self.n_slab)["binding_distance"])
+        self.assertEqual(finished, [True])
+        self.assertEqual(list(stream.observables["md_step"]), [0, 2, 4, 6, 8, 10])
+
+        summary = stream.summary()
+        self.assertEqual(summary["n_frames"], 6)
+        self.assertEqual(summary["stop_reason"], "completed")
+        self.assertFalse(summary["desorbed"])
+        self.assertIsNone(summary["first_desorbed_step"])
+        self.assertLess(summary["final_binding_distance"], 3.)
+
+    def test_md_run_atoms_stream(self):
+        """The tool streams every stride-th frame with its observables, stores them in the run folder,
+        and a cache hit streams the same frames again."""
+        self.atoms.info["n_slab"] = self.n_slab
+        result_cache = cache.ResultCache(path=os.path.join(self.tmp.name, "cache"))
+        runs = []
+        with mock.patch.object(tools, "TOOLS_MODEL", "emt"), mock.patch.object(cache, "_result_cache", result_cache):
+            for _ in range(2):
+                md = tools.md_run_atoms(self.atoms.copy(), steps=20, stride=5, output_dir=self.tmp.name, stream=True)
+                runs.append((md, [frame.positions.copy() for frame in md]))
+        (first, frames), (second, replayed) = runs
+        self.assertEqual(list(first.observables["md_step"]), [0, 5, 10, 15, 20])
+        self.assertEqual(first.summary()["stop_reason"], "completed")
+        self.assertFalse(first.summary()["desorbed"])
+        self.assertEqual(len(TrajectoryStore(first.trajectory)), 5)
+        self.assertNotEqual(first.trajectory, second.trajectory)
+        for a, b in zip(frames, replayed):
+            np.testing.assert_array_equal(a, b)
+        self.assertTrue(first.observables.equals(second.observables))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the skin neighbor list and its MACE calculator wrapper."""
+
+import unittest
+
+import numpy as np
+from ase.build import add_adsorbate, fcc111
+from ase.calculators.emt import EMT
+from ase.constraints import FixAtoms
+
+from src.tools.batch import fixed_mask
+from src.tools.neighbors import SkinNeighborCalculator, VerletList, with_neighbor_skin
+
+
+def _tiny_mace(r_max: float = 4.0):
+    """MACECalculator around a small randomly initialised MACE model, enough to compare graphs."""
+    import torch
+    from mace import modules
+    from mace.calculators import MACECalculator
+    from e3nn import o3
+
+    torch.manual_seed(0)
+    model = modules.MACE(
+        r_max=r_max, num_bessel=4, num_polynomial_cutoff=5, max_ell=2,
+        interaction_cls=modules.interaction_classes["RealAgnosticResidualInteractionBlock"],
+        interaction_cls_first=modules.interaction_classes["RealAgnosticInteractionBlock"],
+        num_interactions=2, num_elements=3, hidden_irreps=o3.Irreps("8x0e+8x1o"), MLP_irreps=o3.Irreps("8x0e"),
+        atomic_energies=np.zeros(3), avg_num_neighbors=8., atomic_numbers=[6, 8, 29], correlation=2,
+        gate=torch.nn.functional.silu,
+    )
+    return MACECalculator(models=model, device="cpu", default_dtype="float64")
+
+
+class TestSkinNeighbors(unittest.TestCase):
+    """Test pair reuse and rebuilds on a Cu slab with CO and a fixed bottom half."""
+
+    def setUp(self):
+        """Build CO on Cu(111) with its two bottom layers fixed."""
+        self.atoms = fcc111("Cu", (3, 3, 4), vacuum=6.)
+        add_adsorbate(self.atoms, "C", 1.8, "ontop")
+        add_adsorbate(self.atoms, "O", 2.95, "ontop")
+        self.atoms.constraints = [FixAtoms(indices=[a.index for a in self.atoms if a.tag >= 3])]
+
+    @staticmethod
+    def _pair_set(edge_index, unit_shifts) -> set:
+        return {(i, j, *s) for (i, j), s in zip(edge_index.T.tolist(), np.rint(unit_shifts).astype(int).tolist())}
+
+    def test_pairs(self):
+        """Within half the skin the candidates are reused and still give exactly the pairs of a fresh list."""
+        from mace.data.neighborhood import get_neighborhood
+
+        neighbors = VerletList(cutoff=4.0, skin=1.0)
+        neighbors.pairs(self.atoms)
+        moved = self.atoms.copy()
+        free = ~fixed_mask(moved)
+        moved.positions[free] += np.random.default_rng(0).uniform(-0.25, 0.25, (free.sum(), 3))
+        edge_index, _, unit_shifts = neighbors.pairs(moved)
+        self.assertEqual(neighbors.rebuilds, 1)
+        fresh, _, fresh_shifts, _ = get_neighborhood(moved.positions, 4.0, tuple(bool(p) for p in moved.pbc),
+                                                     moved.cell.array.copy())
+        self.assertEqual(self._pair_set(edge_index, unit_shifts), self._pair_set(fresh, fresh_shifts))
+
+        moved.positions[-1, 2] += 1.
+        neighbors.pairs(moved)
+        self.assertEqual(neighbors.rebuilds, 2)
+        moved.positions[0, 2] += 1e-6  # fixed atom
+        neighbors.pairs(moved)
+        self.assertEqual(neighbors.rebuilds, 3)
+
+    def test_wrapper(self):
+        """The wrapper reproduces the energy and forces of the MACE calculator; other calculators are not wrapped."""
+        emt = EMT()
+        self.assertIs(with_neighbor_skin(emt, skin=1.0), emt)
+        calculator = _tiny_mace()
+        self.assertIs(with_neighbor_skin(calculator, skin=0.), calculator)
+        wrapped = with_neighbor_skin(calculator, skin=1.0)
+        self.assertIsInstance(wrapped, SkinNeighborCalculator)
+
+        atoms = self.atoms.copy()
+        for _ in range(4):
+            atoms.positions[-2:] += 0.1
+            expected = atoms.copy()
+            expected.calc = calculator
+            atoms.calc = wrapped
+            self.assertAlmostEqual(atoms.get_potential_energy(), expected.get_potential_energy(), places=10)
+            np.testing.assert_allclose(atoms.get_forces(), expected.get_forces(), atol=1e-10)
+        self.assertEqual(wrapped.rebuilds, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
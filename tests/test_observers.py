@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the early-termination observers."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from ase.build import add_adsorbate, fcc111
+from ase.calculators.emt import EMT
+from ase.calculators.singlepoint import SinglePointCalculator
+from ase.constraints import FixAtoms
+from ase.optimize import BFGS
+
+from src.tools import cache, tools
+from src.tools.observers import (DesorptionObserver, DissociationObserver, DivergenceObserver, EnergyStallObserver,
+                                 ObserverSet, default_observers, run_observed)
+
+
+def _with_results(atoms, energy: float, fmax: float):
+    """Copy of `atoms` with a given energy and largest force."""
+    frame = atoms.copy()
+    forces = np.zeros((len(frame), 3))
+    forces[-1, 2] = fmax
+    frame.calc = SinglePointCalculator(frame, energy=energy, forces=forces)
+    return frame
+
+
+class TestObservers(unittest.TestCase):
+    """Each observer fires on a constructed failing trajectory and stays silent on a converging relaxation."""
+
+    def setUp(self):
+        """Build CO on top of Cu(111) with the two bottom layers fixed."""
+        self.atoms = fcc111("Cu", (2, 2, 3), vacuum=6.)
+        self.n_slab = len(self.atoms)
+        add_adsorbate(self.atoms, "C", 1.9, "ontop")
+        add_adsorbate(self.atoms, "O", 3.05, "ontop")
+        self.atoms.constraints = [FixAtoms(indices=[a.index for a in self.atoms if a.tag >= 2])]
+        self.atoms.info["n_slab"] = self.n_slab
+
+    def test_desorption(self):
+        """The adsorbate lifted step by step is reported once the binding atom is 3 A away from the slab."""
+        observer = DesorptionObserver(self.atoms, self.n_slab, max_distance=3.0)
+        frame = self.atoms.copy()
+        fired = []
+        for step in range(10):
+            frame.positions[self.n_slab:, 2] += 0.2
+            fired.append(observer(frame, step) is not None)
+        self.assertEqual(fired, [False] * 5 + [True] * 5)
+
+    def test_dissociation(self):
+        """Stretching the C-O bond past 1.6 x the covalent radii sum breaks it."""
+        observer = DissociationObserver(self.atoms, self.n_slab)
+        frame = self.atoms.copy()
+        frame.positions[-1, 2] += 0.5
+        self.assertIsNone(observer(frame, 0))
+        frame.positions[-1, 2] += 0.8
+        self.assertEqual(observer(frame, 1), {"broken_bonds": [(self.n_slab, self.n_slab + 1)]})
+
+    def test_divergence(self):
+        """Large or non-finite forces and energies are reported."""
+        observer = DivergenceObserver(max_force=50.)
+        self.assertIsNone(observer(_with_results(self.atoms, -1., 10.), 0))
+        self.assertIsNotNone(observer(_with_results(self.atoms, -1., 80.), 1))
+        self.assertIsNotNone(observer(_with_results(self.atoms, np.nan, 1.), 2))
+
+    def test_stall(self):
+        """A flat energy only counts as stalled when the forces stopped decreasing as well."""
+        observer = EnergyStallObserver(window=5, tol=1e-4)
+        fired = [observer(_with_results(self.atoms, -1., 0.5), step) is not None for step in range(8)]
+        self.assertEqual(fired, [False] * 5 + [True] * 3)
+
+        observer = EnergyStallObserver(window=5, tol=1e-4)
+        creeping = [observer(_with_results(self.atoms, -1. - 1e-6 * step, 0.5 * 0.9 ** step), step) for step in range(20)]
+        self.assertEqual(creeping, [None] * 20)
+
+    def test_converging_relaxation(self):
+        """A regular relaxation triggers none of the default observers."""
+        atoms = self.atoms.copy()
+        atoms.calc = EMT()
+        observers = default_observers(atoms, kind="relax", stall_window=5)
+        self.assertEqual(len(observers.observers), 4)
+        stop = run_observed(BFGS(atoms, logfile=None), atoms, observers, fmax=0.05, steps=200)
+        self.assertEqual(stop, {"reason": "converged", "step": None, "details": {}})
+
+    def test_observer_set(self):
+        """The first firing observer ends the run and its reason is reported with the step."""
+        atoms = self.atoms.copy()
+        atoms.calc = EMT()
+        observers = ObserverSet([DivergenceObserver(max_force=0.)])
+        stop = run_observed(BFGS(atoms, logfile=None), atoms, observers, fmax=0.05, steps=200)
+        self.assertEqual(stop["reason"], "diverged")
+        self.assertEqual(stop["step"], 0)
+        self.assertEqual(ObserverSet().report("completed")["reason"], "completed")
+
+    def test_relax_atoms_early_stop(self):
+        """relax_atoms reports why an observer stopped it and does not cache the run; a full run is cached."""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        result_cache = cache.ResultCache(path=os.path.join(tmp.name, "cache"))
+
+        def always(atoms, kind="relax"):
+            return ObserverSet([DivergenceObserver(max_force=0.)])
+
+        with mock.patch.object(tools, "TOOLS_MODEL", "emt"), mock.patch.object(cache, "_result_cache", result_cache), \
+                mock.patch.object(tools, "default_observers", side_effect=always):
+            stopped = tools.relax_atoms(self.atoms, output_dir=tmp.name)
+            self.assertEqual(stopped.info["stop_reason"], "diverged")
+            self.assertIn("fmax", stopped.info["stop_details"])
+            self.assertEqual(result_cache.stats()["entries"], 0)
+
+            relaxed = tools.relax_atoms(self.atoms, output_dir=tmp.name, early_stop=False)
+            self.assertEqual(relaxed.info["stop_reason"], "converged")
+            self.assertEqual(result_cache.stats()["entries"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
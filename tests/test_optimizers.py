@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the selectable relax_atoms optimizers."""
+
+import unittest
+
+import numpy as np
+from ase.build import add_adsorbate, fcc111
+from ase.calculators.emt import EMT
+from ase.constraints import FixAtoms
+from ase.optimize import BFGS
+
+from src.tools.optimizers import OPTIMIZERS, free_atoms, make_optimizer
+
+
+class TestOptimizers(unittest.TestCase):
+    """Relax O on an EMT Cu(111) slab with the optimizers restricted to the free atoms."""
+
+    def setUp(self):
+        """Build O in the fcc hollow of Cu(111) with the two bottom layers fixed and the free atoms displaced."""
+        self.atoms = fcc111("Cu", (2, 2, 3), vacuum=6.)
+        add_adsorbate(self.atoms, "O", 1.5, "fcc")
+        self.fixed = np.array([a.tag >= 2 for a in self.atoms])
+        self.atoms.constraints = [FixAtoms(mask=self.fixed)]
+        self.atoms.positions[~self.fixed] += np.random.default_rng(0).normal(0., 0.05, ((~self.fixed).sum(), 3))
+
+    def _relax(self, atoms, dyn):
+        atoms.calc = EMT()
+        self.assertTrue(dyn.run(fmax=0.01, steps=500))
+        return atoms
+
+    def test_free_atoms(self):
+        """The filter exposes only the free atoms; a structure without fixed atoms is returned unchanged."""
+        target = free_atoms(self.atoms)
+        self.assertEqual(len(target), (~self.fixed).sum())
+        bare = self.atoms.copy()
+        bare.constraints = []
+        self.assertIs(free_atoms(bare), bare)
+
+    def test_same_minimum_as_bfgs(self):
+        """Every optimizer moves only the free atoms and ends in the minimum that BFGS on all atoms reaches."""
+        reference = self.atoms.copy()
+        reference.calc = EMT()
+        BFGS(reference, logfile=None).run(fmax=0.01, steps=500)
+
+        for name in OPTIMIZERS:
+            with self.subTest(optimizer=name):
+                atoms = self.atoms.copy()
+                relaxed = self._relax(atoms, make_optimizer(name, atoms))
+                np.testing.assert_array_equal(relaxed.positions[self.fixed], self.atoms.positions[self.fixed])
+                self.assertGreater(np.abs(relaxed.positions[~self.fixed] - self.atoms.positions[~self.fixed]).max(), 0.01)
+                np.testing.assert_allclose(relaxed.positions, reference.positions, atol=0.05)
+                self.assertAlmostEqual(relaxed.get_potential_energy(), reference.get_potential_energy(), places=3)
+
+    def test_preconditioned_large_slab(self):
+        """With over 100 free atoms PreconLBFGS really preconditions, keeps the fixed atoms and agrees with BFGS."""
+        atoms = fcc111("Cu", (8, 8, 4), vacuum=6.)
+        add_adsorbate(atoms, "O", 1.5, "fcc")
+        fixed = np.array([a.tag >= 3 for a in atoms])
+        atoms.constraints = [FixAtoms(mask=fixed)]
+        atoms.positions[~fixed] += np.random.default_rng(0).normal(0., 0.03, ((~fixed).sum(), 3))
+        self.assertGreaterEqual((~fixed).sum(), 100)
+
+        reference = atoms.copy()
+        reference.calc = EMT()
+        BFGS(free_atoms(reference), logfile=None).run(fmax=0.01, steps=500)
+        relaxed = atoms.copy()
+        dyn = make_optimizer("PreconLBFGS", relaxed)
+        self._relax(relaxed, dyn)
+        self.assertIsNotNone(dyn.precon)
+        np.testing.assert_array_equal(relaxed.positions[fixed], atoms.positions[fixed])
+        self.assertAlmostEqual(relaxed.get_potential_energy(), reference.get_potential_energy(), places=3)
+
+    def test_unknown_optimizer(self):
+        """Unknown names raise a ValueError listing the choices."""
+        with self.assertRaises(ValueError):
+            make_optimizer("Newton", self.atoms)
+
+
+if __name__ == "__main__":
+    unittest.main()
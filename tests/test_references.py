@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the persistent reference-energy table."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from ase.build import fcc111
+from ase.calculators.emt import EMT
+from ase.constraints import FixAtoms
+
+from src.tools import references
+from src.tools.references import ReferenceTable, gas_phase_molecule, relax_reference
+
+
+class TestReferenceTable(unittest.TestCase):
+    """Test keys, compute-once behaviour and gas-phase molecules."""
+
+    def setUp(self):
+        """Create a temporary table directory and a small slab."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.slab = fcc111("Cu", (2, 2, 2), vacuum=5.)
+
+    def tearDown(self):
+        """Remove the temporary table directory."""
+        self.tmp.cleanup()
+
+    def test_keys(self):
+        """Slab keys depend on the fixed atoms and the calculator; molecule keys on the canonical SMILES."""
+        key = ReferenceTable.slab_key(self.slab, "emt", fmax=0.01)
+        fixed = self.slab.copy()
+        fixed.constraints = [FixAtoms(indices=[0, 1, 2, 3])]
+        self.assertNotEqual(key, ReferenceTable.slab_key(fixed, "emt", fmax=0.01))
+        self.assertNotEqual(key, ReferenceTable.slab_key(self.slab, "mace_mp/medium/float32/dispersion=False", fmax=0.01))
+        self.assertEqual(ReferenceTable.molecule_key("ClC(C)O", "emt"), ReferenceTable.molecule_key("ClC(O)C", "emt"))
+        self.assertNotEqual(ReferenceTable.molecule_key("Cl[C-]=O", "emt"), ReferenceTable.molecule_key("ClC", "emt"))
+
+    def test_compute_once(self):
+        """A reference is computed on the first request only, also through another table instance."""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {"energy": -1.5, "steps": 3}
+
+        path = os.path.join(self.tmp.name, "refs")
+        first = ReferenceTable(path).get_or_compute("k", compute, kind="slab", label="Cu8", calculator="emt")
+        second = ReferenceTable(path).get_or_compute("k", compute, kind="slab", label="Cu8", calculator="emt")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(first["energy"], -1.5)
+        self.assertEqual(second["steps"], 3)
+        self.assertEqual([e["label"] for e in ReferenceTable(path).entries(kind="slab")], ["Cu8"])
+
+    def test_cut_short_not_stored(self):
+        """A reference whose relaxation an observer stopped is returned but computed again next time."""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {"energy": -1.5, "stop_reason": "stalled"}
+
+        table = ReferenceTable(os.path.join(self.tmp.name, "refs"))
+        self.assertEqual(table.get_or_compute("k", compute, kind="slab", label="Cu8", calculator="emt")["energy"], -1.5)
+        table.get_or_compute("k", compute, kind="slab", label="Cu8", calculator="emt")
+        self.assertEqual(len(calls), 2)
+        self.assertIsNone(table.get("k"))
+
+    def test_lock_without_fcntl(self):
+        """Without fcntl the per-key lock is an exclusively created file, removed afterwards."""
+        table = ReferenceTable(os.path.join(self.tmp.name, "refs"))
+        with mock.patch.object(references, "fcntl", None):
+            found = table.get_or_compute("k", lambda: {"energy": -1.}, kind="slab", label="Cu8", calculator="emt")
+        self.assertEqual(found["energy"], -1.)
+        self.assertEqual(os.listdir(os.path.join(table.path, "locks")), [])
+
+    def test_relax_reference(self):
+        """References are relaxed with the observers of `relax_atoms` and report how the relaxation ended."""
+        slab = self.slab.copy()
+        slab.constraints = [FixAtoms(indices=[0, 1, 2, 3])]
+        slab.positions[4:, 2] += 0.05
+        result = relax_reference(slab, EMT())
+        self.assertEqual(result["stop_reason"], "converged")
+        self.assertTrue(result["converged"])
+        self.assertEqual(relax_reference(slab, EMT(), steps=1, early_stop=False)["stop_reason"], "max_steps")
+
+    def test_gas_phase_molecule(self):
+        """The marker atom of the surrogate SMILES is removed."""
+        molecule = gas_phase_molecule("Cl[C-]=O")
+        self.assertEqual(molecule.get_chemical_formula(), "CO")
+        self.assertFalse(molecule.pbc.any())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for placement enumeration and adsorption screening."""
+
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+from ase.build import fcc111
+from ase.calculators.emt import EMT
+
+from src.tools import calculators, screening, tools
+from src.tools.screening import enumerate_placements, screen_adsorption, two_stage_relax
+from src.tools.tools import get_sites_from_atoms
+
+
+class _ShiftedEMT(EMT):
+    """EMT with every energy shifted by 100 eV, to tell which calculator produced an energy."""
+
+    def calculate(self, *args, **kwargs):
+        EMT.calculate(self, *args, **kwargs)
+        self.results["energy"] += 100.
+        self.results["free_energy"] += 100.
+
+
+class TestScreening(unittest.TestCase):
+    """Screen CO on a Cu(111) slab with EMT."""
+
+    def setUp(self):
+        """Build a 3x3 Cu(111) slab and run the tools with EMT."""
+        self.slab = fcc111("Cu", (3, 3, 3), vacuum=8.)
+        patcher = mock.patch.object(tools, "TOOLS_MODEL", "emt")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_enumerate_placements(self):
+        """One placement per unique site and height: rotations of linear CO and equivalent sites are duplicates."""
+        placements = enumerate_placements(self.slab, "Cl[C-]=O", rotations=(0., 120.), heights=(1.5, 2.0))
+        self.assertEqual(len(placements), 8)
+        self.assertEqual(sorted(placements["connectivity"].unique()), [1, 2, 3])
+        self.assertTrue((placements["rotation"] == 0.).all())
+        self.assertEqual(placements.groupby("site_index")["height"].apply(sorted).tolist(), [[1.5, 2.0]] * 4)
+        for atoms in placements["atoms"]:
+            self.assertEqual(atoms.info["n_slab"], len(self.slab))
+            self.assertEqual(atoms[len(self.slab):].get_chemical_formula(), "CO")
+
+        all_sites = get_sites_from_atoms(self.slab)
+        placements = enumerate_placements(self.slab, "Cl[C-]=O", sites=list(all_sites.index))
+        self.assertLess(len(placements), len(all_sites))
+        self.assertGreaterEqual(len(placements), 4)
+
+    def test_ranking(self):
+        """The table is sorted by relaxed energy and every row holds its own relaxed structure."""
+        table = screen_adsorption(self.slab, "Cl[C-]=O", heights=(2.0,), fmax=0.05, steps=200)
+        self.assertEqual(len(table), 4)
+        self.assertTrue(table["energy"].is_monotonic_increasing)
+        for _, row in table.iterrows():
+            self.assertAlmostEqual(row["energy"], row["atoms"].get_potential_energy())
+            self.assertTrue(row["converged"])
+            np.testing.assert_allclose(row["atoms"].positions[:len(self.slab) // 3], row["initial_atoms"].positions[:len(self.slab) // 3])
+
+    def test_two_stage(self):
+        """The top_k lowest stage 1 energies are refined, by default with the tools' model."""
+        loaders = {"emt_shifted": lambda *args: _ShiftedEMT()}
+        with mock.patch.dict(calculators.CALCULATOR_LOADERS, loaders), \
+                mock.patch.object(calculators, "CPU_ONLY_MODELS", {"emt", "emt_shifted"}), \
+                mock.patch.object(screening, "PRESCREEN_MODEL", "emt"), \
+                mock.patch.object(tools, "TOOLS_MODEL", "emt_shifted"):
+            candidates = list(enumerate_placements(self.slab, "Cl[C-]=O", heights=(2.0,))["atoms"])
+            table = two_stage_relax(candidates, top_k=2, fmax=0.05, steps=200)
+
+        self.assertTrue(table["stable"].all())
+        self.assertEqual(table["promoted"].sum(), 2)
+        self.assertEqual(sorted(table.index[table["promoted"]]), sorted(table["stage1_energy"].nsmallest(2).index))
+        self.assertTrue(table.loc[~table["promoted"], "energy"].isna().all())
+        for _, row in table[table["promoted"]].iterrows():
+            self.assertAlmostEqual(row["energy"], row["atoms"].get_potential_energy())
+            reference = row["atoms"].copy()
+            reference.calc = _ShiftedEMT()
+            self.assertAlmostEqual(row["energy"], reference.get_potential_energy())
+            self.assertGreater(row["energy"], row["stage1_energy"] + 90.)
+        self.assertEqual(table.attrs["report"]["n_promoted"], 2)
+
+    def test_parallel_matches_serial(self):
+        """Relaxing the placements in two worker processes gives the same table as relaxing them here."""
+        screening._shutdown_pool()
+        self.addCleanup(screening._shutdown_pool)
+        with mock.patch.dict(os.environ, {"ADSKRK_MODEL": "emt"}):
+            parallel = screen_adsorption(self.slab, "Cl[C-]=O", heights=(2.0,), fmax=0.05, steps=200, n_workers=2)
+        serial = screen_adsorption(self.slab, "Cl[C-]=O", heights=(2.0,), fmax=0.05, steps=200)
+        self.assertEqual(list(parallel["site_index"]), list(serial["site_index"]))
+        np.testing.assert_allclose(parallel["energy"], serial["energy"], atol=1e-8)
+        for a, b in zip(parallel["atoms"], serial["atoms"]):
+            np.testing.assert_allclose(a.positions, b.positions, atol=1e-8)
+
+    def test_worker_pool_reused(self):
+        """Screens share one worker pool, which is only replaced to add workers."""
+        self.addCleanup(screening._shutdown_pool)
+        pool = screening._worker_pool(2)
+        self.assertIs(screening._worker_pool(2), pool)
+        self.assertIs(screening._worker_pool(1), pool)
+        self.assertIsNot(screening._worker_pool(3), pool)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the columnar site index."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from ase.build import fcc111
+
+from src.tools.site_index import SiteIndex
+
+
+class TestSiteIndex(unittest.TestCase):
+    """Test conversion, persistence and queries of a small hand-made site table."""
+
+    def setUp(self):
+        """Build an index from three sites of different connectivity and composition."""
+        self.slab = fcc111("Cu", (2, 2, 2), vacuum=5.)
+        z = self.slab.positions[:, 2].max() + 1.
+        self.site_df = pd.DataFrame({
+            "coordinates": [np.array([0., 0., z]), np.array([1.3, 0., z]), np.array([2.5, 1.5, z])],
+            "connectivity": [1, 2, 3],
+            "topology": [[4], [4, 5], [4, 5, 6]],
+            "n_vector": [np.array([0., 0., 1.])] * 3,
+            "h_vector": [np.array([1., 0., 0.])] * 3,
+            "site_formula": [{"Cu": 1}, {"Cu": 1, "Ni": 1}, {"Cu": 3}],
+        })
+        self.index = SiteIndex.from_site_df(self.site_df, self.slab)
+
+    def test_roundtrip(self):
+        """Saving and loading keeps every column and the DataFrame layout."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "sites.npz")
+            self.index.save(path)
+            loaded = SiteIndex.load(path)
+        df = loaded.to_dataframe()
+        self.assertEqual(list(df.columns), list(self.site_df.columns))
+        self.assertEqual(list(df["topology"]), list(self.site_df["topology"]))
+        self.assertEqual(list(df["site_formula"]), list(self.site_df["site_formula"]))
+        np.testing.assert_allclose(np.stack(df["coordinates"].to_numpy()), np.stack(self.site_df["coordinates"].to_numpy()))
+
+    def test_queries(self):
+        """Connectivity, composition and distance filters select the expected rows."""
+        self.assertEqual(self.index.by_connectivity([2, 3]).tolist(), [1, 2])
+        self.assertEqual(self.index.by_formula({"Cu": 3}).tolist(), [2])
+        self.assertEqual(self.index.containing("Ni").tolist(), [1])
+        self.assertEqual(self.index.query(near=self.site_df["coordinates"][1], radius=1.5).tolist(), [1, 0])
+        self.assertEqual(self.index.site_dict(1)["topology"], [4, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the surrogate pre-ranking of placements."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from ase.build import add_adsorbate, fcc111
+from ase.calculators.emt import EMT
+
+from src.tools import cache, surrogate, tools, trajstore
+from src.tools.surrogate import FEATURES, SurrogateStore, describe, placement_descriptors, prerank, ranking_report
+
+
+class TestSurrogate(unittest.TestCase):
+    """Test descriptors, the training store and the ranking report with EMT."""
+
+    def setUp(self):
+        """Create a temporary store and CO placed at several heights on Cu(111)."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SurrogateStore(self.tmp.name)
+        slab = fcc111("Cu", (2, 2, 3), vacuum=6.)
+        self.slab = slab
+        self.candidates = []
+        for height in (1.2, 1.6, 2.0, 2.5, 3.0):
+            atoms = slab.copy()
+            add_adsorbate(atoms, "C", height, "ontop")
+            add_adsorbate(atoms, "O", height + 1.15, "ontop")
+            atoms.info["n_slab"] = len(slab)
+            self.candidates.append(atoms)
+
+    def tearDown(self):
+        """Remove the temporary store."""
+        self.tmp.cleanup()
+
+    def test_descriptors(self):
+        """Contacts and site composition follow the geometry of the binding atom."""
+        close = placement_descriptors(self.candidates[0])
+        far = placement_descriptors(self.candidates[-1])
+        self.assertAlmostEqual(close["binding_distance"], 1.2, places=5)
+        self.assertEqual(close["binding_coordination"], 1)
+        self.assertEqual(close["site_Cu"], 1)
+        self.assertEqual(far["binding_coordination"], 0)
+        self.assertEqual(list(describe(self.candidates, EMT()).columns), FEATURES + ["sp_energy"])
+
+    def test_prerank(self):
+        """Without training data placements are ranked by single-point energy; with enough examples the model is used."""
+        table = prerank(self.candidates, EMT(), "emt", keep_fraction=0.4, store=self.store)
+        self.assertEqual(table.attrs["scorer"], "single_point")
+        self.assertEqual(int(table["selected"].sum()), 2)
+        self.assertEqual(table.loc[table["sp_energy"].idxmin(), "prerank"], 1)
+
+        for i in range(surrogate.MIN_EXAMPLES):
+            features = dict(zip(FEATURES, np.random.default_rng(i).random(len(FEATURES))))
+            self.store.add(f"k{i}", "emt", features, sp_energy=1., relaxed_energy=0.5, fmax=0.01, optimizer="BFGS")
+        table = prerank(self.candidates, EMT(), "emt", keep_fraction=0.4, store=self.store)
+        self.assertEqual(table.attrs["scorer"], "model")
+        np.testing.assert_allclose(table["predicted_energy"], table["sp_energy"] - 0.5)
+        self.assertEqual(prerank(self.candidates, EMT(), "mace_mp/medium/float32/dispersion=False", store=self.store)
+                         .attrs["scorer"], "single_point")
+        self.assertEqual(prerank(self.candidates, EMT(), "emt", store=self.store, fmax=0.01, optimizer="BFGS").attrs["scorer"], "model")
+        self.assertEqual(prerank(self.candidates, EMT(), "emt", store=self.store, fmax=0.05, optimizer="FIRE").attrs["scorer"],
+                         "single_point")
+
+    def test_harvest(self):
+        """Cached relaxations become examples with their relax settings; no cache entry is opened twice."""
+        result_cache = cache.ResultCache(path=os.path.join(self.tmp.name, "cache"))
+        with mock.patch.object(tools, "TOOLS_MODEL", "emt"), mock.patch.object(cache, "_result_cache", result_cache):
+            tools.relax_atoms(self.candidates[2], output_dir=self.tmp.name)
+            tools.relax_atoms(self.slab, output_dir=self.tmp.name, optimizer="FIRE")
+        self.assertEqual(result_cache.stats()["entries"], 2)
+
+        self.assertEqual(self.store.harvest(result_cache), 1)
+        examples = self.store.examples("emt")
+        self.assertEqual((examples.loc[0, "fmax"], examples.loc[0, "optimizer"]), (0.01, "BFGS"))
+        with mock.patch.object(trajstore, "TrajectoryStore", side_effect=AssertionError("entry opened again")):
+            self.assertEqual(self.store.harvest(result_cache), 0)
+
+    def test_ranking_report(self):
+        """A perfect ranking has tau 1, full recall and no regret; a reversed one the opposite."""
+        perfect = ranking_report([1., 2., 3., 4.], [10., 20., 30., 40.], top_k=2)
+        self.assertEqual((perfect["kendall_tau"], perfect["top_k_recall"], perfect["regret"]), (1., 1., 0.))
+        reversed_ = ranking_report([4., 3., 2., 1.], [10., 20., 30., 40.], top_k=2)
+        self.assertEqual((reversed_["kendall_tau"], reversed_["top_k_recall"], reversed_["regret"]), (-1., 0., 30.))
+
+
+if __name__ == "__main__":
+    unittest.main()
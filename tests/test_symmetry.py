@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for symmetry-aware site and configuration deduplication."""
+
+import unittest
+
+import pandas as pd
+from ase import Atoms
+from ase.build import fcc111
+
+from src.tools.symmetry import ConfigurationIndex, site_equivalence_index
+
+
+class TestSymmetry(unittest.TestCase):
+    """Test equivalence of sites and placements on a periodic fcc(111) slab."""
+
+    def setUp(self):
+        """Build a 3x3 Cu(111) slab and its top sites."""
+        self.slab = fcc111("Cu", (3, 3, 3), vacuum=8.)
+        top = [atom.index for atom in self.slab if atom.tag == 1]
+        self.site_df = pd.DataFrame({
+            "coordinates": [self.slab.positions[i] + [0, 0, 2.] for i in top],
+            "connectivity": [1] * len(top),
+            "topology": [[i] for i in top],
+            "site_formula": [{"Cu": 1}] * len(top),
+        })
+
+    def test_top_sites_equivalent(self):
+        """All top sites of a clean periodic slab fall into one class."""
+        index = site_equivalence_index(self.slab, self.site_df)
+        self.assertEqual(index["equivalence_class"].nunique(), 1)
+        self.assertTrue((index["n_equivalent"] == len(self.site_df)).all())
+
+    def test_configuration_dedup(self):
+        """The same adsorbate translated onto another top site is a duplicate."""
+        index = ConfigurationIndex(len(self.slab))
+        for coordinates in self.site_df["coordinates"][:2]:
+            ads_slab = self.slab + Atoms("CO", positions=[coordinates, coordinates + [0, 0, 1.15]])
+            added = index.add(ads_slab)
+        self.assertFalse(added)
+        tilted = self.slab + Atoms("CO", positions=[coordinates, coordinates + [0.6, 0, 1.]])
+        self.assertTrue(index.add(tilted))
+        self.assertEqual(len(index), 2)
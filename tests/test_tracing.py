@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for tracing spans and their export."""
+
+import json
+import os
+import tempfile
+import unittest
+
+from src.tools.tracing import Tracer, load_spans, summary, to_chrome_trace
+
+
+class TestTracer(unittest.TestCase):
+    """Test span nesting, trace propagation and export."""
+
+    def setUp(self):
+        """Create a tracer writing to a temporary JSONL file."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "trace.jsonl")
+        self.tracer = Tracer(path=self.path)
+
+    def tearDown(self):
+        """Remove the trace file."""
+        self.tmp.cleanup()
+
+    def test_nesting(self):
+        """Inner spans get the outer span as parent and the trace id of the context."""
+        with self.tracer.trace("session") as trace_id:
+            with self.tracer.span("cell", "cell") as outer:
+                with self.tracer.span("relax_atoms") as inner:
+                    inner.annotate(steps=3)
+        inner_record, outer_record = self.tracer.get_spans(trace_id)
+        self.assertEqual(inner_record["parent"], outer.span_id)
+        self.assertIsNone(outer_record["parent"])
+        self.assertEqual(inner_record["attrs"], {"steps": 3})
+        self.assertEqual({inner_record["trace"], outer_record["trace"]}, {"session"})
+        self.assertGreaterEqual(outer_record["dur"], inner_record["dur"])
+
+    def test_error_recorded(self):
+        """A span whose body raises is recorded with the error and the exception propagates."""
+        with self.assertRaises(ValueError):
+            with self.tracer.span("get_fragment"):
+                raise ValueError("bad SMILES")
+        self.assertEqual(self.tracer.get_spans()[0]["error"], "ValueError: bad SMILES")
+
+    def test_remote_context(self):
+        """Spans recorded under `use_context` continue the trace and are handed back by `drain`."""
+        with self.tracer.trace("session"):
+            with self.tracer.span("cell", "cell"):
+                context = self.tracer.context()
+        worker = Tracer()
+        worker.forward_to_parent()
+        with worker.use_context(context):
+            with worker.span("md_run_atoms"):
+                pass
+        records = worker.drain()
+        self.assertEqual(records[0]["trace"], "session")
+        self.assertEqual(records[0]["parent"], context[1])
+        self.assertEqual(worker.drain(), [])
+
+    def test_export(self):
+        """The JSONL file, Chrome trace and summary agree with the recorded spans."""
+        for _ in range(2):
+            with self.tracer.span("relax_atoms"):
+                pass
+        records = load_spans(self.path)
+        self.assertEqual(len(records), 2)
+        events = json.loads(json.dumps(to_chrome_trace(records)))["traceEvents"]
+        self.assertEqual([e["ph"] for e in events], ["X", "X"])
+        table = summary(records)
+        self.assertEqual(table.loc[0, "calls"], 2)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the per-run trajectory store."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from ase.build import fcc111
+from ase.calculators.emt import EMT
+from ase.constraints import FixAtoms
+from ase.io import read
+
+from src.tools.trajstore import TrajectoryStore, TrajectoryWriter, from_frames, run_dir
+
+
+class TestTrajectoryStore(unittest.TestCase):
+    """Test writing, chunked reading and exporting of stored frames."""
+
+    def setUp(self):
+        """Create a temporary directory and seven displaced frames of a small slab."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.atoms = fcc111("Cu", (2, 2, 2), vacuum=5.)
+        self.atoms.constraints = [FixAtoms(indices=[0, 1, 2, 3])]
+        self.atoms.info["n_slab"] = 8
+        self.atoms.calc = EMT()
+        self.positions = []
+        for i in range(7):
+            self.atoms.positions[-1, 2] += 0.01 * i
+            self.positions.append(self.atoms.positions.copy())
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmp.cleanup()
+
+    def _store(self, compress: bool = False) -> TrajectoryStore:
+        path = os.path.join(self.tmp.name, "store")
+        with TrajectoryWriter(path, self.atoms, chunk_size=3, compress=compress) as writer:
+            for i, positions in enumerate(self.positions):
+                self.atoms.positions = positions
+                writer.write(self.atoms, step=i * 10)
+        return TrajectoryStore(path)
+
+    def test_roundtrip(self):
+        """Frames come back with positions, energy, forces, constraints, info and per-frame values, across chunks."""
+        for compress in (False, True):
+            store = self._store(compress=compress)
+            self.assertEqual(len(store), 7)
+            self.assertEqual(store.meta["chunks"], [3, 3, 1])
+            frame = store[4]
+            np.testing.assert_allclose(frame.positions, self.positions[4], atol=1e-5)
+            self.atoms.positions = self.positions[4]
+            self.assertAlmostEqual(frame.get_potential_energy(), self.atoms.get_potential_energy())
+            np.testing.assert_allclose(frame.get_forces(), self.atoms.get_forces(), atol=1e-5)
+            self.assertEqual(frame.constraints[0].index.tolist(), [0, 1, 2, 3])
+            self.assertEqual(frame.info["n_slab"], 8)
+            self.assertEqual(frame.info["step"], 40)
+            self.assertEqual(len(list(store)), 7)
+
+    def test_random_access(self):
+        """Slices, negative and unordered indices read the right frames."""
+        store = self._store()
+        self.assertEqual([f.info["step"] for f in store[::3]], [0, 30, 60])
+        self.assertEqual(store[-1].info["step"], 60)
+        self.assertEqual(store.array("step", [5, 1, 4]).tolist(), [50, 10, 40])
+        self.assertEqual(store.array("positions", "2:5").shape, (3, len(self.atoms), 3))
+        self.assertEqual(store.array("positions", 1).dtype, np.float64)
+        self.assertEqual(store.array("forces", 1).dtype, np.float32)
+        with self.assertRaises(IndexError):
+            store[7]
+
+    def test_export(self):
+        """Frames are exported to .xyz and .traj on demand, and stored back from any ASE trajectory."""
+        store = self._store()
+        xyz = os.path.join(self.tmp.name, "frames.xyz")
+        store.to_xyz(xyz, index="::2")
+        self.assertEqual(len(read(xyz, index=":")), 4)
+        traj = os.path.join(self.tmp.name, "frames.traj")
+        store.to_traj(traj)
+        copy = from_frames(os.path.join(self.tmp.name, "copy"), read(traj, index=":"), compress=True)
+        self.assertEqual(copy.fields, ["positions", "forces", "energy"])
+        np.testing.assert_allclose(copy.array("energy"), store.array("energy"))
+
+    def test_run_dir(self):
+        """Every run gets its own directory."""
+        self.assertNotEqual(run_dir(self.tmp.name, "relax"), run_dir(self.tmp.name, "relax"))
+
+
+if __name__ == "__main__":
+    unittest.main()